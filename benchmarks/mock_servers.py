@@ -0,0 +1,299 @@
+"""
+Local stand-ins for the NBP, Binance, Etherscan and blockchain.info APIs.
+
+A single threaded HTTP server answers under one prefix per API with synthetic but consistent
+data, after an optional latency, and answers 429 with Retry-After when a client exceeds the
+configured rate. Every answer carries an ETag, and a matching If-None-Match gets a 304.
+Point the application at it through the KRYPTOROZLICZATOR_*_API_URL environment variables
+(see MockApiServer.environment) before importing kryptorozliczator.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from benchmarks import synthetic
+
+HTTP_OK = 200
+HTTP_NOT_MODIFIED = 304
+HTTP_NOT_FOUND = 404
+HTTP_TOO_MANY_REQUESTS = 429
+DAY_MS = 24 * 60 * 60 * 1000
+KLINE_INTERVALS_MS = {"1m": 60 * 1000, "1h": 60 * 60 * 1000, "1d": DAY_MS}
+
+RATE_WINDOW_SECONDS = 1.0
+
+API_PREFIXES = ("nbp", "binance", "etherscan", "blockchain")
+NBP_RANGE_PATTERN = re.compile(r"^/rates/A/(\w+)/(\d{4}-\d{2}-\d{2})/(\d{4}-\d{2}-\d{2})/?$")
+NBP_DAY_PATTERN = re.compile(r"^/rates/A/(\w+)/(\d{4}-\d{2}-\d{2})/?$")
+
+
+class WindowRateLimit:
+    def __init__(self, requests_per_second: float | None):
+        """
+        Server-side limit: at most `requests_per_second` requests in any one-second window.
+        """
+        self.requests_per_second = requests_per_second
+        self._times: list[float] = []
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if not self.requests_per_second:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._times = [t for t in self._times if now - t < RATE_WINDOW_SECONDS]
+            if len(self._times) >= self.requests_per_second:
+                return False
+            self._times.append(now)
+            return True
+
+
+@dataclass
+class MockApiConfig:
+    """
+    Behaviour of the stand-in servers.
+
+    Attributes:
+        year: Year the synthetic chain transactions fall into
+        latency: Seconds every response is delayed by
+        rate_limits: Requests per second allowed per API prefix ('nbp', 'binance',
+            'etherscan', 'blockchain'); missing prefixes are not limited
+        transactions_per_address: Number of chain transactions of every address
+        seed: Seed of the synthetic chain data
+    """
+
+    year: int
+    latency: float = 0.0
+    rate_limits: dict[str, float] = field(default_factory=dict)
+    transactions_per_address: int = 100
+    seed: int = 0
+
+
+class MockApiServer:
+    def __init__(self, config: MockApiConfig):
+        """
+        Threaded HTTP server replaying the public APIs used by KryptoRozliczator.
+
+        Args:
+            config: Data and behaviour of the servers
+        """
+        self.config = config
+        self.rate_limits = {
+            prefix: WindowRateLimit(config.rate_limits.get(prefix)) for prefix in API_PREFIXES
+        }
+        self.requests = dict.fromkeys(API_PREFIXES, 0)
+        self.throttled = dict.fromkeys(API_PREFIXES, 0)
+        self.not_modified = dict.fromkeys(API_PREFIXES, 0)
+        self._chain_cache: dict[tuple[str, str], list[dict]] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environment(self) -> dict[str, str]:
+        """
+        Environment variables pointing KryptoRozliczator at this server.
+        """
+        return {
+            "KRYPTOROZLICZATOR_NBP_API_URL": f"{self.url}/nbp",
+            "KRYPTOROZLICZATOR_BINANCE_API_URL": f"{self.url}/binance",
+            "KRYPTOROZLICZATOR_ETHERSCAN_API_URL": f"{self.url}/etherscan/api",
+            "KRYPTOROZLICZATOR_BLOCKCHAIN_INFO_API_URL": f"{self.url}/blockchain",
+        }
+
+    def __enter__(self) -> "MockApiServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _chain(self, kind: str, address: str) -> list[dict]:
+        key = (kind, address)
+        with self._lock:
+            if key not in self._chain_cache:
+                generate = (
+                    synthetic.bitcoin_transactions
+                    if kind == "bitcoin"
+                    else synthetic.ethereum_transactions
+                )
+                self._chain_cache[key] = generate(
+                    address,
+                    self.config.transactions_per_address,
+                    self.config.year,
+                    self.config.seed,
+                )
+            return self._chain_cache[key]
+
+    def respond(self, prefix: str, path: str, query: dict[str, str]) -> tuple[int, object]:
+        """
+        Status and JSON body of a request to one of the APIs.
+        """
+        if prefix == "nbp":
+            return self._nbp(path)
+        if prefix == "binance":
+            if path.endswith("/exchangeInfo"):
+                return self._binance_markets()
+            return self._binance(query)
+        if prefix == "etherscan":
+            return self._etherscan(query)
+        return self._blockchain(path, query)
+
+    def _nbp(self, path: str) -> tuple[int, object]:
+        match = NBP_RANGE_PATTERN.match(path) or NBP_DAY_PATTERN.match(path)
+        if match is None:
+            return HTTP_NOT_FOUND, {"error": "Not Found"}
+        currency_code, start = match.group(1), np.datetime64(match.group(2))
+        end = np.datetime64(match.group(3)) if match.re is NBP_RANGE_PATTERN else start
+        days = np.arange(start, end + np.timedelta64(1, "D"), dtype="datetime64[D]")
+        days = days[np.is_busday(days)]
+        if not len(days):
+            return HTTP_NOT_FOUND, "404 NotFound - Not Found - Brak danych"
+        rates = [
+            {
+                "no": f"{i:03d}/A/NBP",
+                "effectiveDate": str(day),
+                "mid": synthetic.nbp_mid(currency_code, day),
+            }
+            for i, day in enumerate(days, 1)
+        ]
+        return HTTP_OK, {"table": "A", "code": currency_code, "rates": rates}
+
+    def _binance_markets(self) -> tuple[int, object]:
+        symbols = [
+            {
+                "symbol": f"{base}{quote}",
+                "baseAsset": base,
+                "quoteAsset": quote,
+                "status": "TRADING",
+            }
+            for base, quote in synthetic.BINANCE_MARKETS
+        ]
+        return HTTP_OK, {"timezone": "UTC", "symbols": symbols}
+
+    def _binance(self, query: dict[str, str]) -> tuple[int, object]:
+        symbol = query.get("symbol", "")
+        step = KLINE_INTERVALS_MS[query.get("interval", "1d")]
+        limit = int(query.get("limit", 500))
+        start = int(query["startTime"]) // step * step
+        end = int(query.get("endTime", start + step * limit - 1))
+        open_times = np.arange(start, end + 1, step, dtype=np.int64)[:limit]
+        if step == DAY_MS:
+            days = open_times.astype("datetime64[ms]").astype("datetime64[D]")
+            closes = [synthetic.daily_close(symbol, day) for day in days]
+        else:
+            closes = synthetic.intraday_closes(symbol, open_times).tolist()
+        candles = [
+            [open_time, str(close), str(close), str(close), str(close), "1.0", open_time + step - 1]
+            for open_time, close in zip(open_times.tolist(), closes, strict=True)
+        ]
+        return HTTP_OK, candles
+
+    def _etherscan(self, query: dict[str, str]) -> tuple[int, object]:
+        if query.get("action") == "getblocknobytime":
+            timestamp = int(query["timestamp"])
+            block = synthetic.ethereum_block(timestamp)
+            if query.get("closest") == "after" and synthetic.ethereum_block(timestamp - 1) == block:
+                block += 1
+            return HTTP_OK, {"status": "1", "message": "OK", "result": str(block)}
+        if query.get("action") != "txlist":
+            return HTTP_OK, {"status": "0", "message": "NOTOK", "result": "Unknown action"}
+
+        start_block, end_block = int(query["startblock"]), int(query["endblock"])
+        transactions = [
+            tx
+            for tx in self._chain("ethereum", query["address"])
+            if start_block <= int(tx["blockNumber"]) <= end_block
+        ]
+        page, offset = int(query.get("page", 1)), int(query.get("offset", 10_000))
+        transactions = transactions[(page - 1) * offset : page * offset]
+        if not transactions:
+            return HTTP_OK, {"status": "0", "message": "No transactions found", "result": []}
+        return HTTP_OK, {"status": "1", "message": "OK", "result": transactions}
+
+    def _blockchain(self, path: str, query: dict[str, str]) -> tuple[int, object]:
+        if path == "/multiaddr":
+            addresses = [address for address in query.get("active", "").split("|") if address]
+            # Every other address of an HD wallet is used, so gap scans stay short
+            return HTTP_OK, {
+                "addresses": [
+                    {
+                        "address": address,
+                        "n_tx": self.config.transactions_per_address * (i % 2 == 0),
+                    }
+                    for i, address in enumerate(addresses)
+                ]
+            }
+        if path.startswith("/rawaddr/"):
+            address = path.removeprefix("/rawaddr/")
+            transactions = self._chain("bitcoin", address)
+            offset, limit = int(query.get("offset", 0)), int(query.get("limit", 50))
+            return HTTP_OK, {
+                "address": address,
+                "n_tx": len(transactions),
+                "txs": transactions[offset : offset + limit],
+            }
+        return HTTP_NOT_FOUND, {"error": "Not Found"}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa: N802 - name required by BaseHTTPRequestHandler
+                url = urlparse(self.path)
+                prefix, _, path = url.path.lstrip("/").partition("/")
+                if prefix not in API_PREFIXES:
+                    self._send(HTTP_NOT_FOUND, {"error": "Unknown API"})
+                    return
+                with server._lock:
+                    server.requests[prefix] += 1
+                if not server.rate_limits[prefix].allow():
+                    with server._lock:
+                        server.throttled[prefix] += 1
+                    self._send(
+                        HTTP_TOO_MANY_REQUESTS,
+                        {"error": "Too Many Requests"},
+                        {"Retry-After": str(int(RATE_WINDOW_SECONDS))},
+                    )
+                    return
+                if server.config.latency:
+                    time.sleep(server.config.latency)
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                status, body = server.respond(prefix, f"/{path}", query)
+                payload = json.dumps(body).encode()
+                etag = f'"{hashlib.sha256(payload).hexdigest()[:32]}"'
+                if status == HTTP_OK and self.headers.get("If-None-Match") == etag:
+                    with server._lock:
+                        server.not_modified[prefix] += 1
+                    self._send(HTTP_NOT_MODIFIED, None, {"ETag": etag})
+                    return
+                self._send(status, body, {"ETag": etag} if status == HTTP_OK else {})
+
+            def _send(self, status: int, body: object, headers: dict[str, str] | None = None):
+                payload = json.dumps(body).encode() if status != HTTP_NOT_MODIFIED else b""
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
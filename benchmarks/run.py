@@ -0,0 +1,222 @@
+"""
+Benchmark of the settlement stages on synthetic data, against local stand-in API servers.
+
+Usage:
+    python -m benchmarks.run --trades 100000 --output results.json
+    python -m benchmarks.run --trades 100000 --baseline results.json --tolerance 0.25
+
+Every stage is timed separately; with --baseline the run fails when a stage got slower than
+the baseline by more than the tolerance.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from benchmarks import synthetic
+from benchmarks.mock_servers import API_PREFIXES, MockApiConfig, MockApiServer
+
+DEFAULT_YEAR = 2024
+# Stages faster than this are too noisy to compare against a baseline
+MIN_COMPARED_SECONDS = 0.05
+
+
+class StageTimer:
+    def __init__(self):
+        self.timings: dict[str, float] = {}
+
+    def run(self, name: str, func: Callable, *args, **kwargs):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.timings[name] = time.perf_counter() - started
+        print(f"{name:>20}: {self.timings[name]:8.3f} s")
+        return result
+
+
+def _write_wallet_config(path: Path, bitcoin: int, ethereum: int) -> Path:
+    addresses = {
+        "bitcoin": [f"bc1qbenchmark{i:010d}" for i in range(bitcoin)],
+        "ethereum": [f"0x{i:040x}" for i in range(1, ethereum + 1)],
+    }
+    path.write_text(json.dumps({"wallets": [{"name": "benchmark", "addresses": addresses}]}))
+    return path
+
+
+def run_benchmarks(args: argparse.Namespace, work_dir: Path) -> dict:
+    # API locations and data directories are read when the modules are imported, so only
+    # after the servers are up and HOME points at the work directory
+    from kryptorozliczator.exchange_interfaces.trade_journal import MOVEMENTS_ACCOUNT, TradeJournal
+    from kryptorozliczator.rates.nbp_tables import NbpRateTable
+    from kryptorozliczator.rates.rate_cache import RateCache
+    from kryptorozliczator.rates.rate_provider import RateProvider
+    from kryptorozliczator.reconciliation import exclude_internal, internal_transfers
+    from kryptorozliczator.settlement import (
+        finish_settlement,
+        load_journal_movements,
+        load_journal_trades,
+        load_spending,
+        value_spending,
+        write_outputs,
+    )
+    from kryptorozliczator.tax.pit38 import (
+        FIAT_CURRENCY_SYMBOLS,
+        summarize_conversion_pages,
+        summarize_conversions,
+        value_trades,
+    )
+    from kryptorozliczator.throttling import TokenBucket
+    from kryptorozliczator.wallet_interfaces.transfers import TransfersInterface
+
+    timer = StageTimer()
+    year = args.year
+
+    journal = TradeJournal("synthetic")
+
+    def ingest_trades():
+        for page in synthetic.iter_ccxt_trades(args.trades, year, seed=args.seed):
+            journal.append(page)
+
+    timer.run("ingest_trades", ingest_trades)
+    trades = timer.run("load_trades", load_journal_trades, ["synthetic"], year)
+
+    rate_provider = RateProvider(RateCache(None))
+    nbp_table = NbpRateTable(rate_provider.cache)
+    timer.run("fetch_nbp_rates", nbp_table.load_year, year, FIAT_CURRENCY_SYMBOLS)
+
+    csv_path = synthetic.write_coinomi_csv(work_dir / "coinomi.csv", args.spending, year, args.seed)
+    spending = timer.run("load_spending", load_spending, csv_path, year)
+    TradeJournal("synthetic", MOVEMENTS_ACCOUNT).append(
+        synthetic.ccxt_movements(spending, args.movements, year, args.seed)
+    )
+    movements = timer.run("load_movements", load_journal_movements, ["synthetic"], year)
+    internal = timer.run("reconcile", internal_transfers, spending, movements)
+    valued_spending = timer.run(
+        "value_spending",
+        value_spending,
+        exclude_internal(spending, internal),
+        rate_provider,
+        args.valuation_interval,
+    )
+
+    if args.bitcoin_addresses or args.ethereum_addresses:
+        os.environ["KRYPTOROZLICZATOR_WALLET_CONFIG"] = str(
+            _write_wallet_config(
+                work_dir / "wallet_config.json", args.bitcoin_addresses, args.ethereum_addresses
+            )
+        )
+        interface = TransfersInterface(max_workers=args.workers)
+        interface.bitcoin_rate_limiter = TokenBucket(args.client_rate)
+        interface.ethereum_rate_limiter = TokenBucket(args.client_rate)
+        timer.run("fetch_wallets", interface.scan_wallets, ["benchmark"], year)
+
+    frame = timer.run("to_frame", trades.to_frame)
+    valued = timer.run("valuation", value_trades, frame, nbp_table)
+    totals = timer.run("aggregation", summarize_conversions, valued)
+    pages = [
+        trades.select(slice(start, start + args.page_size))
+        for start in range(0, len(trades), args.page_size)
+    ]
+    timer.run("streamed_aggregation", summarize_conversion_pages, pages, nbp_table)
+
+    def report():
+        result = finish_settlement(trades, totals, valued_spending, 0.0)
+        write_outputs(result, work_dir / "output")
+        return result
+
+    timer.run("report", report)
+    return timer.timings
+
+
+def compare(timings: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Stages slower than their baseline time by more than `tolerance` (a fraction).
+    """
+    regressions = []
+    for name, seconds in timings.items():
+        reference = baseline.get(name)
+        if reference is None or max(reference, seconds) < MIN_COMPARED_SECONDS:
+            continue
+        if seconds > reference * (1 + tolerance):
+            regressions.append(f"{name}: {seconds:.3f} s (baseline {reference:.3f} s)")
+    return regressions
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--year", type=int, default=DEFAULT_YEAR)
+    parser.add_argument("--trades", type=int, default=100_000, help="Synthetic exchange trades")
+    parser.add_argument("--spending", type=int, default=10_000, help="Coinomi CSV rows")
+    parser.add_argument(
+        "--movements",
+        type=int,
+        default=10_000,
+        help="Exchange deposits and withdrawals besides those of Coinomi transfers",
+    )
+    parser.add_argument("--bitcoin-addresses", type=int, default=4)
+    parser.add_argument("--ethereum-addresses", type=int, default=4)
+    parser.add_argument(
+        "--transactions-per-address", type=int, default=200, help="Chain transactions per address"
+    )
+    parser.add_argument(
+        "--valuation-interval",
+        choices=("1d", "1h", "1m"),
+        default="1d",
+        help="Candle interval of the spending valuation",
+    )
+    parser.add_argument("--page-size", type=int, default=50_000, help="Rows per streamed page")
+    parser.add_argument("--workers", type=int, default=8, help="Parallel wallet scans")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per mock response")
+    parser.add_argument(
+        "--server-rate", type=float, help="Requests per second per API before the mock answers 429"
+    )
+    parser.add_argument(
+        "--client-rate", type=float, default=1000.0, help="Client-side requests per second"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write the timings to this JSON file")
+    parser.add_argument("--baseline", type=Path, help="Timings JSON of an earlier run")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline"
+    )
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    config = MockApiConfig(
+        year=args.year,
+        latency=args.latency,
+        rate_limits=dict.fromkeys(API_PREFIXES, args.server_rate) if args.server_rate else {},
+        transactions_per_address=args.transactions_per_address,
+        seed=args.seed,
+    )
+    with MockApiServer(config) as server, tempfile.TemporaryDirectory() as work_dir:
+        os.environ.update(server.environment())
+        # Journals, caches and outputs go to the temporary home, never the real one
+        os.environ["HOME"] = work_dir
+        timings = run_benchmarks(args, Path(work_dir))
+        print(
+            f"Mock API requests: {server.requests}, throttled: {server.throttled}, "
+            f"not modified: {server.not_modified}"
+        )
+
+    results = {"parameters": vars(args) | {"output": None, "baseline": None}, "timings": timings}
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2, default=str))
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())["timings"]
+        regressions = compare(timings, baseline, args.tolerance)
+        if regressions:
+            print("Slower than the baseline:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            return 1
+        print(f"No stage slower than the baseline by more than {args.tolerance:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
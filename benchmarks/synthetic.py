@@ -0,0 +1,273 @@
+"""
+Synthetic, reproducible input data for the benchmarks.
+
+Trades are generated page by page with NumPy, so millions of rows can be streamed without
+holding them all as dicts. All generators take a seed and return the same data for it.
+"""
+
+import csv
+import hashlib
+from collections.abc import Iterator
+from pathlib import Path
+
+import numpy as np
+
+from kryptorozliczator.tax.periods import year_bounds_ms
+
+# Pairs like the ones on Polish exchanges; ETH/BTC is skipped by the tax engine, USD/PLN has a
+# fiat base
+TRADE_SYMBOLS = ("BTC/PLN", "ETH/PLN", "BTC/USD", "ETH/EUR", "ETH/BTC", "USD/PLN")
+# Rough price levels of the base in the quote currency
+SYMBOL_PRICES = {
+    "BTC/PLN": 250_000.0,
+    "ETH/PLN": 12_000.0,
+    "BTC/USD": 60_000.0,
+    "ETH/EUR": 2_800.0,
+    "ETH/BTC": 0.05,
+    "USD/PLN": 4.0,
+}
+# SOL has no PLN market and is valued through SOL/USDT and the NBP USD rate
+SPENDING_SYMBOLS = ("BTC", "ETH", "SOL")
+SPENDING_PRICES_PLN = {"BTC": 250_000.0, "ETH": 12_000.0, "SOL": 600.0}
+# (base, quote) of the Binance markets of the stand-in exchangeInfo
+BINANCE_MARKETS = (("BTC", "PLN"), ("ETH", "PLN"), ("ETH", "BTC"), ("BTC", "EUR"), ("SOL", "USDT"))
+FIAT_RATES = {"USD": 4.0, "EUR": 4.3, "GBP": 5.0, "CHF": 4.5}
+# Synthetic Ethereum chain: a block every 12 s since this UNIX time
+ETHEREUM_GENESIS = 1_438_269_973
+ETHEREUM_BLOCK_SECONDS = 12
+SATOSHI = 100_000_000
+# Shares of trades paying the fee in the base currency and of outgoing chain transactions
+FEE_IN_BASE_SHARE = 0.3
+SENT_SHARE = 0.5
+INCOMING_SPENDING_SHARE = 1 / 3
+# Shares of outgoing Coinomi transfers that are exchange deposits, and of those with a txid
+INTERNAL_SPENDING_SHARE = 0.2
+DEPOSIT_TXID_SHARE = 0.5
+WEI = 10**18
+HOUR_MS = 60 * 60 * 1000
+DAY_MS = 24 * HOUR_MS
+
+
+def _seeded(seed: int, *names) -> np.random.Generator:
+    digest = hashlib.sha256(repr((seed, *names)).encode()).digest()
+    return np.random.default_rng(int.from_bytes(digest[:8], "little"))
+
+
+def iter_ccxt_trades(
+    count: int, year: int, exchange: str = "synthetic", page_size: int = 10_000, seed: int = 0
+) -> Iterator[list[dict]]:
+    """
+    Yield `count` ccxt-shaped trades of a tax year in pages, sorted by timestamp.
+
+    Args:
+        count: Number of trades
+        year: Tax year the trades fall into
+        exchange: Used as the prefix of the trade ids
+        page_size: Number of trades per page
+        seed: Seed of the generator
+    """
+    since, until = year_bounds_ms(year)
+    step = (until - since) / max(count, 1)
+    for start in range(0, count, page_size):
+        size = min(page_size, count - start)
+        rng = _seeded(seed, "trades", exchange, year, start)
+        timestamps = since + (np.arange(start, start + size) * step).astype(np.int64)
+        symbols = rng.integers(0, len(TRADE_SYMBOLS), size)
+        sides = rng.integers(0, 2, size)
+        moves = rng.normal(1.0, 0.05, size)
+        amounts = np.round(rng.lognormal(-2.0, 1.0, size), 8)
+        fee_in_base = rng.random(size) < FEE_IN_BASE_SHARE
+
+        page = []
+        for i in range(size):
+            symbol = TRADE_SYMBOLS[symbols[i]]
+            base, quote = symbol.split("/")
+            price = round(SYMBOL_PRICES[symbol] * moves[i], 8)
+            amount = float(amounts[i]) or 1e-8
+            cost = round(price * amount, 8)
+            fee = (
+                {"cost": round(amount * 0.001, 8), "currency": base}
+                if fee_in_base[i]
+                else {"cost": round(cost * 0.001, 8), "currency": quote}
+            )
+            timestamp = int(timestamps[i])
+            page.append(
+                {
+                    "id": f"{exchange}-{year}-{start + i}",
+                    "timestamp": timestamp,
+                    "symbol": symbol,
+                    "side": "buy" if sides[i] else "sell",
+                    "price": price,
+                    "amount": amount,
+                    "cost": cost,
+                    "fee": fee,
+                    "fees": [fee],
+                    "type": "limit",
+                    "takerOrMaker": "taker",
+                    "order": f"order-{start + i}",
+                    "info": {"tradeId": start + i, "rate": str(price), "amount": str(amount)},
+                }
+            )
+        yield page
+
+
+def write_coinomi_csv(path: str | Path, count: int, year: int, seed: int = 0) -> Path:
+    """
+    Write a Coinomi-like CSV export with `count` transfers, about a third of them incoming.
+    """
+    path = Path(path)
+    since, until = year_bounds_ms(year)
+    rng = _seeded(seed, "coinomi", year)
+    seconds = np.sort(rng.integers(since // 1000, until // 1000, count))
+    symbols = rng.integers(0, len(SPENDING_SYMBOLS), count)
+    values = np.round(rng.lognormal(-4.0, 1.0, count), 8)
+    incoming = rng.random(count) < INCOMING_SPENDING_SHARE
+
+    times = np.datetime_as_string(seconds.astype("datetime64[s]"), unit="s")
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Time(ISO8601-UTC)", "Symbol", "Value", "Fees", "Transaction ID"])
+        for i in range(count):
+            value = values[i] if incoming[i] else -values[i]
+            writer.writerow(
+                [
+                    f"{times[i]}Z",
+                    SPENDING_SYMBOLS[symbols[i]],
+                    f"{value:.8f}",
+                    f"{values[i] * 0.0001:.8f}",
+                    hashlib.sha256(f"{seed}-{i}".encode()).hexdigest(),
+                ]
+            )
+    return path
+
+
+def ccxt_movements(spending, count: int, year: int, seed: int = 0) -> list[dict]:
+    """
+    ccxt-shaped exchange deposits and withdrawals: deposits of a share of the outgoing transfers
+    of a Coinomi export (read with load_spending), credited up to an hour later without the
+    network fee, and `count` unrelated movements.
+    """
+    since, until = year_bounds_ms(year)
+    rng = _seeded(seed, "movements", year)
+    rows = np.flatnonzero(rng.random(len(spending)) < INTERNAL_SPENDING_SHARE)
+    times = spending["Time(ISO8601-UTC)"].str.removesuffix("Z").to_numpy(dtype="datetime64[ms]")
+    delays = rng.integers(60_000, HOUR_MS, len(rows))
+    with_txid = rng.random(len(rows)) < DEPOSIT_TXID_SHARE
+    movements = []
+    for i, row in enumerate(rows):
+        amount = -float(spending["Value"].iat[row]) - float(spending["Fees"].iat[row])
+        txid = spending["Transaction ID"].iat[row] if with_txid[i] else None
+        movements.append(
+            {
+                "id": f"deposit-{row}",
+                "txid": txid,
+                "timestamp": int(times[row].astype(np.int64) + delays[i]),
+                "type": "deposit",
+                "currency": spending["Symbol"].iat[row],
+                "amount": round(amount, 8),
+                "status": "ok",
+                "fee": None,
+            }
+        )
+
+    timestamps = rng.integers(since, until, count)
+    symbols = rng.integers(0, len(SPENDING_SYMBOLS), count)
+    amounts = np.round(rng.lognormal(0.0, 1.0, count), 8)
+    withdrawals = rng.random(count) < SENT_SHARE
+    for i in range(count):
+        symbol = SPENDING_SYMBOLS[symbols[i]]
+        movements.append(
+            {
+                "id": f"movement-{i}",
+                "txid": hashlib.sha256(f"movement-{seed}-{i}".encode()).hexdigest(),
+                "timestamp": int(timestamps[i]),
+                "type": "withdrawal" if withdrawals[i] else "deposit",
+                "currency": symbol,
+                "amount": float(amounts[i]),
+                "status": "ok",
+                "fee": {"cost": 0.0001, "currency": symbol},
+            }
+        )
+    return movements
+
+
+def bitcoin_transactions(address: str, count: int, year: int, seed: int = 0) -> list[dict]:
+    """
+    blockchain.info rawaddr transactions of an address in a year, newest first.
+    """
+    since, until = year_bounds_ms(year)
+    rng = _seeded(seed, "bitcoin", address, year)
+    times = np.sort(rng.integers(since // 1000, until // 1000, count))[::-1]
+    values = rng.integers(10_000, SATOSHI, count)
+    sent = rng.random(count) < SENT_SHARE
+    transactions = []
+    for i in range(count):
+        counterparty = f"bc1qsynthetic{seed}x{i:08d}"
+        inputs = [{"addr": address if sent[i] else counterparty}]
+        transactions.append(
+            {
+                "hash": hashlib.sha256(f"{address}-{i}".encode()).hexdigest(),
+                "time": int(times[i]),
+                "fee": int(values[i] // 1000),
+                "inputs": [{**entry, "prev_out": entry} for entry in inputs],
+                "out": [
+                    {"addr": counterparty if sent[i] else address, "value": int(values[i])},
+                ],
+            }
+        )
+    return transactions
+
+
+def ethereum_block(timestamp: int) -> int:
+    return (timestamp - ETHEREUM_GENESIS) // ETHEREUM_BLOCK_SECONDS
+
+
+def ethereum_transactions(address: str, count: int, year: int, seed: int = 0) -> list[dict]:
+    """
+    Etherscan txlist transactions of an address in a year, oldest first.
+    """
+    since, until = year_bounds_ms(year)
+    rng = _seeded(seed, "ethereum", address, year)
+    times = np.sort(rng.integers(since // 1000, until // 1000, count))
+    values = rng.integers(10**15, 10**18, count)
+    sent = rng.random(count) < SENT_SHARE
+    counterparty = f"0x{hashlib.sha256(address.encode()).hexdigest()[:40]}"
+    return [
+        {
+            "hash": "0x" + hashlib.sha256(f"{address}-{i}".encode()).hexdigest(),
+            "timeStamp": str(int(times[i])),
+            "blockNumber": str(ethereum_block(int(times[i]))),
+            "from": address if sent[i] else counterparty,
+            "to": counterparty if sent[i] else address,
+            "value": str(int(values[i])),
+            "gasPrice": "30000000000",
+            "gasUsed": "21000",
+        }
+        for i in range(count)
+    ]
+
+
+def nbp_mid(currency_code: str, day: np.datetime64) -> float:
+    """
+    Deterministic NBP-like mid rate of a currency on a day.
+    """
+    wave = np.sin(day.astype("datetime64[D]").astype(np.int64) / 30.0)
+    return round(FIAT_RATES.get(currency_code, 1.0) * (1 + 0.02 * wave), 4)
+
+
+def daily_close(symbol: str, day: np.datetime64) -> float:
+    """
+    Deterministic Binance-like daily close of a market such as BTCPLN.
+    """
+    base = symbol[:3]
+    wave = np.cos(day.astype("datetime64[D]").astype(np.int64) / 45.0)
+    return round(SPENDING_PRICES_PLN.get(base, 100.0) * (1 + 0.1 * wave), 2)
+
+
+def intraday_closes(symbol: str, open_times: np.ndarray) -> np.ndarray:
+    """
+    Deterministic Binance-like closes of intraday candles, moving around the daily close.
+    """
+    days = open_times // DAY_MS
+    daily = SPENDING_PRICES_PLN.get(symbol[:3], 100.0) * (1 + 0.1 * np.cos(days / 45.0))
+    return np.round(daily * (1 + 0.005 * np.sin(open_times / HOUR_MS)), 2)
@@ -0,0 +1,5 @@
+import sys
+
+from kryptorozliczator.cli import main
+
+sys.exit(main())
@@ -0,0 +1,313 @@
+"""
+Settlement of many clients in one run, one process per client.
+
+A JSON manifest lists the clients with their credentials file, wallet configuration and CSV
+exports. Every client runs in its own worker process with its own data directory, so its trade
+journals, checkpoints and outputs never mix with another client's, and a failing client does
+not stop the others. All workers share one cache directory with NBP and Binance rates, which
+is filled for the whole season before the workers start, so they mostly read it.
+
+Like the command line, this module imports only the standard library at module level: the
+workers point HOME and the KRYPTOROZLICZATOR_* variables at the client before the settlement
+modules are imported, because those read their default locations on import.
+
+Manifest example (relative paths are relative to the manifest):
+
+    {
+      "year": 2024,
+      "cache_dir": "cache",
+      "clients": [
+        {
+          "name": "kowalski",
+          "env_file": "kowalski/.env",
+          "wallet_config": "kowalski/wallet_config.json",
+          "spending_csv": "kowalski/coinomi.csv",
+          "exchanges": ["zonda", "bitfinex"],
+          "prior_costs": 1250.0
+        }
+      ]
+    }
+"""
+
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stderr, redirect_stdout
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from multiprocessing import get_context
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = Path(
+    os.getenv("KRYPTOROZLICZATOR_CACHE_DIR", Path.home() / "kryptorozliczator" / "cache")
+)
+# A client whose worker process dies is run alone in a fresh pool, at most this many times
+MAX_ATTEMPTS = 2
+# Credentials inherited from the operator's environment are removed from the workers
+CREDENTIAL_SUFFIXES = ("_API_KEY", "_API_SECRET")
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+
+
+@dataclass
+class BatchClient:
+    """
+    One taxpayer of a batch run.
+
+    Attributes:
+        name: Unique name, also the name of the default data directory
+        data_dir: Home of the client's journals, checkpoints and outputs
+        env_file: .env file with the exchange API keys of the client
+        wallet_config: Wallet configuration JSON of the client
+        spending_csv: Wallet CSV export with purchases paid in crypto
+        exchanges: CCXT exchange IDs, by default all exchanges with a trade journal
+        prior_costs: Unsettled costs from previous years in PLN (PIT-38 field 36)
+        offline: Use the client's trade journals and cached rates only
+    """
+
+    name: str
+    data_dir: Path
+    env_file: Path | None = None
+    wallet_config: Path | None = None
+    spending_csv: Path | None = None
+    exchanges: list[str] | None = None
+    prior_costs: float = 0.0
+    offline: bool = False
+
+
+@dataclass
+class BatchManifest:
+    """
+    Clients of a batch run and the settings they share.
+
+    Attributes:
+        year: Tax year
+        clients: Clients to settle
+        cache_dir: Rate cache directory shared by all clients
+        valuation_interval: Candle interval of the spending valuation, '1d', '1h' or '1m'
+    """
+
+    year: int
+    clients: list[BatchClient] = field(default_factory=list)
+    cache_dir: Path = DEFAULT_CACHE_DIR
+    valuation_interval: str = "1d"
+
+    @classmethod
+    def from_file(cls, path: str | Path) -> "BatchManifest":
+        """
+        Read a manifest; relative paths in it are resolved against its directory.
+
+        Raises:
+            ValueError: If the manifest has no clients or two clients share a name
+        """
+        path = Path(path).expanduser()
+        base_dir = path.parent.resolve()
+        manifest = json.loads(path.read_text())
+
+        def resolve(value) -> Path | None:
+            return base_dir / Path(value).expanduser() if value is not None else None
+
+        clients = [
+            BatchClient(
+                name=entry["name"],
+                data_dir=resolve(entry.get("data_dir", entry["name"])),
+                env_file=resolve(entry.get("env_file")),
+                wallet_config=resolve(entry.get("wallet_config")),
+                spending_csv=resolve(entry.get("spending_csv")),
+                exchanges=entry.get("exchanges"),
+                prior_costs=float(entry.get("prior_costs", 0.0)),
+                offline=bool(entry.get("offline", False)),
+            )
+            for entry in manifest.get("clients", [])
+        ]
+        names = [client.name for client in clients]
+        if not clients:
+            raise ValueError(f"No clients in batch manifest {path}")
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate client names in batch manifest {path}")
+        return cls(
+            year=int(manifest["year"]),
+            clients=clients,
+            cache_dir=resolve(manifest.get("cache_dir")) or DEFAULT_CACHE_DIR,
+            valuation_interval=manifest.get("valuation_interval", "1d"),
+        )
+
+
+def warm_rate_cache(manifest: BatchManifest):
+    """
+    Load the NBP tables of the year and the Binance market list into the shared cache.
+
+    Binance prices depend on the spending of every client and are cached by the workers.
+    """
+    from kryptorozliczator.rates.nbp_tables import NbpRateTable
+    from kryptorozliczator.rates.rate_cache import RATE_CACHE_FILE, RateCache
+    from kryptorozliczator.rates.rate_routing import MARKETS_FILE, load_binance_markets
+    from kryptorozliczator.tax.pit38 import FIAT_CURRENCY_SYMBOLS
+
+    cache_dir = Path(manifest.cache_dir).expanduser()
+    NbpRateTable(RateCache(cache_dir / RATE_CACHE_FILE)).load_year(
+        manifest.year, FIAT_CURRENCY_SYMBOLS
+    )
+    load_binance_markets(cache_dir / MARKETS_FILE)
+
+
+def _client_environment(client: BatchClient, cache_dir: Path) -> dict[str, str]:
+    environment = {
+        "HOME": str(client.data_dir),
+        "KRYPTOROZLICZATOR_CACHE_DIR": str(cache_dir),
+        # Without a credentials file of the client no other .env is searched for
+        "KRYPTOROZLICZATOR_ENV_FILE": str(client.env_file or client.data_dir / ".env"),
+    }
+    if client.wallet_config is not None:
+        environment["KRYPTOROZLICZATOR_WALLET_CONFIG"] = str(client.wallet_config)
+    return environment
+
+
+def run_client(client: BatchClient, year: int, cache_dir: Path, valuation_interval: str) -> dict:
+    """
+    Settle one client; runs in a fresh worker process.
+
+    Output of the client goes to batch.log and the run report to batch-report.json in the
+    client's year directory. Errors are returned in the result instead of raised.
+
+    Returns:
+        Result dictionary with the client name, status, PIT-38 fields or error, and timings
+    """
+    started = time.perf_counter()
+    for name in [name for name in os.environ if name.endswith(CREDENTIAL_SUFFIXES)]:
+        del os.environ[name]
+    os.environ.update(_client_environment(client, cache_dir))
+    year_dir = client.data_dir / "kryptorozliczator" / str(year)
+    year_dir.mkdir(parents=True, exist_ok=True)
+    result = {"name": client.name, "year": year}
+
+    with open(year_dir / "batch.log", "w") as log, redirect_stdout(log), redirect_stderr(log):
+        try:
+            from kryptorozliczator import settlement
+            from kryptorozliczator.exchange_interfaces.trade_journal import journaled_exchanges
+            from kryptorozliczator.instrumentation import instrumentation
+
+            params = settlement.SettlementParams(
+                year=year,
+                exchanges=client.exchanges or journaled_exchanges(),
+                spending_csv=client.spending_csv,
+                prior_years_costs=client.prior_costs,
+                offline=client.offline,
+                valuation_interval=valuation_interval,
+            )
+            with instrumentation.stage("batch.client"):
+                settlement_result = settlement.run_settlement(params)
+                output_dir = settlement.output_dir_for(year)
+                settlement.write_outputs(settlement_result, output_dir)
+            instrumentation.write_report(year_dir / "batch-report.json")
+            result.update(
+                status=STATUS_OK,
+                output_dir=str(output_dir),
+                trades=len(settlement_result.conversions),
+                pit38=asdict(settlement_result.pit38),
+            )
+        except Exception as e:
+            traceback.print_exc()
+            result.update(status=STATUS_FAILED, error=f"{type(e).__name__}: {e}")
+
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def _run_in_pool(clients: list[BatchClient], run, max_workers: int | None):
+    """
+    Run clients in one fresh process pool.
+
+    Returns:
+        Results of the finished clients by name, and the (client, error) pairs of the clients
+        that did not finish because a worker process of the pool died
+    """
+    results: dict[str, dict] = {}
+    broken: list[tuple[BatchClient, BrokenProcessPool]] = []
+    context = get_context("spawn")
+    with ProcessPoolExecutor(max_workers, mp_context=context, max_tasks_per_child=1) as pool:
+        futures = {pool.submit(run, client): client for client in clients}
+        for future in as_completed(futures):
+            client = futures[future]
+            try:
+                result = results[client.name] = future.result()
+            except BrokenProcessPool as e:
+                broken.append((client, e))
+                continue
+            print(f"[{client.name}] {result['status']} {result.get('error', '')}".rstrip())
+    return results, broken
+
+
+def _run_alone(client: BatchClient, run, year: int) -> dict:
+    """
+    Run a client whose pool broke in pools of its own, so only its own death is charged to it.
+    """
+    for _ in range(MAX_ATTEMPTS):
+        results, broken = _run_in_pool([client], run, 1)
+        if client.name in results:
+            return results[client.name]
+    error = broken[0][1]
+    print(f"[{client.name}] {STATUS_FAILED} Worker process died: {error}")
+    return {
+        "name": client.name,
+        "year": year,
+        "status": STATUS_FAILED,
+        "error": f"Worker process died: {error}",
+    }
+
+
+def _settle_clients(
+    clients: list[BatchClient], run, year: int, max_workers: int | None
+) -> dict[str, dict]:
+    """
+    Run `run(client)` for every client in worker processes and collect the results by name.
+
+    When a worker process dies, the pool breaks and every unfinished client fails with it, not
+    only the one that crashed. Those clients are therefore run again, each in a pool of its
+    own (still up to `max_workers` at a time), and a client fails only when its own process
+    dies MAX_ATTEMPTS times.
+    """
+    results, broken = _run_in_pool(clients, run, max_workers)
+    suspects = [client for client, _ in broken]
+    if suspects:
+        with ThreadPoolExecutor(max_workers or os.cpu_count()) as threads:
+            retried = threads.map(lambda client: _run_alone(client, run, year), suspects)
+            for client, result in zip(suspects, retried, strict=True):
+                results[client.name] = result
+    return results
+
+
+def run_batch(manifest: BatchManifest, max_workers: int | None = None) -> list[dict]:
+    """
+    Settle all clients of a manifest in a process pool.
+
+    Every client gets a fresh process, so module state such as default paths never carries
+    over between clients. Clients whose pool broke because a worker process died are retried
+    alone, so a client that crashes its process does not fail the others (see
+    _settle_clients); any other error only fails that client.
+
+    Args:
+        manifest: Clients and shared settings
+        max_workers: Worker processes, by default one per CPU core
+
+    Returns:
+        Result of every client, in manifest order
+    """
+    cache_dir = Path(manifest.cache_dir).expanduser()
+    try:
+        warm_rate_cache(manifest)
+    except Exception as e:
+        # The workers fetch what they need themselves, only less efficiently
+        print(f"Failed to prefill the rate cache: {e}")
+
+    run = partial(
+        run_client,
+        year=manifest.year,
+        cache_dir=cache_dir,
+        valuation_interval=manifest.valuation_interval,
+    )
+    results = _settle_clients(manifest.clients, run, manifest.year, max_workers)
+    return [results[client.name] for client in manifest.clients]
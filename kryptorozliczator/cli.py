@@ -0,0 +1,316 @@
+"""
+Command line interface of KryptoRozliczator.
+
+Only the standard library is imported at module level; pandas, ccxt and the wallet libraries
+are imported by the commands that need them, so that `--help` and cached runs start quickly.
+"""
+
+import argparse
+import sys
+from contextlib import nullcontext
+from datetime import date
+from pathlib import Path
+
+
+def _add_year_argument(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--year", type=int, default=date.today().year - 1, help="Tax year (default: last year)"
+    )
+
+
+def _add_valuation_argument(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--valuation-interval",
+        choices=("1d", "1h", "1m"),
+        default="1d",
+        help="Value spending at the daily close (1d) or at the exact time of every transfer "
+        "with hourly or minute candles",
+    )
+
+
+def _add_settlement_arguments(parser: argparse.ArgumentParser):
+    _add_year_argument(parser)
+    parser.add_argument(
+        "--exchange",
+        dest="exchanges",
+        action="append",
+        help="CCXT exchange ID, can be repeated (default: all exchanges with a trade journal)",
+    )
+    parser.add_argument(
+        "--spending-csv",
+        type=Path,
+        help="Coinomi or Ledger Live CSV export with purchases paid in crypto",
+    )
+    parser.add_argument(
+        "--own-wallet",
+        dest="own_wallets",
+        action="append",
+        help="Wallet from the wallet configuration, can be repeated; spending transfers to it "
+        "are internal, like deposits to the exchanges",
+    )
+    _add_valuation_argument(parser)
+    parser.add_argument(
+        "--prior-costs",
+        type=float,
+        default=0.0,
+        help="Unsettled costs from previous years in PLN (PIT-38 field 36)",
+    )
+    parser.add_argument(
+        "--from-stage",
+        help="Recompute this pipeline stage and all later ones, e.g. 'valued_trades' after "
+        "changing the rate cache (default: only stages whose inputs changed)",
+    )
+    parser.add_argument(
+        "--no-checkpoints", action="store_true", help="Compute everything without checkpoints"
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        help="Output directory (default: ~/kryptorozliczator/YEAR/output)",
+    )
+
+
+def _command_rates(args: argparse.Namespace) -> int:
+    from kryptorozliczator.rates.nbp_tables import NbpRateTable
+    from kryptorozliczator.rates.rate_provider import RateProvider
+    from kryptorozliczator.tax.pit38 import FIAT_CURRENCY_SYMBOLS
+
+    rate_provider = RateProvider(offline=args.offline)
+    nbp_table = NbpRateTable(rate_provider.cache)
+    nbp_table.load_year(args.year, args.currencies or sorted(FIAT_CURRENCY_SYMBOLS))
+    for currency_code in nbp_table.currencies():
+        days, mids = nbp_table.publications(
+            currency_code, date(args.year, 1, 1), date(args.year, 12, 31)
+        )
+        print(f"{currency_code}: {len(days)} NBP publications in {args.year}", end="")
+        print(f", last mid rate {mids[-1]} on {days[-1]}" if len(days) else "")
+    print(f"Rate cache statistics: {rate_provider.stats.as_dict()}")
+    return 0
+
+
+def _settle(args: argparse.Namespace, offline: bool) -> int:
+    from kryptorozliczator import settlement
+    from kryptorozliczator.exchange_interfaces.trade_journal import journaled_exchanges
+    from kryptorozliczator.pipeline import Pipeline
+    from kryptorozliczator.tax.pit38 import pit38_frame
+
+    params = settlement.SettlementParams(
+        year=args.year,
+        exchanges=args.exchanges or journaled_exchanges(),
+        spending_csv=args.spending_csv,
+        prior_years_costs=args.prior_costs,
+        offline=offline,
+        valuation_interval=args.valuation_interval,
+        own_wallets=args.own_wallets,
+    )
+    if args.no_checkpoints:
+        pipeline = Pipeline(settlement.SETTLEMENT_STAGES)
+        result = pipeline.run(params.pipeline_params())["settlement"]
+    else:
+        result = settlement.run_settlement(params, from_stage=args.from_stage)
+    output_dir = args.output_dir or settlement.output_dir_for(args.year)
+    settlement.write_outputs(result, output_dir)
+
+    exchanges = ", ".join(params.exchanges) or "no exchanges"
+    print(f"{len(result.conversions)} exchange trades from {exchanges}")
+    print(pit38_frame(result.pit38).to_string(index=False))
+    print(f"Results saved to {output_dir}")
+    return 0
+
+
+def _command_ledger(args: argparse.Namespace) -> int:
+    from kryptorozliczator.exchange_interfaces.trade_journal import journaled_exchanges
+    from kryptorozliczator.ledger import LedgerParams, ledger_frame, run_ledger
+
+    params = LedgerParams(
+        first_year=args.first_year,
+        last_year=args.last_year,
+        exchanges=args.exchanges or journaled_exchanges(),
+        spending_csv=args.spending_csv,
+        opening_costs=args.opening_costs,
+        offline=args.offline,
+        valuation_interval=args.valuation_interval,
+    )
+    years = run_ledger(params)
+    print(ledger_frame(years).to_string(index=False))
+    return 0
+
+
+def _command_batch(args: argparse.Namespace) -> int:
+    import json
+
+    from kryptorozliczator.batch import STATUS_OK, BatchManifest, run_batch
+
+    manifest = BatchManifest.from_file(args.manifest)
+    results = run_batch(manifest, max_workers=args.workers)
+    summary_path = args.summary or args.manifest.parent / f"batch-{manifest.year}.json"
+    summary_path.write_text(json.dumps(results, indent=2))
+
+    failed = [result for result in results if result["status"] != STATUS_OK]
+    print(f"{len(results) - len(failed)} of {len(results)} clients settled")
+    for result in failed:
+        print(f"  {result['name']}: {result['error']}")
+    print(f"Batch summary saved to {summary_path}")
+    return 1 if failed else 0
+
+
+def _command_serve(args: argparse.Namespace) -> int:
+    from kryptorozliczator.exchange_interfaces.trade_journal import journaled_exchanges
+    from kryptorozliczator.service import SettlementService, create_server
+
+    service = SettlementService(
+        exchanges=args.exchanges or journaled_exchanges(),
+        spending_csvs=args.spending_csvs,
+        offline=args.offline,
+    )
+    service.refresh()
+    server = create_server(service, args.host, args.port, args.socket)
+    address = args.socket or f"http://{args.host}:{args.port}"
+    print(f"Serving {', '.join(service.exchanges) or 'no exchanges'} on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="kryptorozliczator", description="Cryptocurrency tax settlement (PIT-38)"
+    )
+    parser.add_argument(
+        "--report",
+        type=Path,
+        help="Write a JSON run report with stage timers, HTTP, retry and cache statistics",
+    )
+    parser.add_argument("--profile", type=Path, help="Profile the run and save it to this file")
+    parser.add_argument(
+        "--profiler",
+        choices=("cprofile", "pyinstrument"),
+        default="cprofile",
+        help="cprofile writes a pstats file, pyinstrument (optional package) an HTML page",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rates = commands.add_parser("rates", help="Load and show NBP rates of a tax year")
+    _add_year_argument(rates)
+    rates.add_argument(
+        "--currency", dest="currencies", action="append", help="Currency code, can be repeated"
+    )
+    rates.add_argument("--offline", action="store_true", help="Use cached rates only")
+    rates.set_defaults(handler=_command_rates)
+
+    report = commands.add_parser(
+        "report", help="Compute the settlement from trade journals and cached rates, offline"
+    )
+    _add_settlement_arguments(report)
+    report.set_defaults(handler=lambda args: _settle(args, offline=True))
+
+    run = commands.add_parser(
+        "run", help="Sync exchanges and rates, then compute the yearly settlement"
+    )
+    _add_settlement_arguments(run)
+    run.set_defaults(handler=lambda args: _settle(args, offline=False))
+
+    ledger = commands.add_parser(
+        "ledger",
+        help="Settle several years from the trade journals, carrying unsettled costs forward",
+    )
+    ledger.add_argument("--first-year", type=int, required=True, help="First tax year")
+    ledger.add_argument(
+        "--last-year",
+        type=int,
+        default=date.today().year - 1,
+        help="Last tax year (default: last year)",
+    )
+    ledger.add_argument(
+        "--exchange",
+        dest="exchanges",
+        action="append",
+        help="CCXT exchange ID, can be repeated (default: all exchanges with a trade journal)",
+    )
+    ledger.add_argument(
+        "--spending-csv",
+        type=Path,
+        help="Coinomi or Ledger Live CSV export covering all years of the ledger",
+    )
+    _add_valuation_argument(ledger)
+    ledger.add_argument(
+        "--opening-costs",
+        type=float,
+        default=0.0,
+        help="Unsettled costs from before the first year in PLN (its PIT-38 field 36)",
+    )
+    ledger.add_argument("--offline", action="store_true", help="Use cached rates only")
+    ledger.set_defaults(handler=_command_ledger)
+
+    batch = commands.add_parser(
+        "batch", help="Settle all clients of a JSON manifest in parallel worker processes"
+    )
+    batch.add_argument("manifest", type=Path, help="Batch manifest, see kryptorozliczator.batch")
+    batch.add_argument("--workers", type=int, help="Worker processes (default: one per CPU core)")
+    batch.add_argument(
+        "--summary",
+        type=Path,
+        help="Results JSON (default: batch-YEAR.json next to the manifest)",
+    )
+    batch.set_defaults(handler=_command_batch)
+
+    serve = commands.add_parser(
+        "serve",
+        help="Answer PIT-38 and rate queries over a local JSON API, keeping data in memory",
+    )
+    serve.add_argument(
+        "--exchange",
+        dest="exchanges",
+        action="append",
+        help="CCXT exchange ID, can be repeated (default: all exchanges with a trade journal)",
+    )
+    serve.add_argument(
+        "--spending-csv",
+        dest="spending_csvs",
+        type=Path,
+        action="append",
+        help="Coinomi or Ledger Live CSV export, can be repeated; its file name is the wallet",
+    )
+    serve.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    serve.add_argument("--port", type=int, default=8787, help="Port to listen on")
+    serve.add_argument("--socket", type=Path, help="Listen on this Unix socket instead")
+    serve.add_argument("--offline", action="store_true", help="Use journals and cached rates only")
+    serve.set_defaults(handler=_command_serve)
+
+    return parser
+
+
+def _run_instrumented(args: argparse.Namespace) -> int:
+    from kryptorozliczator.instrumentation import instrumentation, profiled
+
+    instrumentation.reset()
+    profiler = profiled(args.profile, args.profiler) if args.profile else nullcontext()
+    try:
+        with profiler, instrumentation.stage(f"command.{args.command}"):
+            return args.handler(args)
+    finally:
+        print(instrumentation.summary())
+        if args.report:
+            instrumentation.write_report(args.report)
+            print(f"Run report saved to {args.report}")
+        if args.profile:
+            print(f"Profile saved to {args.profile}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        if args.report or args.profile:
+            return _run_instrumented(args)
+        return args.handler(args)
+    except (LookupError, ValueError, ImportError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
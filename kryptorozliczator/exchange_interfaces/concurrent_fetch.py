@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from kryptorozliczator.exchange_interfaces.exchange_interface import ExchangeInterface
+from kryptorozliczator.instrumentation import instrumentation
+
+
+def _fetch_history(interface: ExchangeInterface, year: int) -> list[dict]:
+    with instrumentation.stage(f"exchange.{interface.exchange_name}"):
+        return interface.get_transaction_history(year)
+
+
+def fetch_transaction_histories(
+    interfaces: list[ExchangeInterface], year: int, max_workers: int | None = None
+) -> dict[str, list[dict]]:
+    """
+    Fetch the transaction history of several exchanges in parallel.
+
+    Every exchange runs in its own thread and is throttled only by its own token bucket, so
+    the wall-clock time is roughly that of the slowest exchange.
+
+    Args:
+        interfaces: Exchange interfaces to fetch from
+        year: The year for which to fetch transactions
+        max_workers: Maximum number of exchanges fetched at once (default: all of them)
+
+    Returns:
+        Dictionary mapping exchange names to their transactions for that year
+    """
+    if not interfaces:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(interfaces)) as executor:
+        futures = {
+            interface.exchange_name: executor.submit(_fetch_history, interface, year)
+            for interface in interfaces
+        }
+        return {exchange_name: future.result() for exchange_name, future in futures.items()}
+
+
+def _fetch_movements(interface: ExchangeInterface, year: int) -> list[dict]:
+    with instrumentation.stage(f"exchange.{interface.exchange_name}.movements"):
+        return interface.get_movement_history(year)
+
+
+def fetch_movement_histories(
+    interfaces: list[ExchangeInterface], year: int, max_workers: int | None = None
+) -> dict[str, list[dict]]:
+    """
+    Fetch the deposits and withdrawals of several exchanges in parallel, one thread each.
+
+    Args:
+        interfaces: Exchange interfaces to fetch from
+        year: The year for which to fetch deposits and withdrawals
+        max_workers: Maximum number of exchanges fetched at once (default: all of them)
+
+    Returns:
+        Dictionary mapping exchange names to their deposits and withdrawals for that year
+    """
+    if not interfaces:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(interfaces)) as executor:
+        futures = {
+            interface.exchange_name: executor.submit(_fetch_movements, interface, year)
+            for interface in interfaces
+        }
+        return {exchange_name: future.result() for exchange_name, future in futures.items()}
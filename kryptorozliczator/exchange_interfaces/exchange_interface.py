@@ -1,20 +1,56 @@
 import os
-from datetime import datetime
+import queue
+import threading
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from itertools import pairwise
 
 import ccxt
 from dotenv import load_dotenv
 
+from kryptorozliczator.exchange_interfaces.trade_journal import (
+    TradeJournal,
+    movement_key,
+    trade_key,
+)
+from kryptorozliczator.exchange_interfaces.trade_record import TradeBatch
+from kryptorozliczator.instrumentation import instrumentation
+from kryptorozliczator.tax.periods import year_bounds_ms
+from kryptorozliczator.throttling import TokenBucket, call_with_backoff
+
+# Errors after which a request is retried with backoff instead of failing the run
+RATE_LIMIT_ERRORS = (ccxt.RateLimitExceeded, ccxt.DDoSProtection)
+MAX_RATE_LIMIT_RETRIES = 5
+
+# Page size used when ccxt does not advertise the exchange's maximum
+DEFAULT_PAGE_LIMIT = 100
+# Busy markets are split into time windows, fetched in parallel. A window is sized to hold
+# about PAGES_PER_SHARD pages at the density of the first page, with at most MAX_SHARDS of them
+PAGES_PER_SHARD = 10
+MAX_SHARDS = 64
+MAX_FETCH_WORKERS = 8
+DAY_MS = 24 * 60 * 60 * 1000
+# Pages buffered between fetching threads and a slow consumer of iter_range
+STREAM_QUEUE_PAGES = 16
+
+_JOB_DONE = object()
+
 
 class ExchangeInterface:
-    def __init__(self, exchange_id: str):
+    def __init__(self, exchange_id: str, journal: TradeJournal | None = None):
         """
         Initialize a universal exchange interface for any CCXT-supported exchange.
 
         Args:
             exchange_id: The CCXT exchange ID (e.g., 'binance', 'bitfinex', 'kraken')
+            journal: Optional local trade journal used for incremental syncing
         """
         self.exchange_name = exchange_id
-        load_dotenv()
+        self.journal = journal
+        # Markets to fetch on exchanges that require a symbol, None to discover them
+        self.symbols: list[str] | None = None
+        # A batch run points every client at its own credentials file
+        load_dotenv(os.getenv("KRYPTOROZLICZATOR_ENV_FILE"))
 
         # Construct environment variable names based on exchange ID
         api_key_var = f"{exchange_id.upper()}_API_KEY"
@@ -26,84 +62,134 @@ class ExchangeInterface:
         if not api_key or not api_secret:
             raise ValueError(f"{api_key_var} and {api_secret_var} must be set in .env file")
 
+        exchange_class = self._exchange_class()
         try:
-            # Dynamically get the exchange class from ccxt
-            exchange_class = getattr(ccxt, exchange_id)
             self.exchange = exchange_class(
                 {
                     "apiKey": api_key,
                     "secret": api_secret,
+                    # Requests are throttled by our own token bucket, see _call
+                    "enableRateLimit": False,
                 }
             )
+        except Exception as e:
+            raise RuntimeError(f"Failed to initialize {exchange_id} exchange: {e!s}") from e
+
+        self.rate_limiter = TokenBucket.from_interval(
+            self.exchange.rateLimit, name=self.exchange_name
+        )
+        self.exchange.session.hooks["response"].append(instrumentation.response_hook)
+
+    def _exchange_class(self) -> type:
+        """
+        The ccxt exchange class of `exchange_name`.
+
+        Raises:
+            ValueError: If ccxt has no such exchange
+        """
+        try:
+            return getattr(ccxt, self.exchange_name)
         except AttributeError:
             raise ValueError(
-                f"Exchange '{exchange_id}' is not supported by CCXT. "
+                f"Exchange '{self.exchange_name}' is not supported by CCXT. "
                 "Please check the CCXT documentation for supported exchanges."
             ) from None
-        except Exception as e:
-            raise RuntimeError(f"Failed to initialize {exchange_id} exchange: {e!s}") from e
 
-    def get_transaction_history(self, year: int) -> list[dict]:
+    def _call(self, method: str, *args, **kwargs):
         """
-        Fetches transaction history for the specified year.
+        Call a ccxt exchange method, throttled by the exchange's token bucket.
 
-        Args:
-            year: The year for which to fetch transactions.
+        Only actual rate limit errors (RateLimitExceeded, DDoSProtection) are retried, with
+        exponential backoff starting at the exchange's request interval.
+        """
 
-        Returns:
-            A list of transactions for that year.
+        def throttled_call():
+            self.rate_limiter.acquire()
+            return getattr(self.exchange, method)(*args, **kwargs)
+
+        def on_retry(error, delay):
+            instrumentation.record_retry(self.exchange_name, delay)
+            print(f"[{self.exchange_name}] Rate limited ({error}), retrying in {delay:.1f}s...")
+
+        return call_with_backoff(
+            throttled_call,
+            retry_on=RATE_LIMIT_ERRORS,
+            max_retries=MAX_RATE_LIMIT_RETRIES,
+            base_delay=max(1.0, self.exchange.rateLimit / 1000),
+            on_retry=on_retry,
+        )
+
+    def _page_limit(self) -> int:
         """
-        if not self.exchange.has["fetchMyTrades"]:
-            raise NotImplementedError(
-                f"The {self.exchange_name} exchange does not support fetching user trades through"
-                f"ccxt."
-            )
+        Largest page size the exchange accepts for fetch_my_trades, as advertised by ccxt.
+        """
+        features = (self.exchange.features or {}).get("spot") or {}
+        limit = (features.get("fetchMyTrades") or {}).get("limit")
+        return limit or DEFAULT_PAGE_LIMIT
+
+    def _symbol_required(self) -> bool:
+        features = (self.exchange.features or {}).get("spot") or {}
+        return bool((features.get("fetchMyTrades") or {}).get("symbolRequired"))
 
-        all_trades = []
-        since = self.exchange.parse8601(f"{year}-01-01T00:00:00Z")
-        end_timestamp = self.exchange.parse8601(f"{year+1}-01-01T00:00:00Z")
-        limit = 100  # Adjust limit based on API capabilities/defaults
+    def get_traded_symbols(self) -> list[str]:
+        """
+        List spot markets the account may have traded, for exchanges that need a symbol.
+
+        Uses the explicitly configured `symbols` if set, otherwise every spot market whose base
+        currency appears in the account balance (including currencies with zero balance).
+        """
+        if self.symbols is not None:
+            return list(self.symbols)
+
+        markets = self._call("load_markets")
+        currencies = set(self._call("fetch_balance")["total"])
+        return sorted(
+            symbol
+            for symbol, market in markets.items()
+            if market.get("spot", True) and market.get("base") in currencies
+        )
+
+    def _iter_pages(
+        self, since: int, until: int, symbol: str | None = None
+    ) -> Iterator[list[dict]]:
+        """
+        Yield pages of trades with since <= timestamp < until as they are fetched.
+
+        Args:
+            since: Start timestamp in milliseconds
+            until: End timestamp in milliseconds
+            symbol: Market to fetch, or None for all markets at once
+        """
+        limit = self._page_limit()
+        label = f"{self.exchange_name} {symbol}" if symbol else self.exchange_name
 
         try:
-            while True:
-                print(f"Fetching trades since {self.exchange.iso8601(since)}...")
-                trades = self.exchange.fetch_my_trades(since=since, limit=limit)
+            while since < until:
+                since_iso = self.exchange.iso8601(since)
+                print(f"[{label}] Fetching trades since {since_iso}...")
+                trades = self._call("fetch_my_trades", symbol=symbol, since=since, limit=limit)
 
                 if not trades:
-                    print("No more trades found.")
-                    break
-
-                # Filter trades that are within the target year
-                new_trades_in_year = [
-                    trade
-                    for trade in trades
-                    if trade["timestamp"] >= since and trade["timestamp"] < end_timestamp
-                ]
-                all_trades.extend(new_trades_in_year)
-
-                # Check if the last fetched trade is outside the year or
+                    return
+
+                # Filter trades that are within the target range
+                page = [trade for trade in trades if since <= trade["timestamp"] < until]
+                if page:
+                    yield page
+
+                # Check if the last fetched trade is outside the range or
                 # if we received fewer trades than the limit
-                if trades[-1]["timestamp"] >= end_timestamp or len(trades) < limit:
-                    print("Reached end of relevant period or fetched less than limit.")
-                    break
+                if trades[-1]["timestamp"] >= until or len(trades) < limit:
+                    return
 
                 # Update the 'since' timestamp to fetch the next batch
                 since = trades[-1]["timestamp"] + 1  # +1 ms to avoid duplicates
-                # Add a small delay to avoid hitting rate limits
-                self.exchange.sleep(1000)  # sleep for 1 second
-
-            # Ensure final list only contains trades from the specified year
-            final_trades = [
-                trade
-                for trade in all_trades
-                if datetime.fromtimestamp(trade["timestamp"] / 1000).year == year
-            ]
-            print(f"Fetched {len(final_trades)} total trades for the year {year}.")
-            return final_trades
 
         except ccxt.AuthenticationError as e:
             print(f"Authentication Error: {e}. Check your API keys.")
             raise
+        except ccxt.ArgumentsRequired:
+            raise
         except ccxt.ExchangeError as e:
             print(f"Exchange Error: {e}")
             raise
@@ -111,6 +197,292 @@ class ExchangeInterface:
             print(f"An unexpected error occurred: {e}")
             raise
 
+    def _iter_market(
+        self, since: int, until: int, symbol: str | None, submit: Callable
+    ) -> Iterator[list[dict]]:
+        """
+        Yield the first page of a market and hand the rest of its range to `submit` in shards.
+
+        If the first page is full, the rest of the range is cut into time shards sized from
+        the trade density of that page, each submitted as its own page iterator.
+        """
+        limit = self._page_limit()
+        first_page = self._call("fetch_my_trades", symbol=symbol, since=since, limit=limit)
+        page = [trade for trade in first_page if since <= trade["timestamp"] < until]
+        if page:
+            yield page
+        if len(first_page) < limit or first_page[-1]["timestamp"] >= until:
+            return
+
+        shard_start = first_page[-1]["timestamp"] + 1
+        page_span = first_page[-1]["timestamp"] - first_page[0]["timestamp"] + 1
+        shard_span = max(
+            DAY_MS, page_span * PAGES_PER_SHARD, -(-(until - shard_start) // MAX_SHARDS)
+        )
+        boundaries = [*range(shard_start, until, shard_span), until]
+        for start, end in pairwise(boundaries):
+            submit(self._iter_pages(start, end, symbol))
+
+    def _stream_markets(
+        self, since: int, until: int, symbols: list[str | None]
+    ) -> Iterator[list[dict]]:
+        """
+        Fetch several markets in parallel and yield their pages in arrival order.
+
+        Time shards of busy markets (see _iter_market) are fetched in parallel too. Pages go
+        through a bounded queue, so fetching pauses when the consumer falls behind and memory
+        use stays bounded. When the consumer stops early, jobs that have not started are
+        cancelled, so they do not spend requests of the rate limit.
+        """
+        pages: queue.Queue = queue.Queue(maxsize=STREAM_QUEUE_PAGES)
+        stop = threading.Event()
+        lock = threading.Lock()
+        pending = 0
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def run(job: Iterator[list[dict]]):
+            if stop.is_set():
+                return
+            try:
+                for page in job:
+                    if not put(page):
+                        break
+            except Exception as e:
+                put(e)
+            finally:
+                put(_JOB_DONE)
+
+        def submit(job: Iterator[list[dict]]):
+            nonlocal pending
+            if stop.is_set():
+                return
+            with lock:
+                pending += 1
+            executor.submit(run, job)
+
+        with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as executor:
+            try:
+                for symbol in symbols:
+                    submit(self._iter_market(since, until, symbol, submit))
+                while True:
+                    with lock:
+                        if pending == 0:
+                            break
+                    item = pages.get()
+                    if item is _JOB_DONE:
+                        with lock:
+                            pending -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        yield item
+            finally:
+                stop.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def iter_range(self, since: int, until: int | None = None) -> Iterator[list[dict]]:
+        """
+        Stream all trades of the account between two timestamps, page by page.
+
+        Exchanges that require a symbol are queried market by market. Busy markets are split
+        into time shards. All requests share the exchange's token bucket. Pages come in
+        arrival order, not sorted by time.
+
+        Args:
+            since: Start timestamp in milliseconds
+            until: End timestamp in milliseconds, or None to fetch up to now
+        """
+        if not self.exchange.has["fetchMyTrades"]:
+            raise NotImplementedError(
+                f"The {self.exchange_name} exchange does not support fetching user trades through"
+                f"ccxt."
+            )
+
+        if until is None:
+            until = self.exchange.milliseconds() + 1
+
+        if self._symbol_required():
+            yield from self._stream_markets(since, until, self.get_traded_symbols())
+            return
+
+        try:
+            yield from self._stream_markets(since, until, [None])
+        except ccxt.ArgumentsRequired:
+            yield from self._stream_markets(since, until, self.get_traded_symbols())
+
+    def _fetch_range(self, since: int, until: int | None = None) -> list[dict]:
+        """
+        Fetch all trades of the account between two timestamps, sorted by timestamp.
+        """
+        return self._merge(trade for page in self.iter_range(since, until) for trade in page)
+
+    @staticmethod
+    def _merge(records, key=trade_key) -> list[dict]:
+        unique = {key(record): record for record in records}
+        return sorted(unique.values(), key=lambda record: record["timestamp"])
+
+    def sync_trades(self, since: int) -> int:
+        """
+        Bring the trade journal up to date from `since` until now.
+
+        Only the parts not covered by the journal are fetched: trades newer than the stored
+        watermark and, if `since` is earlier than anything synced so far, the missing start.
+
+        Args:
+            since: Earliest timestamp in milliseconds the journal has to cover
+
+        Returns:
+            Number of new trades added to the journal
+        """
+        if self.journal is None:
+            raise ValueError(f"No trade journal configured for {self.exchange_name}")
+
+        added = 0
+        if self.journal.synced_from is None:
+            added += self.resync_range(since, None)
+            return added
+
+        if since < self.journal.synced_from:
+            added += self.resync_range(since, self.journal.synced_from)
+
+        # Refetch from the watermark itself, trades sharing its timestamp are deduplicated
+        trades = self._fetch_range(self.journal.watermark or since)
+        added += self.journal.append(trades)
+        self.journal.mark_synced(since, max((t["timestamp"] for t in trades), default=None))
+        print(f"Added {added} new trades to the {self.exchange_name} journal.")
+        return added
+
+    def resync_range(self, since: int, until: int | None) -> int:
+        """
+        Refetch all trades between two timestamps into the journal, e.g. to repair it.
+
+        Args:
+            since: Start timestamp in milliseconds
+            until: End timestamp in milliseconds, or None to fetch up to now
+
+        Returns:
+            Number of trades that were missing from the journal
+        """
+        if self.journal is None:
+            raise ValueError(f"No trade journal configured for {self.exchange_name}")
+
+        trades = self._fetch_range(since, until)
+        added = self.journal.append(trades)
+        latest = max((trade["timestamp"] for trade in trades), default=None)
+        self.journal.mark_synced(since, latest)
+        return added
+
+    def iter_trade_pages(
+        self, year: int, normalize: bool = True
+    ) -> Iterator[TradeBatch | list[dict]]:
+        """
+        Stream the transaction history of a tax year page by page.
+
+        Pages are yielded as they arrive (or as they are read from the trade journal), so
+        consumers can aggregate them without holding the whole history in memory.
+
+        Args:
+            year: The year for which to fetch transactions.
+            normalize: Yield compact TradeBatch pages without the raw `info` payload
+
+        Yields:
+            TradeBatch pages, or lists of ccxt trade dicts if `normalize` is False
+        """
+        since, until = year_bounds_ms(year)
+        if self.journal is None:
+            pages = self.iter_range(since, until)
+        else:
+            self.sync_trades(since)
+            pages = self.journal.iter_pages(since, until)
+
+        for page in pages:
+            if normalize:
+                yield TradeBatch.from_ccxt(page, self.exchange_name)
+            else:
+                yield page
+
+    def get_transaction_history(self, year: int) -> list[dict]:
+        """
+        Fetches transaction history for the specified year.
+
+        With a trade journal only trades newer than its watermark are downloaded, the rest
+        is served locally.
+
+        Args:
+            year: The year for which to fetch transactions.
+
+        Returns:
+            A list of transactions for that year.
+        """
+        since, until = year_bounds_ms(year)
+        if self.journal is None:
+            final_trades = self._fetch_range(since, until)
+        else:
+            self.sync_trades(since)
+            final_trades = self.journal.trades(since, until)
+
+        print(f"Fetched {len(final_trades)} total trades for the year {year}.")
+        return final_trades
+
+    def _iter_movements(
+        self, method: str, since: int, until: int, code: str | None = None
+    ) -> Iterator[dict]:
+        """
+        Yield deposits or withdrawals with since <= timestamp < until, paging by time.
+
+        Args:
+            method: 'fetch_deposits' or 'fetch_withdrawals'
+            since: Start timestamp in milliseconds
+            until: End timestamp in milliseconds
+            code: Currency to fetch, or None for all currencies at once
+        """
+        while since < until:
+            movements = self._call(method, code, since=since, limit=DEFAULT_PAGE_LIMIT)
+            movements = sorted(movements, key=lambda movement: movement["timestamp"])
+            yield from (movement for movement in movements if movement["timestamp"] < until)
+            if len(movements) < DEFAULT_PAGE_LIMIT or movements[-1]["timestamp"] >= until:
+                return
+            since = movements[-1]["timestamp"] + 1
+
+    def get_movement_history(self, year: int) -> list[dict]:
+        """
+        Fetch the deposits and withdrawals of the account in a tax year.
+
+        Exchanges that need a currency for these queries are asked for every currency in the
+        account balance. Exchanges without the queries have no movements.
+
+        Args:
+            year: The year for which to fetch deposits and withdrawals.
+
+        Returns:
+            ccxt transaction structures sorted by timestamp
+        """
+        since, until = year_bounds_ms(year)
+        movements = []
+        for feature, method in (
+            ("fetchDeposits", "fetch_deposits"),
+            ("fetchWithdrawals", "fetch_withdrawals"),
+        ):
+            if not self.exchange.has.get(feature):
+                print(f"[{self.exchange_name}] {feature} is not supported, skipping")
+                continue
+            try:
+                movements.extend(self._iter_movements(method, since, until))
+            except ccxt.ArgumentsRequired:
+                for code in sorted(self._call("fetch_balance")["total"]):
+                    movements.extend(self._iter_movements(method, since, until, code))
+
+        print(f"Fetched {len(movements)} deposits and withdrawals for the year {year}.")
+        return self._merge(movements, movement_key)
+
     def get_available_markets(self) -> list[str]:
         """
         Get a list of available trading pairs/markets on the exchange.
@@ -119,7 +491,7 @@ class ExchangeInterface:
             List of trading pair symbols (e.g., ['BTC/USD', 'ETH/BTC'])
         """
         try:
-            markets = self.exchange.load_markets()
+            markets = self._call("load_markets")
             return list(markets.keys())
         except Exception as e:
             print(f"Error fetching markets: {e}")
@@ -136,7 +508,7 @@ class ExchangeInterface:
             Dictionary containing ticker information
         """
         try:
-            return self.exchange.fetch_ticker(symbol)
+            return self._call("fetch_ticker", symbol)
         except Exception as e:
             print(f"Error fetching ticker for {symbol}: {e}")
             raise
@@ -149,7 +521,7 @@ class ExchangeInterface:
             Dictionary mapping currency symbols to their balances
         """
         try:
-            balance = self.exchange.fetch_balance()
+            balance = self._call("fetch_balance")
             return {currency: amount for currency, amount in balance["total"].items() if amount > 0}
         except Exception as e:
             print(f"Error fetching balance: {e}")
@@ -0,0 +1,151 @@
+import json
+from collections.abc import Iterator
+from pathlib import Path
+
+DEFAULT_JOURNAL_DIR = Path.home() / "kryptorozliczator" / "journal"
+# Deposits and withdrawals are journaled next to the trades, under this account name
+MOVEMENTS_ACCOUNT = "movements"
+
+
+def trade_key(trade: dict) -> str:
+    """
+    Key used to deduplicate trades: the market and the exchange trade id, or the trade contents
+    if there is no id. Some exchanges (e.g. Binance) number trades per market.
+    """
+    if trade.get("id") is not None:
+        return f"{trade.get('symbol')}|{trade['id']}"
+    return "|".join(
+        str(trade.get(field)) for field in ("timestamp", "symbol", "side", "amount", "price")
+    )
+
+
+def movement_key(movement: dict) -> str:
+    """
+    Key used to deduplicate deposits and withdrawals: the type, the currency and the exchange
+    transaction id, or the movement contents if there is no id.
+    """
+    if movement.get("id") is not None:
+        return f"{movement.get('type')}|{movement.get('currency')}|{movement['id']}"
+    return "|".join(
+        str(movement.get(field)) for field in ("timestamp", "type", "currency", "amount", "txid")
+    )
+
+
+def journaled_exchanges(base_dir: str | Path = DEFAULT_JOURNAL_DIR) -> list[str]:
+    """
+    Names of the exchanges that have a local trade journal.
+    """
+    directory = Path(base_dir).expanduser()
+    if not directory.exists():
+        return []
+    return sorted(path.name for path in directory.iterdir() if path.is_dir())
+
+
+class TradeJournal:
+    def __init__(
+        self,
+        exchange_name: str,
+        account: str = "default",
+        base_dir: str | Path = DEFAULT_JOURNAL_DIR,
+    ):
+        """
+        Local append-only journal of trades fetched from one exchange account.
+
+        Trades are stored one JSON object per line and deduplicated by trade_key (by
+        movement_key in the MOVEMENTS_ACCOUNT journal of deposits and withdrawals). Next to the
+        journal a small state file keeps the synced time range: `synced_from` is the earliest
+        timestamp the journal is complete from and `watermark` the latest fetched trade.
+
+        Args:
+            exchange_name: The CCXT exchange ID
+            account: Name of the account, for several API keys on one exchange
+            base_dir: Directory holding the journals
+        """
+        self.exchange_name = exchange_name
+        self.account = account
+        directory = Path(base_dir).expanduser() / exchange_name
+        directory.mkdir(parents=True, exist_ok=True)
+        self.trades_path = directory / f"{account}.jsonl"
+        self.state_path = directory / f"{account}.state.json"
+        self._key = movement_key if account == MOVEMENTS_ACCOUNT else trade_key
+        self._keys: set[str] | None = None
+
+        if self.state_path.exists():
+            state = json.loads(self.state_path.read_text())
+        else:
+            state = {}
+        self.synced_from: int | None = state.get("synced_from")
+        self.watermark: int | None = state.get("watermark")
+
+    def _load_keys(self) -> set[str]:
+        if self._keys is None:
+            self._keys = {self._key(trade) for trade in self.trades()}
+        return self._keys
+
+    def _save_state(self):
+        state = {"synced_from": self.synced_from, "watermark": self.watermark}
+        temporary_path = self.state_path.with_suffix(".tmp")
+        temporary_path.write_text(json.dumps(state))
+        temporary_path.replace(self.state_path)
+
+    def append(self, trades: list[dict]) -> int:
+        """
+        Append trades that are not in the journal yet.
+
+        Returns:
+            Number of trades actually added
+        """
+        keys = self._load_keys()
+        added = 0
+        with open(self.trades_path, "a") as f:
+            for trade in trades:
+                key = self._key(trade)
+                if key in keys:
+                    continue
+                keys.add(key)
+                f.write(json.dumps(trade, default=str) + "\n")
+                added += 1
+        return added
+
+    def mark_synced(self, since: int, until: int | None):
+        """
+        Record that all trades between `since` and `until` (ms timestamps) are in the journal.
+        """
+        if self.synced_from is None or since < self.synced_from:
+            self.synced_from = since
+        if until is not None and (self.watermark is None or until > self.watermark):
+            self.watermark = until
+        self._save_state()
+
+    def iter_pages(
+        self, since: int | None = None, until: int | None = None, page_size: int = 10_000
+    ) -> Iterator[list[dict]]:
+        """
+        Stream journaled trades with since <= timestamp < until in pages, in journal order.
+        """
+        if not self.trades_path.exists():
+            return
+
+        page = []
+        with open(self.trades_path) as f:
+            for line in f:
+                trade = json.loads(line)
+                timestamp = trade["timestamp"]
+                if since is not None and timestamp < since:
+                    continue
+                if until is not None and timestamp >= until:
+                    continue
+                page.append(trade)
+                if len(page) >= page_size:
+                    yield page
+                    page = []
+        if page:
+            yield page
+
+    def trades(self, since: int | None = None, until: int | None = None) -> list[dict]:
+        """
+        Read journaled trades with since <= timestamp < until, sorted by timestamp.
+        """
+        trades = [trade for page in self.iter_pages(since, until) for trade in page]
+        trades.sort(key=lambda trade: trade["timestamp"])
+        return trades
@@ -0,0 +1,320 @@
+import sys
+import threading
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+SIDE_BUY = 1
+SIDE_SELL = -1
+SIDE_NAMES = {SIDE_BUY: "buy", SIDE_SELL: "sell"}
+SIDE_CODES = {name: code for code, name in SIDE_NAMES.items()}
+
+# Currency and exchange names are stored as small integer codes shared by all batches
+_code_lock = threading.Lock()
+_codes: dict[str, int] = {}
+_names: list[str] = []
+
+
+def code_of(name: str | None) -> int:
+    """
+    Integer code of an interned currency or exchange name (-1 for None).
+    """
+    if name is None:
+        return -1
+    code = _codes.get(name)
+    if code is None:
+        with _code_lock:
+            code = _codes.get(name)
+            if code is None:
+                code = len(_names)
+                _names.append(sys.intern(name))
+                _codes[_names[code]] = code
+    return code
+
+
+def name_of(code: int) -> str | None:
+    return _names[code] if code >= 0 else None
+
+
+def _fee(trade: dict) -> tuple[float, str | None]:
+    fee = trade.get("fee") or {}
+    cost = fee.get("cost")
+    return (float(cost) if cost is not None else 0.0), fee.get("currency")
+
+
+def _float(value) -> float:
+    return float(value) if value is not None else np.nan
+
+
+@dataclass(slots=True)
+class TradeRecord:
+    """
+    A single exchange trade in canonical, compact form.
+
+    Currency and exchange names are interned, the timestamp is an integer in milliseconds
+    and the fee is flattened into fee_cost and fee_currency. The raw ccxt payload is only
+    kept when asked for.
+    """
+
+    id: str | None
+    exchange: str
+    timestamp: int
+    base: str
+    quote: str
+    side: str
+    price: float
+    amount: float
+    cost: float
+    fee_cost: float = 0.0
+    fee_currency: str | None = None
+    raw: dict | None = field(default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.exchange = sys.intern(self.exchange)
+        self.base = sys.intern(self.base)
+        self.quote = sys.intern(self.quote)
+        self.side = sys.intern(self.side)
+        if self.fee_currency is not None:
+            self.fee_currency = sys.intern(self.fee_currency)
+
+    @classmethod
+    def from_ccxt(cls, trade: dict, exchange_name: str, keep_raw: bool = False) -> "TradeRecord":
+        """
+        Build a record from a ccxt trade dict.
+
+        Args:
+            trade: Trade as returned by ccxt fetch_my_trades
+            exchange_name: The CCXT exchange ID the trade comes from
+            keep_raw: Keep the whole ccxt dict (with its `info` payload) in `raw`
+        """
+        base, _, quote = trade["symbol"].partition("/")
+        fee_cost, fee_currency = _fee(trade)
+        return cls(
+            id=str(trade["id"]) if trade.get("id") is not None else None,
+            exchange=exchange_name,
+            timestamp=int(trade["timestamp"]),
+            base=base,
+            quote=quote,
+            side=trade["side"],
+            price=_float(trade.get("price")),
+            amount=_float(trade.get("amount")),
+            cost=_float(trade.get("cost")),
+            fee_cost=fee_cost,
+            fee_currency=fee_currency,
+            raw=trade if keep_raw else None,
+        )
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in TradeBatch.COLUMNS}
+
+
+class TradeBatch:
+    COLUMNS = (
+        "id",
+        "exchange",
+        "timestamp",
+        "base",
+        "quote",
+        "side",
+        "price",
+        "amount",
+        "cost",
+        "fee_cost",
+        "fee_currency",
+    )
+    CODE_COLUMNS = ("exchange", "base", "quote", "fee_currency")
+    # Stored as float64: meme coin fills (1e11 units and more) do not fit int64 fixed-point
+    # units, exact arithmetic starts in the tax engine, on fiat values only
+    FLOAT_COLUMNS = ("price", "amount", "cost", "fee_cost")
+
+    def __init__(self, columns: dict[str, np.ndarray], raw: list[dict] | None = None):
+        """
+        Columnar batch of trades backed by NumPy arrays.
+
+        Names are stored as int16 codes (see code_of), sides as int8 (+1 buy, -1 sell),
+        timestamps as int64 milliseconds and prices and amounts as float64 (missing values
+        become 0). Ids stay Python strings.
+
+        Args:
+            columns: Arrays for every name in COLUMNS
+            raw: Optional raw ccxt dicts aligned with the rows
+        """
+        self.columns = columns
+        self.raw = raw
+
+    def __len__(self) -> int:
+        return len(self.columns["timestamp"])
+
+    def __getstate__(self) -> dict:
+        # Name codes are only valid in this process, so the names travel with the batch
+        return {"columns": self.columns, "raw": self.raw, "names": list(_names)}
+
+    def __setstate__(self, state: dict):
+        remap = np.array([code_of(name) for name in state["names"]] + [-1], dtype=np.int16)
+        self.columns = dict(state["columns"])
+        for name in self.CODE_COLUMNS:
+            self.columns[name] = remap[self.columns[name]]
+        self.raw = state["raw"]
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    @classmethod
+    def from_ccxt(
+        cls, trades: Iterable[dict], exchange_name: str, keep_raw: bool = False
+    ) -> "TradeBatch":
+        """
+        Build a batch from ccxt trade dicts in a single pass.
+
+        Args:
+            trades: Trades as returned by ccxt fetch_my_trades
+            exchange_name: The CCXT exchange ID the trades come from
+            keep_raw: Keep the ccxt dicts (with their `info` payloads) in `raw`
+        """
+        trades = list(trades)
+        exchange_code = code_of(exchange_name)
+        symbol_codes: dict[str, tuple[int, int]] = {}
+        columns: dict[str, list] = {name: [] for name in cls.COLUMNS}
+        for trade in trades:
+            symbol = trade["symbol"]
+            if symbol not in symbol_codes:
+                base, _, quote = symbol.partition("/")
+                symbol_codes[symbol] = (code_of(base), code_of(quote))
+            base_code, quote_code = symbol_codes[symbol]
+            fee_cost, fee_currency = _fee(trade)
+            columns["id"].append(str(trade["id"]) if trade.get("id") is not None else None)
+            columns["timestamp"].append(trade["timestamp"])
+            columns["base"].append(base_code)
+            columns["quote"].append(quote_code)
+            columns["side"].append(SIDE_CODES.get(trade["side"], 0))
+            columns["price"].append(_float(trade.get("price")))
+            columns["amount"].append(_float(trade.get("amount")))
+            columns["cost"].append(_float(trade.get("cost")))
+            columns["fee_cost"].append(fee_cost)
+            columns["fee_currency"].append(code_of(fee_currency))
+        columns["exchange"] = [exchange_code] * len(trades)
+        return cls(cls._arrays(columns), raw=trades if keep_raw else None)
+
+    @classmethod
+    def from_records(cls, records: Iterable[TradeRecord]) -> "TradeBatch":
+        records = list(records)
+        columns: dict[str, list] = {name: [] for name in cls.COLUMNS}
+        for record in records:
+            for name in cls.COLUMNS:
+                value = getattr(record, name)
+                if name in cls.CODE_COLUMNS:
+                    value = code_of(value)
+                elif name == "side":
+                    value = SIDE_CODES.get(value, 0)
+                columns[name].append(value)
+        raw = [record.raw for record in records] if any(r.raw for r in records) else None
+        return cls(cls._arrays(columns), raw=raw)
+
+    @classmethod
+    def _arrays(cls, columns: dict[str, list]) -> dict[str, np.ndarray]:
+        arrays = {
+            "id": np.array(columns["id"], dtype=object),
+            "timestamp": np.array(columns["timestamp"], dtype=np.int64),
+            "side": np.array(columns["side"], dtype=np.int8),
+        }
+        for name in cls.CODE_COLUMNS:
+            arrays[name] = np.array(columns[name], dtype=np.int16)
+        for name in cls.FLOAT_COLUMNS:
+            arrays[name] = np.nan_to_num(np.array(columns[name], dtype=np.float64))
+        return arrays
+
+    @classmethod
+    def concat(cls, batches: Iterable["TradeBatch"]) -> "TradeBatch":
+        batches = list(batches)
+        if not batches:
+            return cls(cls._arrays({name: [] for name in cls.COLUMNS}))
+        columns = {
+            name: np.concatenate([batch.columns[name] for batch in batches]) for name in cls.COLUMNS
+        }
+        raw = None
+        if all(batch.raw is not None for batch in batches):
+            raw = [trade for batch in batches for trade in batch.raw]
+        return cls(columns, raw=raw)
+
+    def select(self, mask: np.ndarray) -> "TradeBatch":
+        """
+        Rows of the batch where `mask` is True (or at the given positions).
+        """
+        columns = {name: values[mask] for name, values in self.columns.items()}
+        raw = None
+        if self.raw is not None:
+            raw = [self.raw[i] for i in np.arange(len(self))[mask]]
+        return type(self)(columns, raw=raw)
+
+    def records(self) -> list[TradeRecord]:
+        return [
+            TradeRecord(
+                id=self.columns["id"][i],
+                exchange=name_of(self.columns["exchange"][i]),
+                timestamp=int(self.columns["timestamp"][i]),
+                base=name_of(self.columns["base"][i]),
+                quote=name_of(self.columns["quote"][i]),
+                side=SIDE_NAMES.get(int(self.columns["side"][i]), "unknown"),
+                price=float(self.columns["price"][i]),
+                amount=float(self.columns["amount"][i]),
+                cost=float(self.columns["cost"][i]),
+                fee_cost=float(self.columns["fee_cost"][i]),
+                fee_currency=name_of(self.columns["fee_currency"][i]),
+                raw=self.raw[i] if self.raw is not None else None,
+            )
+            for i in range(len(self))
+        ]
+
+    def to_dicts(self) -> list[dict]:
+        return [record.as_dict() for record in self.records()]
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Convert the batch into a DataFrame with the columns used by the tax engine.
+
+        Name columns become categoricals sharing one category list, so they stay compact and
+        can be compared with each other.
+        """
+        categories = pd.Index(list(_names), dtype=object)
+        side = self.columns["side"]
+        frame = {
+            "id": self.columns["id"],
+            "timestamp": self.columns["timestamp"],
+            "side": pd.Categorical.from_codes(
+                np.select([side == SIDE_BUY, side == SIDE_SELL], [0, 1], default=-1),
+                categories=["buy", "sell"],
+            ),
+        }
+        for name in self.CODE_COLUMNS:
+            frame[name] = pd.Categorical.from_codes(self.columns[name], categories=categories)
+        for name in self.FLOAT_COLUMNS:
+            frame[name] = self.columns[name]
+        return pd.DataFrame(frame, columns=list(self.COLUMNS))
+
+    def to_arrow(self):
+        """
+        Convert the batch into a pyarrow Table with dictionary-encoded name columns.
+
+        Requires the optional pyarrow package.
+        """
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError("pyarrow is required to convert trades to Arrow") from e
+
+        names = pa.array(_names, type=pa.string())
+        arrays = {
+            "id": pa.array(self.columns["id"], type=pa.string()),
+            "timestamp": pa.array(self.columns["timestamp"], type=pa.int64()),
+            "side": pa.array(self.columns["side"], type=pa.int8()),
+        }
+        for name in self.CODE_COLUMNS:
+            codes = self.columns[name]
+            arrays[name] = pa.DictionaryArray.from_arrays(
+                pa.array(codes, mask=codes < 0, type=pa.int16()), names
+            )
+        for name in self.FLOAT_COLUMNS:
+            arrays[name] = pa.array(self.columns[name], type=pa.float64())
+        return pa.table({name: arrays[name] for name in self.COLUMNS})
@@ -0,0 +1,38 @@
+import json
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from kryptorozliczator.exchange_interfaces.trade_record import TradeBatch, TradeRecord
+
+
+class SpilledPages:
+    def __init__(self, path: str | Path):
+        """
+        Trade batches spilled to disk, one JSON array per line, readable back batch by batch.
+
+        Args:
+            path: File the pages are written to
+        """
+        self.path = Path(path).expanduser()
+
+    def write(self, pages: Iterable[TradeBatch]) -> int:
+        """
+        Write trade batches to the file, replacing its previous content.
+
+        Returns:
+            Number of trades written
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        count = 0
+        with open(self.path, "w") as f:
+            for page in pages:
+                f.write(json.dumps(page.to_dicts(), default=str) + "\n")
+                count += len(page)
+        return count
+
+    def __iter__(self) -> Iterator[TradeBatch]:
+        if not self.path.exists():
+            return
+        with open(self.path) as f:
+            for line in f:
+                yield TradeBatch.from_records(TradeRecord(**trade) for trade in json.loads(line))
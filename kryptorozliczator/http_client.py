@@ -0,0 +1,247 @@
+"""
+Shared HTTP client of the rate and wallet providers.
+
+One keep-alive session per host, timeouts on every request, jittered exponential backoff on
+429 and 5xx responses and connection errors (honoring Retry-After), and conditional requests
+that revalidate cached responses with ETag / Last-Modified.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from urllib.parse import urlencode, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from kryptorozliczator.instrumentation import instrumentation
+from kryptorozliczator.throttling import TokenBucket, call_with_backoff
+
+DEFAULT_HTTP_CACHE_PATH = (
+    Path(os.getenv("KRYPTOROZLICZATOR_CACHE_DIR", Path.home() / "kryptorozliczator" / "cache"))
+    / "http.sqlite"
+)
+REQUEST_TIMEOUT_SECONDS = 30
+MAX_RETRIES = 5
+POOL_SIZE = 8
+HTTP_OK = 200
+HTTP_NOT_MODIFIED = 304
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class RetryableHTTPError(requests.HTTPError):
+    def __init__(self, response: requests.Response):
+        """
+        A 429 or 5xx response, retried with backoff; `retry_after` is the server's wish.
+        """
+        super().__init__(
+            f"HTTP {response.status_code} from {urlparse(response.url).netloc}", response=response
+        )
+        self.retry_after = _retry_after_seconds(response.headers.get("Retry-After"))
+
+
+def _retry_after_seconds(value: str | None) -> float | None:
+    """
+    Seconds to wait from a Retry-After header, given in seconds or as an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ResponseCache:
+    def __init__(self, path: str | Path | None = DEFAULT_HTTP_CACHE_PATH):
+        """
+        Bodies of GET responses with their ETag and Last-Modified validators, in SQLite.
+
+        Args:
+            path: Location of the SQLite file, or None for a memory-only cache
+        """
+        self._lock = threading.Lock()
+        if path is not None:
+            path = Path(path).expanduser()
+            path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(
+            str(path) if path is not None else ":memory:", check_same_thread=False, timeout=30
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " url TEXT PRIMARY KEY,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " body BLOB NOT NULL"
+            ")"
+        )
+        self._db.commit()
+        self.revalidated = 0
+        self.refreshed = 0
+
+    def get(self, url: str) -> tuple[str | None, str | None, bytes] | None:
+        with self._lock:
+            return self._db.execute(
+                "SELECT etag, last_modified, body FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+
+    def put(self, url: str, etag: str | None, last_modified: str | None, body: bytes):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (url, etag, last_modified, body),
+            )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        checks = self.revalidated + self.refreshed
+        return {
+            "not_modified": self.revalidated,
+            "refreshed": self.refreshed,
+            "hit_ratio": self.revalidated / checks if checks else 0.0,
+        }
+
+
+class HttpClient:
+    def __init__(
+        self,
+        timeout: float = REQUEST_TIMEOUT_SECONDS,
+        max_retries: int = MAX_RETRIES,
+        pool_size: int = POOL_SIZE,
+        response_cache: ResponseCache | None = None,
+    ):
+        """
+        HTTP client with pooled keep-alive sessions per host and a retry policy.
+
+        Args:
+            timeout: Connect and read timeout of every request in seconds
+            max_retries: Retries of 429/5xx responses and connection errors
+            pool_size: Connections kept open per host, e.g. the number of parallel scans
+            response_cache: Store for conditional requests, created on first use by default
+        """
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self._response_cache = response_cache
+        self._sessions: dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def response_cache(self) -> ResponseCache:
+        with self._lock:
+            if self._response_cache is None:
+                self._response_cache = ResponseCache()
+                instrumentation.register_cache("http", self._response_cache.stats)
+            return self._response_cache
+
+    def session(self, url: str) -> requests.Session:
+        """
+        Keep-alive session of the host of a URL.
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.hooks["response"].append(instrumentation.response_hook)
+                self._sessions[host] = session
+            return self._sessions[host]
+
+    def get(
+        self,
+        url: str,
+        params: dict | None = None,
+        rate_limiter: TokenBucket | None = None,
+        revalidate: bool = False,
+    ) -> requests.Response:
+        """
+        GET a URL, retrying 429/5xx responses and connection errors with backoff.
+
+        Other error statuses (e.g. 404) are returned to the caller, which knows what they mean.
+
+        Args:
+            url: URL to get
+            params: Query parameters
+            rate_limiter: Token bucket to acquire before every attempt
+            revalidate: Keep the response with its ETag/Last-Modified and revalidate it on the
+                next request; a 304 answer is served from the cache as a 200 response
+
+        Returns:
+            The response
+
+        Raises:
+            RetryableHTTPError: If the server still answers 429/5xx after all retries
+            requests.RequestException: If the connection keeps failing
+        """
+        session = self.session(url)
+        cache_key = f"{url}?{urlencode(sorted((params or {}).items()))}"
+        cached = self.response_cache.get(cache_key) if revalidate else None
+        headers = {}
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        def attempt() -> requests.Response:
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            response = session.get(url, params=params, headers=headers, timeout=self.timeout)
+            if response.status_code in RETRY_STATUSES:
+                raise RetryableHTTPError(response)
+            return response
+
+        def on_retry(error, delay):
+            instrumentation.record_retry(urlparse(url).netloc, delay)
+
+        response = call_with_backoff(
+            attempt,
+            retry_on=(RetryableHTTPError, requests.ConnectionError, requests.Timeout),
+            max_retries=self.max_retries,
+            on_retry=on_retry,
+        )
+
+        if revalidate:
+            if response.status_code == HTTP_NOT_MODIFIED and cached is not None:
+                self.response_cache.revalidated += 1
+                # A 304 has no body; hand out the cached one as if the server had sent it
+                response.status_code = HTTP_OK
+                response._content = cached[2]
+            elif response.status_code == HTTP_OK:
+                self.response_cache.refreshed += 1
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+                if etag or last_modified:
+                    self.response_cache.put(cache_key, etag, last_modified, response.content)
+        return response
+
+    def get_json(
+        self,
+        url: str,
+        params: dict | None = None,
+        rate_limiter: TokenBucket | None = None,
+        revalidate: bool = False,
+    ):
+        """
+        GET a JSON document, see `get`.
+
+        Raises:
+            requests.HTTPError: If the final response has an error status
+        """
+        response = self.get(url, params, rate_limiter, revalidate)
+        response.raise_for_status()
+        return response.json()
+
+
+http_client = HttpClient()
@@ -0,0 +1,251 @@
+"""
+Run instrumentation: stage timers, HTTP counters, retry and wait totals and cache statistics.
+
+All counters live in the module-level `instrumentation` object, which the exchange, wallet and
+rate modules report to. At the end of a run `instrumentation.report()` returns everything as
+a JSON-serializable dictionary; the command line writes it with `--report`.
+"""
+
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from urllib.parse import urlparse
+
+# Upper bounds of the latency histogram buckets in milliseconds; slower requests go to "inf"
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+HTTP_ERROR_STATUS = 400
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+
+
+@dataclass
+class LatencyHistogram:
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    buckets: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1))
+
+    def add(self, milliseconds: float):
+        self.count += 1
+        self.total_ms += milliseconds
+        self.max_ms = max(self.max_ms, milliseconds)
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, milliseconds)] += 1
+
+    def as_dict(self) -> dict:
+        labels = [f"<={bound}" for bound in LATENCY_BUCKETS_MS] + ["inf"]
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "max_ms": self.max_ms,
+            "buckets": dict(zip(labels, self.buckets, strict=True)),
+        }
+
+
+@dataclass
+class HostStats:
+    requests: int = 0
+    errors: int = 0
+    bytes_received: int = 0
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "latency": self.latency.as_dict()}
+
+
+@dataclass
+class RetryStats:
+    retries: int = 0
+    backoff_seconds: float = 0.0
+
+
+class Instrumentation:
+    def __init__(self):
+        """
+        Thread-safe collector of the measurements of one run.
+        """
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Start a new run, dropping everything measured so far.
+        """
+        with self._lock:
+            self.started_at = time.time()
+            self._started_wall = time.perf_counter()
+            self._started_cpu = time.process_time()
+            self.stages: dict[str, StageStats] = {}
+            self.hosts: dict[str, HostStats] = {}
+            self.retries: dict[str, RetryStats] = {}
+            self.rate_limit_waits: dict[str, float] = {}
+            self.caches: dict[str, Callable[[], dict]] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time a block as a stage. Repeated and nested stages are all recorded.
+
+        CPU time is the process CPU time, so with threads running it includes their work too.
+        """
+        started_wall = time.perf_counter()
+        started_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - started_wall
+            cpu = time.process_time() - started_cpu
+            with self._lock:
+                stats = self.stages.setdefault(name, StageStats())
+                stats.calls += 1
+                stats.wall_seconds += wall
+                stats.cpu_seconds += cpu
+
+    def record_request(self, url: str, status: int, size: int, seconds: float):
+        host = urlparse(url).netloc or url
+        with self._lock:
+            stats = self.hosts.setdefault(host, HostStats())
+            stats.requests += 1
+            stats.errors += status >= HTTP_ERROR_STATUS
+            stats.bytes_received += size
+            stats.latency.add(seconds * 1000)
+
+    def response_hook(self, response, *args, **kwargs):
+        """
+        requests response hook recording the host, status, size and latency of a response.
+
+        Use as `session.hooks["response"].append(instrumentation.response_hook)` or pass
+        `hooks={"response": instrumentation.response_hook}` to a request.
+        """
+        self.record_request(
+            response.url,
+            response.status_code,
+            len(response.content),
+            response.elapsed.total_seconds(),
+        )
+
+    def record_retry(self, source: str, delay: float):
+        with self._lock:
+            stats = self.retries.setdefault(source, RetryStats())
+            stats.retries += 1
+            stats.backoff_seconds += delay
+
+    def record_wait(self, source: str, seconds: float):
+        with self._lock:
+            self.rate_limit_waits[source] = self.rate_limit_waits.get(source, 0.0) + seconds
+
+    def register_cache(self, name: str, stats: Callable[[], dict]):
+        """
+        Register a function returning the statistics of a cache, read when reporting.
+        """
+        with self._lock:
+            self.caches[name] = stats
+
+    def report(self) -> dict:
+        """
+        Everything measured since the last reset, as a JSON-serializable dictionary.
+
+        `network_seconds` adds up the latency of all requests (concurrent requests overlap, so
+        it can exceed the wall time). `bound` is "network" when requests, rate limit waits and
+        backoff took longer than the CPU time of the process, otherwise "compute".
+        """
+        with self._lock:
+            wall = time.perf_counter() - self._started_wall
+            cpu = time.process_time() - self._started_cpu
+            network = sum(stats.latency.total_ms for stats in self.hosts.values()) / 1000
+            waits = sum(self.rate_limit_waits.values())
+            backoff = sum(stats.backoff_seconds for stats in self.retries.values())
+            return {
+                "started_at": self.started_at,
+                "wall_seconds": wall,
+                "cpu_seconds": cpu,
+                "network_seconds": network,
+                "rate_limit_wait_seconds": waits,
+                "backoff_seconds": backoff,
+                "bound": "network" if network + waits + backoff > cpu else "compute",
+                "stages": {name: asdict(stats) for name, stats in self.stages.items()},
+                "http": {host: stats.as_dict() for host, stats in self.hosts.items()},
+                "retries": {name: asdict(stats) for name, stats in self.retries.items()},
+                "rate_limit_waits": dict(self.rate_limit_waits),
+                "caches": {name: stats() for name, stats in self.caches.items()},
+            }
+
+    def write_report(self, path: str | Path):
+        path = Path(path).expanduser()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.report(), indent=2, default=str))
+
+    def summary(self) -> str:
+        """
+        One line per stage and host, for printing at the end of a run.
+        """
+        report = self.report()
+        lines = [
+            f"Run: {report['wall_seconds']:.2f} s wall, {report['cpu_seconds']:.2f} s CPU, "
+            f"{report['network_seconds']:.2f} s in requests, "
+            f"{report['rate_limit_wait_seconds']:.2f} s rate limit waits ({report['bound']}-bound)"
+        ]
+        for name, stats in report["stages"].items():
+            lines.append(
+                f"  {name}: {stats['wall_seconds']:.2f} s wall, {stats['cpu_seconds']:.2f} s CPU"
+            )
+        for host, stats in report["http"].items():
+            lines.append(
+                f"  {host}: {stats['requests']} requests, {stats['errors']} errors, "
+                f"{stats['bytes_received']} bytes, {stats['latency']['mean_ms']:.0f} ms mean"
+            )
+        return "\n".join(lines)
+
+
+instrumentation = Instrumentation()
+
+
+@contextmanager
+def profiled(path: str | Path, profiler: str = "cprofile") -> Iterator[None]:
+    """
+    Profile a block with cProfile (stats file for pstats/snakeviz) or pyinstrument (HTML).
+
+    pyinstrument is optional and only imported when selected.
+
+    Raises:
+        ValueError: If the profiler is not one of PROFILERS
+        ImportError: If pyinstrument is selected but not installed
+    """
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler '{profiler}', expected one of {PROFILERS}")
+    path = Path(path).expanduser()
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    if profiler == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError as e:
+            raise ImportError("pyinstrument profiling needs `pip install pyinstrument`") from e
+        sampler = Profiler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            path.write_text(sampler.output_html())
+        return
+
+    import cProfile
+
+    deterministic = cProfile.Profile()
+    deterministic.enable()
+    try:
+        yield
+    finally:
+        deterministic.disable()
+        deterministic.dump_stats(path)
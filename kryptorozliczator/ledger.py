@@ -0,0 +1,251 @@
+import hashlib
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from kryptorozliczator.exchange_interfaces.trade_record import TradeBatch
+from kryptorozliczator.instrumentation import instrumentation
+from kryptorozliczator.pipeline import frame_digest
+from kryptorozliczator.rates.nbp_tables import NbpRateTable
+from kryptorozliczator.rates.rate_provider import RateProvider
+from kryptorozliczator.reconciliation import exclude_internal, internal_transfers
+from kryptorozliczator.settlement import (
+    DEFAULT_DATA_DIR,
+    SettlementResult,
+    load_journal_movements,
+    load_journal_trades,
+    output_dir_for,
+    read_spending,
+    settle_year,
+    spending_in_year,
+    value_spending,
+    write_outputs,
+)
+from kryptorozliczator.tax.pit38 import FIAT_CURRENCY_SYMBOLS, Pit38, trade_days
+
+DEFAULT_LEDGER_PATH = DEFAULT_DATA_DIR / "ledger.json"
+# Bump to discard stored years after changing how a year is computed
+LEDGER_VERSION = 1
+
+
+def tax_years(timestamps) -> np.ndarray:
+    """
+    Tax year of every millisecond UTC timestamp, in the tax timezone.
+    """
+    return trade_days(timestamps).astype("datetime64[Y]").astype(np.int64) + 1970
+
+
+def year_digest(trades: TradeBatch, spending: pd.DataFrame | None) -> str:
+    """
+    Digest of the trades and spending records of one tax year.
+    """
+    parts = [frame_digest(trades.to_frame())]
+    if spending is not None:
+        parts.append(frame_digest(spending))
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+@dataclass
+class YearLedger:
+    """
+    Settlement of one year in the multi-year ledger.
+
+    Attributes:
+        year: Tax year
+        digest: Digest of the trades and spending of the year
+        total_buy_cost_pln: Purchase costs in PLN
+        total_sell_revenue_pln: Revenue from sales and spending in PLN
+        total_fee_pln: Fees in PLN
+        pit38: PIT-38 fields 34-38, with field 36 carried over from field 38 of the year before
+        recomputed: Whether the year was computed in this run or loaded from the ledger file
+    """
+
+    year: int
+    digest: str
+    total_buy_cost_pln: float
+    total_sell_revenue_pln: float
+    total_fee_pln: float
+    pit38: Pit38
+    recomputed: bool = field(default=False, compare=False)
+
+    @classmethod
+    def from_result(cls, year: int, digest: str, result: SettlementResult) -> "YearLedger":
+        return cls(
+            year=year,
+            digest=digest,
+            total_buy_cost_pln=result.total_buy_cost_pln,
+            total_sell_revenue_pln=result.total_sell_revenue_pln,
+            total_fee_pln=result.total_fee_pln,
+            pit38=result.pit38,
+            recomputed=True,
+        )
+
+    def as_dict(self) -> dict:
+        entry = asdict(self)
+        del entry["recomputed"]
+        return entry
+
+    @classmethod
+    def from_dict(cls, entry: dict) -> "YearLedger":
+        return cls(**{**entry, "pit38": Pit38(**entry["pit38"])})
+
+
+@dataclass
+class LedgerParams:
+    """
+    Parameters of a multi-year settlement.
+
+    Attributes:
+        first_year: First tax year of the ledger
+        last_year: Last tax year of the ledger
+        exchanges: CCXT exchange IDs with trade journals
+        spending_csv: Wallet CSV export with purchases paid in crypto, covering all years
+        opening_costs: Unsettled costs from before `first_year` (field 36 of the first year)
+        offline: Use cached rates only
+        fiat_currencies: Currencies whose pairs affect the tax
+        valuation_interval: Candle interval of the spending valuation, '1d', '1h' or '1m'
+    """
+
+    first_year: int
+    last_year: int
+    exchanges: list[str]
+    spending_csv: Path | None = None
+    opening_costs: float = 0.0
+    offline: bool = False
+    fiat_currencies: frozenset[str] = FIAT_CURRENCY_SYMBOLS
+    valuation_interval: str = "1d"
+
+    def ledger_key(self) -> dict:
+        """
+        Parameters every stored year depends on; a change invalidates the whole ledger.
+        """
+        return {
+            "version": LEDGER_VERSION,
+            "first_year": self.first_year,
+            "opening_costs": self.opening_costs,
+            "exchanges": sorted(self.exchanges),
+            "fiat_currencies": sorted(self.fiat_currencies),
+            "valuation_interval": self.valuation_interval,
+        }
+
+
+def load_ledger(params: LedgerParams, ledger_path: Path) -> dict[int, YearLedger]:
+    """
+    Read the stored years of a ledger file, or nothing if it was computed with other parameters.
+    """
+    if not ledger_path.exists():
+        return {}
+    state = json.loads(ledger_path.read_text())
+    if state.get("key") != params.ledger_key():
+        return {}
+    return {int(year): YearLedger.from_dict(entry) for year, entry in state["years"].items()}
+
+
+def save_ledger(params: LedgerParams, years: dict[int, YearLedger], ledger_path: Path):
+    ledger_path.parent.mkdir(parents=True, exist_ok=True)
+    state = {
+        "key": params.ledger_key(),
+        "years": {str(year): entry.as_dict() for year, entry in sorted(years.items())},
+    }
+    temporary_path = ledger_path.with_suffix(".tmp")
+    temporary_path.write_text(json.dumps(state, indent=2))
+    temporary_path.replace(ledger_path)
+
+
+def run_ledger(
+    params: LedgerParams,
+    ledger_path: Path = DEFAULT_LEDGER_PATH,
+    write_year_outputs: bool = True,
+) -> list[YearLedger]:
+    """
+    Settle all years from `first_year` to `last_year`, carrying unsettled costs forward.
+
+    The trade journals and the spending CSV are read once for the whole range and split into
+    years; spending transfers matching a journaled exchange deposit are internal and dropped.
+    Every year is settled in chronological order with field 38 of the previous year as its
+    field 36. Years before the earliest year whose records changed since the last run are
+    taken from the ledger file; that year and all later ones are recomputed, because their
+    carried costs may change.
+
+    Args:
+        params: Ledger parameters
+        ledger_path: JSON file keeping the settled years between runs
+        write_year_outputs: Write the CSV outputs of recomputed years to their output directory
+
+    Returns:
+        YearLedger of every year, in chronological order
+    """
+    if params.last_year < params.first_year:
+        raise ValueError(f"Last year {params.last_year} is before first year {params.first_year}")
+
+    trades = load_journal_trades(params.exchanges, params.first_year, params.last_year)
+    trade_years = tax_years(trades["timestamp"])
+    spending = None
+    if params.spending_csv is not None:
+        spending = read_spending(
+            params.spending_csv, first_year=params.first_year, last_year=params.last_year
+        )
+        movements = load_journal_movements(params.exchanges, params.first_year, params.last_year)
+        spending = exclude_internal(spending, internal_transfers(spending, movements))
+
+    stored = load_ledger(params, ledger_path)
+    rate_provider = RateProvider(offline=params.offline)
+    nbp_table = NbpRateTable(rate_provider.cache)
+
+    years = {}
+    carried_costs = params.opening_costs
+    changed = False
+    for year in range(params.first_year, params.last_year + 1):
+        year_trades = trades.select(trade_years == year)
+        year_spending = spending_in_year(spending, year) if spending is not None else None
+        digest = year_digest(year_trades, year_spending)
+
+        entry = stored.get(year)
+        changed = (
+            changed
+            or entry is None
+            or entry.digest != digest
+            or entry.pit38.prior_years_costs != carried_costs
+        )
+        if not changed:
+            years[year] = entry
+            print(f"[{year}] Unchanged, loaded from ledger")
+        else:
+            with instrumentation.stage(f"ledger.{year}"):
+                nbp_table.load_year(year, params.fiat_currencies)
+                valued_spending = None
+                if year_spending is not None and len(year_spending):
+                    valued_spending = value_spending(
+                        year_spending, rate_provider, params.valuation_interval
+                    )
+                result = settle_year(
+                    year_trades, valued_spending, nbp_table, carried_costs, params.fiat_currencies
+                )
+            years[year] = YearLedger.from_result(year, digest, result)
+            print(f"[{year}] Settled {len(year_trades)} trades")
+            if write_year_outputs:
+                write_outputs(result, output_dir_for(year))
+        carried_costs = years[year].pit38.unsettled_costs
+
+    save_ledger(params, {**stored, **years}, ledger_path)
+    return list(years.values())
+
+
+def ledger_frame(years: list[YearLedger]) -> pd.DataFrame:
+    """
+    PIT-38 fields 34-38 of every year of the ledger, one row per year.
+    """
+    return pd.DataFrame(
+        {
+            "Rok": [entry.year for entry in years],
+            "Przychód (34)": [entry.pit38.revenue for entry in years],
+            "Koszty (35)": [entry.pit38.costs for entry in years],
+            "Koszty z lat ubiegłych (36)": [entry.pit38.prior_years_costs for entry in years],
+            "Dochód (37)": [entry.pit38.income for entry in years],
+            "Koszty do przeniesienia (38)": [entry.pit38.unsettled_costs for entry in years],
+            "Przeliczony": [entry.recomputed for entry in years],
+        }
+    )
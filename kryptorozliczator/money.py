@@ -0,0 +1,155 @@
+"""
+Fixed-point money arithmetic.
+
+Amounts are integers in minor units: grosze for PLN (and cents for other fiat currencies),
+satoshi or wei for single crypto amounts and 1e-8 units for crypto amounts in arrays. Rates
+are integers scaled by 10**RATE_DECIMALS. Products are rounded half away from zero, so sums
+of converted amounts are exact.
+"""
+
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+
+PLN_DECIMALS = 2
+FIAT_DECIMALS = 2
+RATE_DECIMALS = 8
+# Crypto amounts in arrays are kept with satoshi precision, which fits int64 for any balance
+AMOUNT_DECIMALS = 8
+ASSET_DECIMALS = {"BTC": 8, "ETH": 18}
+
+# Digits kept when snapping float inputs before rounding, to drop binary representation noise
+_SNAP_DECIMALS = 6
+_INT64_MAX = np.iinfo(np.int64).max
+
+
+def asset_decimals(currency: str) -> int:
+    """
+    Number of decimals of the base unit of a currency (8 for BTC, 18 for ETH, ...).
+    """
+    return ASSET_DECIMALS.get(currency.upper(), AMOUNT_DECIMALS)
+
+
+def to_units(value, decimals: int) -> int:
+    """
+    Exact conversion of a decimal amount (str, int, float or Decimal) to integer minor units.
+    """
+    return int(Decimal(str(value)).scaleb(decimals).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_units(units: int, decimals: int) -> Decimal:
+    return Decimal(units).scaleb(-decimals)
+
+
+def to_units_array(values, decimals: int) -> np.ndarray:
+    """
+    Vectorized conversion of float amounts to int64 minor units, rounding half away from zero.
+
+    Raises:
+        ValueError: If a value is not finite or does not fit into int64
+    """
+    scaled = np.asarray(values, dtype=np.float64) * 10.0**decimals
+    if not np.isfinite(scaled).all():
+        raise ValueError("Cannot convert NaN or infinite amounts to fixed-point units")
+    if scaled.size and np.abs(scaled).max() >= _INT64_MAX:
+        raise ValueError(f"Amounts too large for int64 units with {decimals} decimals")
+    # 1.005 * 100 is 100.49999999999999 in binary, snapping first gives the expected 101
+    scaled = np.round(scaled, _SNAP_DECIMALS)
+    return (np.sign(scaled) * np.floor(np.abs(scaled) + 0.5)).astype(np.int64)
+
+
+def from_units_array(units, decimals: int) -> np.ndarray:
+    return np.asarray(units, dtype=np.float64) / 10.0**decimals
+
+
+def _divide_rounded(values: np.ndarray, divisor: int) -> np.ndarray:
+    magnitude = np.abs(values)
+    quotient, remainder = np.divmod(magnitude, divisor)
+    quotient += 2 * remainder >= divisor
+    return np.where(values < 0, -quotient, quotient)
+
+
+def round_units(units, from_decimals: int, to_decimals: int) -> np.ndarray:
+    """
+    Change the number of decimals of int64 units, rounding half away from zero.
+    """
+    units = np.asarray(units, dtype=np.int64)
+    if to_decimals >= from_decimals:
+        factor = 10 ** (to_decimals - from_decimals)
+        if units.size and np.abs(units).max() > _INT64_MAX // factor:
+            raise ValueError(f"Amounts too large for int64 units with {to_decimals} decimals")
+        return units * factor
+    return _divide_rounded(units, 10 ** (from_decimals - to_decimals))
+
+
+def _mul_rate_exact(
+    amounts: np.ndarray, rates: np.ndarray, shift: int, rate_decimals: int
+) -> np.ndarray:
+    divisor = 10 ** (shift + rate_decimals)
+    results = []
+    for amount, rate in zip(amounts.tolist(), rates.tolist(), strict=True):
+        quotient, remainder = divmod(abs(amount * rate), divisor)
+        quotient += 2 * remainder >= divisor
+        results.append(-quotient if (amount < 0) != (rate < 0) else quotient)
+    if all(abs(result) <= _INT64_MAX for result in results):
+        return np.array(results, dtype=np.int64)
+    return np.array(results, dtype=object)
+
+
+def mul_rate(
+    amounts,
+    rates,
+    amount_decimals: int,
+    out_decimals: int = PLN_DECIMALS,
+    rate_decimals: int = RATE_DECIMALS,
+) -> np.ndarray:
+    """
+    Multiply fixed-point amounts by fixed-point rates, rounding half away from zero.
+
+    Both operands are split with divmod into their whole and fractional parts, so the partial
+    products stay within int64 even when the full product would not. Inputs whose partial
+    products still overflow fall back to exact Python integers.
+
+    Args:
+        amounts: int64 amounts with `amount_decimals` decimals
+        rates: int64 rates with `rate_decimals` decimals
+        amount_decimals: Decimals of the amounts
+        out_decimals: Decimals of the result (e.g. PLN_DECIMALS for grosze)
+        rate_decimals: Decimals of the rates
+
+    Returns:
+        int64 array of the products with `out_decimals` decimals (object array of Python ints
+        if a result does not fit into int64)
+
+    Raises:
+        ValueError: If the amounts do not fit into int64 after scaling them to `out_decimals`
+    """
+    amounts = np.asarray(amounts, dtype=np.int64)
+    rates = np.asarray(rates, dtype=np.int64)
+    if out_decimals > amount_decimals:
+        amounts = round_units(amounts, amount_decimals, out_decimals)
+        amount_decimals = out_decimals
+    shift = amount_decimals - out_decimals
+    if amounts.size == 0:
+        return np.zeros(np.broadcast(amounts, rates).shape, dtype=np.int64)
+
+    amounts, rates = np.broadcast_arrays(amounts, rates)
+    scale = 10**rate_decimals
+    magnitude, rate_magnitude = np.abs(amounts), np.abs(rates)
+    max_amount, max_rate = int(magnitude.max()), int(rate_magnitude.max())
+    bound = max_amount * (max_rate // scale) + (max_amount // scale + 1) * scale
+    if bound > _INT64_MAX or scale * scale > _INT64_MAX:
+        return _mul_rate_exact(amounts, rates, shift, rate_decimals)
+
+    amount_whole, amount_fraction = np.divmod(magnitude, scale)
+    rate_whole, rate_fraction = np.divmod(rate_magnitude, scale)
+    low = amount_fraction * rate_fraction
+    # amount * rate / scale == whole + fraction / scale
+    whole = magnitude * rate_whole + amount_whole * rate_fraction + low // scale
+    fraction = low % scale
+
+    # Round (whole + fraction / scale) / 10**shift half up without forming whole * scale
+    unit = 10**shift
+    quotient, remainder = np.divmod(whole, unit)
+    quotient += (2 * remainder >= unit) | ((2 * remainder == unit - 1) & (2 * fraction >= scale))
+    return np.where((amounts < 0) != (rates < 0), -quotient, quotient)
@@ -0,0 +1,183 @@
+import hashlib
+import pickle
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from kryptorozliczator.instrumentation import instrumentation
+
+
+def input_digest(value: Any) -> str:
+    """
+    Stable digest of a pipeline parameter.
+
+    Files are identified by their path, size and modification time, so editing an input file
+    invalidates the stages that read it. Sets are digested in sorted order.
+    """
+    if isinstance(value, Path):
+        path = value.expanduser()
+        if path.exists():
+            stat = path.stat()
+            value = ("file", str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+        else:
+            value = ("file", str(path), None, None)
+    elif isinstance(value, set | frozenset):
+        value = ("set", *sorted(map(input_digest, value)))
+    elif isinstance(value, list | tuple):
+        value = ("seq", *map(input_digest, value))
+    return hashlib.sha256(repr(value).encode()).hexdigest()
+
+
+def frame_digest(frame: pd.DataFrame) -> str:
+    """
+    Digest of the rows of a DataFrame by their values.
+
+    Categoricals are hashed by their values, not their codes, and the row order is ignored, so
+    the same records read in a different order or in another process give the same digest.
+    """
+    hashes = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    return hashlib.sha256(np.sort(hashes).tobytes()).hexdigest()
+
+
+def pickle_digest(value: Any) -> str:
+    return hashlib.sha256(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    A pipeline step producing one named value.
+
+    Attributes:
+        name: Name of the stage and of the value it produces
+        func: Function called with the inputs and options as keyword arguments
+        inputs: Names of parameters or outputs of earlier stages the result depends on
+        options: Names of parameters passed to `func` that do not change its result
+            (e.g. offline mode), so they are not part of the checkpoint key
+        version: Bump to invalidate existing checkpoints after changing `func`
+        volatile: The result also depends on state outside the parameters (exchange accounts,
+            journals), so the stage is computed on every run; later stages are keyed by a
+            digest of its result and rerun only when it changed
+        digest: Digest of a volatile result; the pickle digest only suits values whose pickle
+            does not depend on process state (see frame_digest)
+    """
+
+    name: str
+    func: Callable[..., Any]
+    inputs: tuple[str, ...] = ()
+    options: tuple[str, ...] = ()
+    version: int = 1
+    volatile: bool = False
+    digest: Callable[[Any], str] = pickle_digest
+
+
+class Pipeline:
+    def __init__(self, stages: list[Stage], checkpoint_dir: str | Path | None = None):
+        """
+        Chain of stages whose results are checkpointed on disk.
+
+        Every stage result is pickled under a key derived from the stage, its version and the
+        digests of its inputs; the key of a stage output is used as the digest of that output
+        in later stages. On rerun a stage with an existing checkpoint is loaded instead of
+        being computed, so only stages downstream of a changed input are executed.
+
+        Args:
+            stages: Stages in execution order
+            checkpoint_dir: Directory for checkpoints, or None to run without them
+        """
+        names = [stage.name for stage in stages]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate stage names in pipeline: {names}")
+        self.stages = stages
+        self.checkpoint_dir = Path(checkpoint_dir).expanduser() if checkpoint_dir else None
+        self.computed: list[str] = []
+        self.loaded: list[str] = []
+
+    def stage_names(self) -> list[str]:
+        return [stage.name for stage in self.stages]
+
+    def _checkpoint_path(self, stage: Stage, key: str) -> Path:
+        return self.checkpoint_dir / f"{stage.name}-{key[:16]}.pkl"
+
+    def _save(self, stage: Stage, key: str, value: Any):
+        path = self._checkpoint_path(stage, key)
+        temporary_path = path.with_suffix(".tmp")
+        with open(temporary_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        temporary_path.replace(path)
+        # Keep only the latest checkpoint of every stage
+        for old_path in self.checkpoint_dir.glob(f"{stage.name}-*.pkl"):
+            if old_path != path:
+                old_path.unlink(missing_ok=True)
+
+    def run(self, params: dict[str, Any], from_stage: str | None = None) -> dict[str, Any]:
+        """
+        Run the pipeline, reusing checkpoints of stages whose inputs did not change.
+
+        Args:
+            params: Values of the pipeline parameters
+            from_stage: Recompute this stage and all later ones even if they have checkpoints,
+                e.g. to pick up new trades while the parameters stay the same
+
+        Returns:
+            Dictionary with the parameters and the outputs of all stages
+
+        Raises:
+            ValueError: If `from_stage` is not a stage of the pipeline
+            LookupError: If a stage input is neither a parameter nor an earlier output
+        """
+        if from_stage is not None and from_stage not in self.stage_names():
+            raise ValueError(f"Unknown stage '{from_stage}', expected one of {self.stage_names()}")
+        if self.checkpoint_dir is not None:
+            self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+
+        instrumentation.register_cache(
+            "checkpoints",
+            lambda: {
+                "loaded": len(self.loaded),
+                "computed": len(self.computed),
+                "hit_ratio": len(self.loaded) / len(self.stages),
+            },
+        )
+        values = dict(params)
+        digests = {name: input_digest(value) for name, value in params.items()}
+        force = False
+        self.computed, self.loaded = [], []
+        for stage in self.stages:
+            force = force or stage.name == from_stage
+            missing = [name for name in (*stage.inputs, *stage.options) if name not in values]
+            if missing:
+                raise LookupError(f"Stage '{stage.name}' is missing inputs: {missing}")
+
+            key = hashlib.sha256(
+                repr((stage.name, stage.version, [digests[name] for name in stage.inputs])).encode()
+            ).hexdigest()
+            digests[stage.name] = key
+
+            path = self._checkpoint_path(stage, key) if self.checkpoint_dir else None
+            if path is not None and path.exists() and not force and not stage.volatile:
+                with open(path, "rb") as f:
+                    values[stage.name] = pickle.load(f)
+                self.loaded.append(stage.name)
+                print(f"[{stage.name}] Loaded from checkpoint")
+                continue
+
+            started = time.perf_counter()
+            kwargs = {name: values[name] for name in (*stage.inputs, *stage.options)}
+            with instrumentation.stage(f"pipeline.{stage.name}"):
+                values[stage.name] = stage.func(**kwargs)
+            self.computed.append(stage.name)
+            print(f"[{stage.name}] Computed in {time.perf_counter() - started:.2f} s")
+            if stage.volatile:
+                # Never loaded, so only the result digest is kept for the later stages
+                result = stage.digest(values[stage.name])
+                digests[stage.name] = hashlib.sha256((key + result).encode()).hexdigest()
+            elif path is not None:
+                self._save(stage, key, values[stage.name])
+
+        return values
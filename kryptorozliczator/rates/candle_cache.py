@@ -0,0 +1,218 @@
+"""
+Cache of intraday Binance candles in memory-mapped NumPy arrays.
+
+Every market and interval has one .npy file with the (open time, close) pairs of all fetched
+candles sorted by open time, and one with the UTC days known to be complete. Files are opened
+memory-mapped, so a year of minute candles is not read into memory to price a few transfers,
+and prices of many timestamps are looked up at once with `np.searchsorted`.
+
+Several processes (e.g. batch workers) may share the cache directory: the files of a market are
+read under a shared lock and fetched, merged and replaced under an exclusive one.
+"""
+
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows, where the cache directory must not be shared by processes
+    fcntl = None
+
+from kryptorozliczator.rates.crypto_rates import (
+    BINANCE_KLINES_LIMIT,
+    CANDLE_INTERVALS_MS,
+    DAY_MS,
+    get_candles,
+)
+from kryptorozliczator.rates.rate_cache import DEFAULT_CACHE_DIR
+
+CANDLES_DIR = "candles"
+DEFAULT_CANDLE_CACHE_DIR = DEFAULT_CACHE_DIR / CANDLES_DIR
+# A candle older than this before a transfer is not used as its price (e.g. a halted market)
+MAX_CANDLE_AGE_MS = DAY_MS
+CANDLE_DTYPE = np.dtype([("open_time", np.int64), ("close", np.float64)])
+
+
+@dataclass
+class CandleCacheStats:
+    lookups: int = 0
+    fetched_days: int = 0
+    fetched_candles: int = 0
+    fetch_seconds: float = 0.0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def _day_runs(days: np.ndarray, max_days: int) -> list[tuple[int, int]]:
+    """
+    Split sorted day numbers into runs of consecutive days of at most `max_days` days.
+    """
+    runs = []
+    for day in days.tolist():
+        if runs and day == runs[-1][1] + 1 and day - runs[-1][0] < max_days:
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+
+class CandleCache:
+    def __init__(
+        self, directory: str | Path | None = DEFAULT_CANDLE_CACHE_DIR, offline: bool = False
+    ):
+        """
+        Intraday candles of Binance markets, fetched by UTC day and kept memory-mapped.
+
+        Args:
+            directory: Directory of the .npy files, or None to keep candles in memory only
+            offline: If True, missing days are never fetched and raise LookupError instead
+        """
+        self.directory = Path(directory).expanduser() if directory is not None else None
+        self.offline = offline
+        self.stats = CandleCacheStats()
+        self._series: dict[tuple[str, str], tuple[np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, symbol: str, interval: str) -> tuple[Path, Path]:
+        return (
+            self.directory / f"{symbol}-{interval}.npy",
+            self.directory / f"{symbol}-{interval}-days.npy",
+        )
+
+    @contextmanager
+    def _file_lock(self, symbol: str, interval: str, exclusive: bool) -> Iterator[None]:
+        """
+        Inter-process lock of the files of a market.
+        """
+        if self.directory is None or fcntl is None:
+            yield
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / f"{symbol}-{interval}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load(self, symbol: str, interval: str) -> tuple[np.ndarray, np.ndarray]:
+        key = (symbol, interval)
+        series = (np.empty(0, dtype=CANDLE_DTYPE), np.empty(0, dtype=np.int64))
+        if self.directory is not None:
+            candles_path, days_path = self._paths(symbol, interval)
+            if candles_path.exists() and days_path.exists():
+                series = (np.load(candles_path, mmap_mode="r"), np.load(days_path))
+        self._series[key] = series
+        return series
+
+    def _series_of(self, symbol: str, interval: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Candles and complete days of a market, memory-mapped from disk on first use.
+        """
+        key = (symbol, interval)
+        if key not in self._series:
+            with self._file_lock(symbol, interval, exclusive=False):
+                return self._load(symbol, interval)
+        return self._series[key]
+
+    def _store(self, symbol: str, interval: str, candles: np.ndarray, days: np.ndarray):
+        key = (symbol, interval)
+        if self.directory is None:
+            self._series[key] = (candles, days)
+            return
+        # Drop the old memory map before its file is replaced
+        self._series.pop(key, None)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Candles are written before the days, so an interrupted write only causes a refetch
+        for path, array in zip(self._paths(symbol, interval), (candles, days), strict=True):
+            with tempfile.NamedTemporaryFile(
+                dir=self.directory, prefix=f"{path.stem}-", suffix=".tmp", delete=False
+            ) as f:
+                np.save(f, array)
+            Path(f.name).replace(path)
+        self._series[key] = (np.load(self._paths(symbol, interval)[0], mmap_mode="r"), days)
+
+    def _fetch_days(self, symbol: str, interval: str, missing_days: np.ndarray):
+        """
+        Fetch days of candles and merge them into the stored ones; the caller holds the
+        exclusive file lock of the market.
+        """
+        candles, days = self._series[(symbol, interval)]
+        interval_ms = CANDLE_INTERVALS_MS[interval]
+        # Consecutive days are fetched together as long as they fit into one klines page
+        max_days = max(1, BINANCE_KLINES_LIMIT * interval_ms // DAY_MS)
+        today = int(time.time() * 1000) // DAY_MS
+
+        started = time.perf_counter()
+        fetched = []
+        for first_day, last_day in _day_runs(missing_days, max_days):
+            pairs = get_candles(symbol, interval, first_day * DAY_MS, (last_day + 1) * DAY_MS - 1)
+            fetched.append(np.array(pairs, dtype=CANDLE_DTYPE))
+        self.stats.fetch_seconds += time.perf_counter() - started
+        self.stats.fetched_days += len(missing_days)
+
+        new_candles = np.concatenate(fetched)
+        self.stats.fetched_candles += len(new_candles)
+        # Newly fetched candles win over stored ones with the same open time
+        merged = np.concatenate([new_candles, candles])
+        _, first = np.unique(merged["open_time"], return_index=True)
+        # Today is still being traded, so it is refetched next time
+        complete = missing_days[missing_days < today]
+        self._store(symbol, interval, merged[first], np.union1d(days, complete))
+
+    def prices(self, symbol: str, interval: str, timestamps) -> np.ndarray:
+        """
+        Price of a market at every timestamp: the close of the last candle finished before it.
+
+        Days whose candles are not cached yet are fetched first.
+
+        Args:
+            symbol: Binance market symbol, e.g. 'BTCPLN'
+            interval: Candle interval, '1m' or '1h'
+            timestamps: UTC timestamps in milliseconds
+
+        Returns:
+            np.ndarray: Prices aligned with the timestamps
+
+        Raises:
+            LookupError: If candles are missing and the cache is offline
+            Exception: If Binance has no candle shortly before a timestamp
+        """
+        interval_ms = CANDLE_INTERVALS_MS[interval]
+        # Open times at or before these belong to candles closed before the timestamps
+        latest_open = np.asarray(timestamps, dtype=np.int64) - interval_ms
+        with self._lock:
+            self.stats.lookups += len(latest_open)
+            needed = np.unique(latest_open // DAY_MS)
+            missing = np.setdiff1d(needed, self._series_of(symbol, interval)[1])
+            if len(missing):
+                if self.offline:
+                    raise LookupError(
+                        f"No cached {interval} candles of {symbol} on "
+                        f"{np.datetime64(int(missing[0]), 'D')} (offline mode)"
+                    )
+                with self._file_lock(symbol, interval, exclusive=True):
+                    # Another process may have fetched some of the days in the meantime
+                    missing = np.setdiff1d(needed, self._load(symbol, interval)[1])
+                    if len(missing):
+                        self._fetch_days(symbol, interval, missing)
+            candles = self._series_of(symbol, interval)[0]
+
+        open_times = candles["open_time"]
+        index = np.searchsorted(open_times, latest_open, side="right") - 1
+        found = index >= 0
+        found[found] = latest_open[found] - open_times[index[found]] <= MAX_CANDLE_AGE_MS
+        if not found.all():
+            timestamp = int(latest_open[~found][0] + interval_ms)
+            raise Exception(
+                f"No {interval} candle of {symbol} before {np.datetime64(timestamp, 'ms')} UTC"
+            )
+        return np.asarray(candles["close"][index])
@@ -1,10 +1,20 @@
-from datetime import datetime
+import os
+from datetime import UTC, datetime
 
-import requests
+from kryptorozliczator.http_client import http_client
 
 # Define a constant for HTTP success status code
 HTTP_OK = 200
 
+# Can be pointed at a local stand-in server, e.g. for benchmarks
+BINANCE_API_URL = os.getenv("KRYPTOROZLICZATOR_BINANCE_API_URL", "https://api.binance.com")
+BINANCE_KLINES_URL = f"{BINANCE_API_URL}/api/v3/klines"
+# Maximum number of candles Binance returns in a single klines request
+BINANCE_KLINES_LIMIT = 1000
+DAY_MS = 24 * 60 * 60 * 1000
+# Binance kline intervals used for valuation and their length in milliseconds
+CANDLE_INTERVALS_MS = {"1m": 60 * 1000, "1h": 60 * 60 * 1000, "1d": DAY_MS}
+
 
 def get_crypto_exchange_rate(crypto_id: str, vs_currency: str, date: str) -> float:
     """
@@ -19,17 +29,16 @@ def get_crypto_exchange_rate(crypto_id: str, vs_currency: str, date: str) -> flo
         float: Price of 1 unit of crypto in vs_currency at given date
     """
 
-    # Convert date from YYYY-MM-DD to timestamp format
-    date_obj = datetime.strptime(date, "%Y-%m-%d")
+    # Convert date from YYYY-MM-DD to timestamp format; candles start at UTC midnight
+    date_obj = datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=UTC)
     timestamp = int(date_obj.timestamp() * 1000)  # Binance uses milliseconds
 
     # Map crypto_id to Binance symbol format
     symbol = f"{crypto_id.upper()}{vs_currency.upper()}"
 
     # Binance klines API endpoint
-    url = "https://api.binance.com/api/v3/klines"
     params = {"symbol": symbol, "interval": "1d", "startTime": timestamp, "limit": 1}
-    response = requests.get(url, params=params)
+    response = http_client.get(BINANCE_KLINES_URL, params, revalidate=True)
 
     if response.status_code != HTTP_OK:
         raise Exception(f"Failed to fetch data: {response.status_code}, {response.text}")
@@ -42,6 +51,69 @@ def get_crypto_exchange_rate(crypto_id: str, vs_currency: str, date: str) -> flo
     return float(price)
 
 
+def get_candles(
+    symbol: str, interval: str, start_time: int, end_time: int, revalidate: bool = False
+) -> list[tuple[int, float]]:
+    """
+    Fetch Binance candles of a market between two times, in pages of up to 1000 candles.
+
+    Args:
+        symbol (str): Binance market symbol, e.g. 'BTCPLN'
+        interval (str): Kline interval, one of CANDLE_INTERVALS_MS
+        start_time (int): First candle open time in UTC milliseconds
+        end_time (int): Last candle open time in UTC milliseconds (inclusive)
+        revalidate (bool): Keep the responses in the HTTP cache and revalidate them later
+
+    Returns:
+        list[tuple[int, float]]: (open time, close) pairs for every candle Binance has
+    """
+    candles = []
+    while start_time <= end_time:
+        params = {
+            "symbol": symbol,
+            "interval": interval,
+            "startTime": start_time,
+            "endTime": end_time,
+            "limit": BINANCE_KLINES_LIMIT,
+        }
+        response = http_client.get(BINANCE_KLINES_URL, params, revalidate=revalidate)
+        if response.status_code != HTTP_OK:
+            raise Exception(f"Failed to fetch data: {response.status_code}, {response.text}")
+
+        page = response.json()
+        candles.extend((candle[0], float(candle[4])) for candle in page)
+        if len(page) < BINANCE_KLINES_LIMIT:
+            break
+        start_time = page[-1][0] + CANDLE_INTERVALS_MS[interval]
+
+    return candles
+
+
+def get_daily_closes(symbol: str, start_date: str, end_date: str) -> list[tuple[str, float]]:
+    """
+    Fetch Binance daily closes of a market for a whole date span.
+
+    The span is fetched in pages of up to 1000 daily candles, so a year costs a single request.
+
+    Args:
+        symbol (str): Binance market symbol, e.g. 'BTCPLN'
+        start_date (str): First date in format 'YYYY-MM-DD'
+        end_date (str): Last date in format 'YYYY-MM-DD' (inclusive)
+
+    Returns:
+        list[tuple[str, float]]: (date, close) pairs for every day Binance has a candle for
+    """
+    start = datetime.strptime(start_date, "%Y-%m-%d").replace(tzinfo=UTC)
+    end = datetime.strptime(end_date, "%Y-%m-%d").replace(tzinfo=UTC)
+    start_time = int(start.timestamp() * 1000)
+    end_time = int(end.timestamp() * 1000) + DAY_MS - 1
+
+    return [
+        (datetime.fromtimestamp(open_time / 1000, tz=UTC).strftime("%Y-%m-%d"), close)
+        for open_time, close in get_candles(symbol, "1d", start_time, end_time, revalidate=True)
+    ]
+
+
 if __name__ == "__main__":
     # Example usage
     crypto = "btc"
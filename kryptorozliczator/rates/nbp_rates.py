@@ -1,16 +1,24 @@
+import os
 from datetime import datetime, timedelta
 
-import requests
+from kryptorozliczator.http_client import http_client
 
 # Define constants for HTTP status codes
 HTTP_OK = 200
 HTTP_NOT_FOUND = 404
+# NBP does not publish on weekends and holidays, the longest break is well below this
+NBP_MAX_LOOKBACK_DAYS = 10
+
+# Can be pointed at a local stand-in server, e.g. for benchmarks
+NBP_API_URL = os.getenv("KRYPTOROZLICZATOR_NBP_API_URL", "https://api.nbp.pl/api/exchangerates")
 
 
 def get_nbp_exchange_rate(currency_code: str, date: datetime) -> float:
     """
     Get exchange rate from NBP API for a given currency and date.
 
+    If there was no publication on that date, the closest earlier publication is used.
+
     Args:
         currency_code (str): Currency code (e.g., 'USD', 'EUR')
         date (datetime): Date for which to get the exchange rate
@@ -19,28 +27,26 @@ def get_nbp_exchange_rate(currency_code: str, date: datetime) -> float:
         float: Exchange rate or 1.0 for PLN
 
     Raises:
-        Exception: If failed to get exchange rate
+        LookupError: If there is no publication within NBP_MAX_LOOKBACK_DAYS before the date
+        Exception: If the NBP API answers with an error
     """
-    if currency_code == "PLN":
-        return 1.0
-
     # NBP API requires uppercase currency codes
     currency_code = currency_code.upper()
+    if currency_code == "PLN":
+        return 1.0
 
-    # Format date as YYYY-MM-DD
-    date_str = date.strftime("%Y-%m-%d")
-
-    # NBP API endpoint
-    url = f"http://api.nbp.pl/api/exchangerates/rates/A/{currency_code}/{date_str}/?format=json"
-
-    try:
-        response = requests.get(url)
+    for days_back in range(NBP_MAX_LOOKBACK_DAYS + 1):
+        date_str = (date - timedelta(days=days_back)).strftime("%Y-%m-%d")
+        url = f"{NBP_API_URL}/rates/A/{currency_code}/{date_str}/"
+        response = http_client.get(url, {"format": "json"}, revalidate=True)
         if response.status_code == HTTP_OK:
-            data = response.json()
-            return data["rates"][0]["mid"]
-        elif response.status_code == HTTP_NOT_FOUND:
-            # If rate not found for given date, try previous day
-            yesterday = date - timedelta(days=1)
-            return get_nbp_exchange_rate(currency_code, yesterday)
-    except Exception as e:
-        raise Exception(f"Failed to get exchange rate for {currency_code}: {e}") from e
+            return response.json()["rates"][0]["mid"]
+        if response.status_code != HTTP_NOT_FOUND:
+            raise Exception(
+                f"Failed to get exchange rate for {currency_code} on {date_str}: "
+                f"{response.status_code}, {response.text}"
+            )
+    raise LookupError(
+        f"No NBP rate for {currency_code} within {NBP_MAX_LOOKBACK_DAYS} days before "
+        f"{date:%Y-%m-%d}"
+    )
@@ -0,0 +1,312 @@
+import csv
+import re
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from kryptorozliczator.http_client import http_client
+from kryptorozliczator.instrumentation import instrumentation
+from kryptorozliczator.rates.nbp_rates import HTTP_NOT_FOUND, HTTP_OK, NBP_API_URL
+from kryptorozliczator.rates.rate_cache import RateCache
+
+# A single NBP API query cannot cover more than 93 days
+NBP_MAX_RANGE_DAYS = 93
+NBP_TABLE_PROVIDER = "nbp_table_a"
+
+# Archive column headers look like "1USD" or "100HUF" (rate per that many units)
+ARCHIVE_COLUMN_PATTERN = re.compile(r"^(\d+)([A-Z]{3})$")
+
+
+def _to_day(value) -> np.datetime64:
+    if isinstance(value, datetime):
+        value = value.date()
+    return np.datetime64(value, "D")
+
+
+def _merge_intervals(intervals: list[tuple[np.datetime64, np.datetime64]]):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + np.timedelta64(1, "D"):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _last_complete_day(rates: list[tuple[str, float]]) -> date:
+    """
+    Last day whose publications are final: today once its table is published (around noon),
+    yesterday before that.
+    """
+    today = date.today()
+    if any(day == today.isoformat() for day, _ in rates):
+        return today
+    return today - timedelta(days=1)
+
+
+class NbpRateTable:
+    def __init__(self, cache: RateCache | None = None):
+        """
+        Local table of NBP Table A mid rates, loaded in bulk and queried without network.
+
+        For every currency the table keeps a sorted array of publication days and a matching
+        array of mid rates, plus the date ranges that are known to be complete.
+
+        Args:
+            cache: Optional rate cache used to persist loaded ranges between runs
+        """
+        self.cache = cache
+        self._days: dict[str, np.ndarray] = {}
+        self._mids: dict[str, np.ndarray] = {}
+        self._coverage: dict[str, list[tuple[np.datetime64, np.datetime64]]] = {}
+
+    def currencies(self) -> list[str]:
+        return sorted(self._days)
+
+    def publications(self, currency_code: str, start, end) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Publication days and mid rates of a currency between two days (inclusive).
+        """
+        currency_code = currency_code.upper()
+        days = self._days.get(currency_code, np.array([], dtype="datetime64[D]"))
+        mids = self._mids.get(currency_code, np.array([], dtype=np.float64))
+        in_range = (days >= _to_day(start)) & (days <= _to_day(end))
+        return days[in_range], mids[in_range]
+
+    def add_rates(self, currency_code: str, days, mids, covered: tuple | None = None):
+        """
+        Merge publication days and mid rates for a currency into the table.
+
+        Args:
+            currency_code: Currency code (e.g., 'USD')
+            days: Publication days (anything convertible to datetime64[D])
+            mids: Mid rates matching `days`
+            covered: Optional (start, end) range for which `days` are all publications
+        """
+        currency_code = currency_code.upper()
+        days = np.asarray(days, dtype="datetime64[D]")
+        mids = np.asarray(mids, dtype=np.float64)
+        if currency_code in self._days:
+            days = np.concatenate([self._days[currency_code], days])
+            mids = np.concatenate([self._mids[currency_code], mids])
+
+        # Keep the most recently added rate for duplicated days
+        order = np.argsort(days[::-1], kind="stable")
+        days, mids = days[::-1][order], mids[::-1][order]
+        unique_days, first = np.unique(days, return_index=True)
+        self._days[currency_code] = unique_days
+        self._mids[currency_code] = mids[first]
+
+        if covered is not None:
+            intervals = self._coverage.get(currency_code, [])
+            intervals.append((_to_day(covered[0]), _to_day(covered[1])))
+            self._coverage[currency_code] = _merge_intervals(intervals)
+
+    def _missing_ranges(self, currency_code: str, start: date, end: date):
+        missing = []
+        cursor = _to_day(start)
+        end_day = _to_day(end)
+        for covered_start, covered_end in self._coverage.get(currency_code, []):
+            if covered_end < cursor:
+                continue
+            if covered_start > end_day:
+                break
+            if covered_start > cursor:
+                missing.append((cursor, covered_start - np.timedelta64(1, "D")))
+            cursor = max(cursor, covered_end + np.timedelta64(1, "D"))
+        if cursor <= end_day:
+            missing.append((cursor, end_day))
+        return missing
+
+    def _load_from_cache(self, currency_code: str):
+        if self.cache is None or currency_code in self._coverage:
+            return
+        coverage = self.cache.get_coverage(NBP_TABLE_PROVIDER, currency_code)
+        if not coverage:
+            return
+        rows = self.cache.get_range(NBP_TABLE_PROVIDER, currency_code, "0000-00-00", "9999-99-99")
+        self.add_rates(currency_code, [row[0] for row in rows], [row[1] for row in rows])
+        self._coverage[currency_code] = _merge_intervals(
+            [(_to_day(start), _to_day(end)) for start, end in coverage]
+        )
+
+    def _fetch_range(self, currency_code: str, start: date, end: date) -> list[tuple[str, float]]:
+        date_from = start.strftime("%Y-%m-%d")
+        date_to = end.strftime("%Y-%m-%d")
+        url = f"{NBP_API_URL}/rates/A/{currency_code}/{date_from}/{date_to}/"
+        response = http_client.get(url, {"format": "json"}, revalidate=True)
+        if response.status_code == HTTP_NOT_FOUND:
+            # No publication at all in this range (e.g. a range inside a long holiday)
+            return []
+        if response.status_code != HTTP_OK:
+            raise Exception(
+                f"Failed to get exchange rates for {currency_code} "
+                f"between {date_from} and {date_to}: {response.status_code}, {response.text}"
+            )
+        return [(rate["effectiveDate"], rate["mid"]) for rate in response.json()["rates"]]
+
+    def load_range(self, currency_code: str, start: date, end: date):
+        """
+        Make sure all NBP publications for a currency between two dates are in the table.
+
+        Ranges already present in the table or in the cache are not fetched again. Missing
+        parts are fetched from /rates/A/{code}/{start}/{end}/ in chunks of up to 93 days.
+        Today (unless its table is already published) and later days are never marked as
+        covered, so they are fetched again by the next call.
+
+        Args:
+            currency_code: Currency code (e.g., 'USD', 'EUR')
+            start: First day of the range
+            end: Last day of the range (inclusive)
+        """
+        currency_code = currency_code.upper()
+        if currency_code == "PLN":
+            return
+
+        self._load_from_cache(currency_code)
+        if self.cache is not None and self.cache.offline:
+            return
+
+        for missing_start, missing_end in self._missing_ranges(currency_code, start, end):
+            chunk_start = missing_start.astype(date)
+            last_day = missing_end.astype(date)
+            while chunk_start <= last_day:
+                chunk_end = min(chunk_start + timedelta(days=NBP_MAX_RANGE_DAYS - 1), last_day)
+                rates = self._fetch_range(currency_code, chunk_start, chunk_end)
+                covered_end = min(chunk_end, _last_complete_day(rates))
+                covered = (chunk_start, covered_end) if covered_end >= chunk_start else None
+                self.add_rates(
+                    currency_code, [day for day, _ in rates], [mid for _, mid in rates], covered
+                )
+                if self.cache is not None:
+                    self.cache.put_many(NBP_TABLE_PROVIDER, currency_code, rates)
+                    if covered is not None:
+                        self.cache.add_coverage(
+                            NBP_TABLE_PROVIDER, currency_code, str(chunk_start), str(covered_end)
+                        )
+                chunk_start = chunk_end + timedelta(days=1)
+
+    def load_year(self, year: int, currency_codes):
+        """
+        Load everything needed to resolve "rate from the day before" lookups within a year.
+
+        The range starts in mid-December of the previous year, so transactions from the first
+        days of January can still reach the last publication of the previous year.
+        """
+        start = date(year - 1, 12, 15)
+        end = min(date(year, 12, 31), date.today())
+        with instrumentation.stage("rates.nbp_tables"):
+            for currency_code in currency_codes:
+                self.load_range(currency_code, start, end)
+
+    def import_archive_csv(self, path: str | Path, encoding: str = "cp1250"):
+        """
+        Import a yearly NBP Table A archive (archiwum_tab_a_YYYY.csv).
+
+        The archive is a semicolon separated file with one row per publication day, a "data"
+        column with YYYYMMDD dates and one column per currency named like "1USD" or "100HUF".
+        Decimal separators are commas. Trailing rows with currency names are skipped.
+        """
+        with open(Path(path).expanduser(), encoding=encoding, newline="") as f:
+            rows = list(csv.reader(f, delimiter=";"))
+
+        header = rows[0]
+        columns = {}
+        for index, name in enumerate(header):
+            match = ARCHIVE_COLUMN_PATTERN.match(name.strip())
+            if match:
+                columns[match.group(2)] = (index, int(match.group(1)))
+
+        days = []
+        values: dict[str, list[float]] = {code: [] for code in columns}
+        for row in rows[1:]:
+            if not row or not re.fullmatch(r"\d{8}", row[0].strip()):
+                continue
+            day = row[0].strip()
+            days.append(f"{day[:4]}-{day[4:6]}-{day[6:]}")
+            for code, (index, units) in columns.items():
+                value = row[index].strip().replace(",", ".") if index < len(row) else ""
+                values[code].append(float(value) / units if value else np.nan)
+
+        if not days:
+            return
+
+        first_day = date.fromisoformat(days[0])
+        last_day = date.fromisoformat(days[-1])
+        # Archives of past years are complete up to the end of the year
+        if last_day.year < date.today().year:
+            last_day = date(last_day.year, 12, 31)
+        covered = (date(first_day.year, 1, 1), last_day)
+
+        for code, column in values.items():
+            mids = np.asarray(column)
+            published = ~np.isnan(mids)
+            code_days = [day for day, keep in zip(days, published, strict=True) if keep]
+            self.add_rates(code, code_days, mids[published], covered)
+            if self.cache is not None:
+                self.cache.put_many(
+                    NBP_TABLE_PROVIDER, code, zip(code_days, mids[published], strict=True)
+                )
+                self.cache.add_coverage(NBP_TABLE_PROVIDER, code, str(covered[0]), str(covered[1]))
+
+    def rates_before(self, currency_code: str, days) -> np.ndarray:
+        """
+        Vectorized lookup of the mid rate from the last publication day strictly before each day.
+
+        Args:
+            currency_code: Currency code (e.g., 'USD', 'EUR')
+            days: Array of days (anything convertible to datetime64[D])
+
+        Returns:
+            np.ndarray: Mid rates aligned with `days` (1.0 for PLN)
+
+        Raises:
+            LookupError: If any lookup falls outside the loaded ranges
+        """
+        currency_code = currency_code.upper()
+        days = np.asarray(days, dtype="datetime64[D]")
+        if currency_code == "PLN":
+            return np.ones(days.shape, dtype=np.float64)
+
+        self._load_from_cache(currency_code)
+        table_days = self._days.get(currency_code)
+        coverage = self._coverage.get(currency_code)
+        if table_days is None or not coverage:
+            raise LookupError(f"No NBP rates loaded for {currency_code}")
+
+        previous_days = days - np.timedelta64(1, "D")
+        positions = np.searchsorted(table_days, days, side="left") - 1
+
+        # The previous day must be covered and the found publication must lie in the same
+        # contiguous covered range, otherwise a later publication could be missing
+        starts = np.array([start for start, _ in coverage], dtype="datetime64[D]")
+        ends = np.array([end for _, end in coverage], dtype="datetime64[D]")
+        interval = np.searchsorted(starts, previous_days, side="right") - 1
+        clipped = np.clip(interval, 0, None)
+        valid = (
+            (interval >= 0)
+            & (previous_days <= ends[clipped])
+            & (positions >= 0)
+            & (table_days[np.clip(positions, 0, None)] >= starts[clipped])
+        )
+        if not valid.all():
+            missing = days[~valid]
+            raise LookupError(
+                f"NBP rates for {currency_code} are not loaded for {missing.size} day(s), "
+                f"e.g. the day before {missing[0]}"
+            )
+        return self._mids[currency_code][positions]
+
+    def rate_before(self, currency_code: str, day: date | datetime) -> float:
+        """
+        Get the mid rate from the last NBP publication day strictly before `day`.
+
+        Args:
+            currency_code: Currency code (e.g., 'USD', 'EUR')
+            day: Day of the transaction
+
+        Returns:
+            float: Exchange rate or 1.0 for PLN
+        """
+        return float(self.rates_before(currency_code, [_to_day(day)])[0])
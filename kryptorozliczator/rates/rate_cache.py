@@ -0,0 +1,208 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+# Rates, HTTP responses and candles are public data, so several data directories (e.g. the
+# clients of a batch run) can share one cache directory
+DEFAULT_CACHE_DIR = Path(
+    os.getenv("KRYPTOROZLICZATOR_CACHE_DIR", Path.home() / "kryptorozliczator" / "cache")
+)
+RATE_CACHE_FILE = "rates.sqlite"
+DEFAULT_CACHE_PATH = DEFAULT_CACHE_DIR / RATE_CACHE_FILE
+DEFAULT_MEMORY_ENTRIES = 100_000
+
+
+@dataclass
+class RateCacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    fetches: int = 0
+    lookup_seconds: float = 0.0
+    fetch_seconds: float = 0.0
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "hits": self.hits, "hit_ratio": self.hit_ratio}
+
+
+class RateCache:
+    def __init__(
+        self,
+        path: str | Path | None = DEFAULT_CACHE_PATH,
+        max_memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+        offline: bool = False,
+    ):
+        """
+        Two-tier cache for exchange rates: an in-process LRU in front of a SQLite store.
+
+        Rates are keyed by (provider, pair, date), e.g. ("nbp", "USD", "2024-03-01").
+
+        Args:
+            path: Location of the SQLite file, or None for a memory-only cache
+            max_memory_entries: Number of rates kept in the in-process LRU
+            offline: If True, misses are never fetched and raise LookupError instead
+        """
+        self.path = Path(path).expanduser() if path is not None else None
+        self.max_memory_entries = max_memory_entries
+        self.offline = offline
+        self.stats = RateCacheStats()
+        self._memory: OrderedDict[tuple[str, str, str], float] = OrderedDict()
+        self._lock = threading.RLock()
+
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            database = str(self.path)
+        else:
+            database = ":memory:"
+        self._db = sqlite3.connect(database, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rates ("
+            " provider TEXT NOT NULL,"
+            " pair TEXT NOT NULL,"
+            " date TEXT NOT NULL,"
+            " rate REAL NOT NULL,"
+            " PRIMARY KEY (provider, pair, date)"
+            ") WITHOUT ROWID"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS coverage ("
+            " provider TEXT NOT NULL,"
+            " pair TEXT NOT NULL,"
+            " start TEXT NOT NULL,"
+            " end TEXT NOT NULL"
+            ")"
+        )
+        self._db.commit()
+
+    def _remember(self, key: tuple[str, str, str], rate: float):
+        self._memory[key] = rate
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, provider: str, pair: str, date: str) -> float | None:
+        """
+        Look up a rate in memory, then on disk.
+
+        Returns:
+            The cached rate or None if it is not cached
+        """
+        key = (provider, pair, date)
+        started = time.perf_counter()
+        with self._lock:
+            try:
+                rate = self._memory.get(key)
+                if rate is not None:
+                    self._memory.move_to_end(key)
+                    self.stats.memory_hits += 1
+                    return rate
+
+                row = self._db.execute(
+                    "SELECT rate FROM rates WHERE provider = ? AND pair = ? AND date = ?", key
+                ).fetchone()
+                if row is not None:
+                    self._remember(key, row[0])
+                    self.stats.disk_hits += 1
+                    return row[0]
+
+                self.stats.misses += 1
+                return None
+            finally:
+                self.stats.lookup_seconds += time.perf_counter() - started
+
+    def put(self, provider: str, pair: str, date: str, rate: float):
+        self.put_many(provider, pair, [(date, rate)])
+
+    def put_many(self, provider: str, pair: str, rates: Iterable[tuple[str, float]]):
+        """
+        Store many rates for a single provider/pair in one transaction.
+
+        Args:
+            provider: Rate source, e.g. 'nbp' or 'binance'
+            pair: Currency or market identifier, e.g. 'USD' or 'BTCPLN'
+            rates: Iterable of (date, rate) tuples
+        """
+        rows = [(provider, pair, date, float(rate)) for date, rate in rates]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO rates VALUES (?, ?, ?, ?)", rows)
+            self._db.commit()
+            for provider_, pair_, date, rate in rows:
+                self._remember((provider_, pair_, date), rate)
+
+    def get_range(self, provider: str, pair: str, start: str, end: str) -> list[tuple[str, float]]:
+        """
+        Return all stored (date, rate) rows of a provider/pair between two dates, inclusive.
+
+        Range reads bypass the LRU; they are meant for bulk loaders that keep their own arrays.
+        """
+        with self._lock:
+            return self._db.execute(
+                "SELECT date, rate FROM rates"
+                " WHERE provider = ? AND pair = ? AND date BETWEEN ? AND ? ORDER BY date",
+                (provider, pair, start, end),
+            ).fetchall()
+
+    def add_coverage(self, provider: str, pair: str, start: str, end: str):
+        """
+        Record that every published rate of a provider/pair between two dates is stored.
+
+        This lets bulk loaders tell a day without publication from a day that was never fetched.
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO coverage VALUES (?, ?, ?, ?)", (provider, pair, start, end)
+            )
+            self._db.commit()
+
+    def get_coverage(self, provider: str, pair: str) -> list[tuple[str, str]]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT start, end FROM coverage WHERE provider = ? AND pair = ? ORDER BY start",
+                (provider, pair),
+            ).fetchall()
+
+    def get_or_fetch(
+        self, provider: str, pair: str, date: str, fetch: Callable[[], float]
+    ) -> float:
+        """
+        Return a cached rate, calling `fetch` and storing its result on a miss.
+
+        Raises:
+            LookupError: If the rate is not cached and the cache is offline
+        """
+        rate = self.get(provider, pair, date)
+        if rate is not None:
+            return rate
+
+        if self.offline:
+            raise LookupError(f"No cached {provider} rate for {pair} on {date} (offline mode)")
+
+        started = time.perf_counter()
+        try:
+            rate = fetch()
+        finally:
+            self.stats.fetches += 1
+            self.stats.fetch_seconds += time.perf_counter() - started
+        if rate is None:
+            raise LookupError(f"{provider} returned no rate for {pair} on {date}")
+        self.put(provider, pair, date, rate)
+        return rate
+
+    def close(self):
+        with self._lock:
+            self._db.close()
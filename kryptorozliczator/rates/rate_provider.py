@@ -0,0 +1,179 @@
+import time
+from collections import defaultdict
+from collections.abc import Iterable
+from datetime import datetime
+
+import numpy as np
+
+from kryptorozliczator.instrumentation import instrumentation
+from kryptorozliczator.rates.candle_cache import CANDLES_DIR, CandleCache
+from kryptorozliczator.rates.crypto_rates import get_crypto_exchange_rate, get_daily_closes
+from kryptorozliczator.rates.nbp_rates import get_nbp_exchange_rate
+from kryptorozliczator.rates.rate_cache import DEFAULT_CACHE_PATH, RateCache, RateCacheStats
+
+NBP_PROVIDER = "nbp"
+BINANCE_PROVIDER = "binance"
+
+
+class RateProvider:
+    def __init__(self, cache: RateCache | None = None, offline: bool = False):
+        """
+        Cached access to NBP fiat rates and Binance crypto prices.
+
+        Args:
+            cache: Cache to use, by default a persistent one in ~/kryptorozliczator/cache
+            offline: Serve rates from the cache only, never touching the network
+        """
+        self.cache = cache if cache is not None else RateCache(DEFAULT_CACHE_PATH)
+        if offline:
+            self.cache.offline = True
+        instrumentation.register_cache("rates", self.cache.stats.as_dict)
+        self._candles: CandleCache | None = None
+
+    @property
+    def stats(self) -> RateCacheStats:
+        return self.cache.stats
+
+    @property
+    def candles(self) -> CandleCache:
+        """
+        Intraday candle cache, next to the rate cache (in memory if the rate cache is).
+        """
+        if self._candles is None:
+            path = self.cache.path
+            directory = path.parent / CANDLES_DIR if path is not None else None
+            self._candles = CandleCache(directory, offline=self.cache.offline)
+            instrumentation.register_cache("candles", self._candles.stats.as_dict)
+        return self._candles
+
+    def nbp_rate(self, currency_code: str, date: datetime) -> float:
+        """
+        Get the NBP mid rate for a currency on a date (or the closest earlier publication day).
+
+        Args:
+            currency_code: Currency code (e.g., 'USD', 'EUR')
+            date: Date for which to get the exchange rate
+
+        Returns:
+            float: Exchange rate or 1.0 for PLN
+        """
+        currency_code = currency_code.upper()
+        if currency_code == "PLN":
+            return 1.0
+
+        return self.cache.get_or_fetch(
+            NBP_PROVIDER,
+            currency_code,
+            date.strftime("%Y-%m-%d"),
+            lambda: get_nbp_exchange_rate(currency_code, date),
+        )
+
+    def crypto_rate(self, crypto_id: str, vs_currency: str, date: str) -> float:
+        """
+        Get the Binance daily close of a crypto in a given currency.
+
+        Args:
+            crypto_id: Asset symbol, e.g. 'btc'
+            vs_currency: Quote currency, e.g. 'pln'
+            date: Date in format 'YYYY-MM-DD'
+
+        Returns:
+            float: Price of 1 unit of crypto in vs_currency at given date
+        """
+        symbol = f"{crypto_id.upper()}{vs_currency.upper()}"
+        return self.cache.get_or_fetch(
+            BINANCE_PROVIDER,
+            symbol,
+            date,
+            lambda: get_crypto_exchange_rate(crypto_id, vs_currency, date),
+        )
+
+    def crypto_rates(self, requests: Iterable[tuple[str, str, str]]) -> np.ndarray:
+        """
+        Get Binance daily closes for a whole batch of (asset, quote, date) requests.
+
+        Requests are grouped by market symbol; for every symbol only the days missing from the
+        cache are fetched, as one span of 1000-candle pages.
+
+        Args:
+            requests: Iterable of (crypto_id, vs_currency, 'YYYY-MM-DD') tuples
+
+        Returns:
+            np.ndarray: Prices aligned with the input requests
+
+        Raises:
+            LookupError: If a price is not cached and the provider is offline
+            Exception: If Binance has no candle for a requested day
+        """
+        symbols = []
+        dates = []
+        for crypto_id, vs_currency, date in requests:
+            symbols.append(f"{crypto_id.upper()}{vs_currency.upper()}")
+            dates.append(date)
+
+        prices = np.full(len(symbols), np.nan)
+        positions = defaultdict(list)
+        for index, key in enumerate(zip(symbols, dates, strict=True)):
+            positions[key].append(index)
+
+        missing = defaultdict(set)
+        for symbol, date in positions:
+            price = self.cache.get(BINANCE_PROVIDER, symbol, date)
+            if price is None:
+                missing[symbol].add(date)
+            else:
+                prices[positions[symbol, date]] = price
+
+        for symbol, missing_dates in missing.items():
+            if self.cache.offline:
+                raise LookupError(
+                    f"No cached {BINANCE_PROVIDER} rate for {symbol} on {min(missing_dates)} "
+                    "(offline mode)"
+                )
+            started = time.perf_counter()
+            closes = dict(get_daily_closes(symbol, min(missing_dates), max(missing_dates)))
+            self.stats.fetches += 1
+            self.stats.fetch_seconds += time.perf_counter() - started
+            self.cache.put_many(BINANCE_PROVIDER, symbol, closes.items())
+            for date in missing_dates:
+                if date not in closes:
+                    raise Exception(f"No data found for {symbol} on {date}")
+                prices[positions[symbol, date]] = closes[date]
+
+        return prices
+
+    def crypto_rates_at(
+        self, requests: Iterable[tuple[str, str, int]], interval: str = "1m"
+    ) -> np.ndarray:
+        """
+        Get Binance prices at exact UTC times for a whole batch of requests.
+
+        Every request is priced at the close of the last `interval` candle finished before
+        its timestamp. Candles are fetched per market by UTC day and cached on disk.
+
+        Args:
+            requests: Iterable of (crypto_id, vs_currency, UTC timestamp in ms) tuples
+            interval: Candle interval, '1m' or '1h'
+
+        Returns:
+            np.ndarray: Prices aligned with the input requests
+
+        Raises:
+            LookupError: If candles are not cached and the provider is offline
+            Exception: If Binance has no candle shortly before a requested time
+        """
+        symbols = []
+        timestamps = []
+        for crypto_id, vs_currency, timestamp in requests:
+            symbols.append(f"{crypto_id.upper()}{vs_currency.upper()}")
+            timestamps.append(timestamp)
+
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        unique_symbols, symbol_index = np.unique(
+            np.asarray(symbols, dtype=str), return_inverse=True
+        )
+        prices = np.full(len(timestamps), np.nan)
+        for i, symbol in enumerate(unique_symbols):
+            in_symbol = symbol_index == i
+            prices[in_symbol] = self.candles.prices(str(symbol), interval, timestamps[in_symbol])
+        return prices
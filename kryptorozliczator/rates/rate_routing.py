@@ -0,0 +1,236 @@
+"""
+Conversion of assets without a direct PLN market along a graph of markets.
+
+The graph has an edge for every Binance market (in both directions, the reverse one using the
+inverted price), an edge from every USD or EUR stablecoin to its currency, and an edge from
+every NBP currency to PLN. The cheapest path from every asset to PLN is found once per graph
+with Dijkstra's algorithm; a batch of prices is then computed hop by hop, with one vectorized
+lookup and multiplication per hop for all rows whose path uses it.
+"""
+
+import heapq
+import json
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import requests
+
+from kryptorozliczator.http_client import http_client
+from kryptorozliczator.rates.crypto_rates import BINANCE_API_URL
+from kryptorozliczator.rates.nbp_tables import NbpRateTable
+from kryptorozliczator.rates.rate_cache import DEFAULT_CACHE_DIR
+from kryptorozliczator.rates.rate_provider import RateProvider
+
+BINANCE_EXCHANGE_INFO_URL = f"{BINANCE_API_URL}/api/v3/exchangeInfo"
+MARKETS_FILE = "binance_markets.json"
+DEFAULT_MARKETS_PATH = DEFAULT_CACHE_DIR / MARKETS_FILE
+TARGET_CURRENCY = "PLN"
+# Currencies converted to PLN with NBP Table A rates
+NBP_CURRENCIES = frozenset({"USD", "EUR", "GBP", "CHF"})
+# Stablecoins treated as their fiat currency
+STABLECOIN_PEGS = {
+    "USDT": "USD",
+    "USDC": "USD",
+    "FDUSD": "USD",
+    "TUSD": "USD",
+    "BUSD": "USD",
+    "EURI": "EUR",
+}
+BINANCE_HOP_COST = 1.0
+# Markets no longer traded still have their history, but are used only as a last resort
+INACTIVE_MARKET_COST = 3.0
+PEG_HOP_COST = 1.0
+NBP_HOP_COST = 1.0
+# NBP publications before the first requested day needed by "rate from the day before"
+NBP_LOOKBACK_DAYS = 15
+
+
+@dataclass(frozen=True)
+class Hop:
+    """
+    One conversion step of a path.
+
+    Attributes:
+        source: Asset converted from
+        target: Asset converted to
+        kind: 'binance', 'peg' or 'nbp'
+        symbol: Binance market symbol of a 'binance' hop
+        inverted: The market is target/source, so its price is inverted
+    """
+
+    source: str
+    target: str
+    kind: str
+    symbol: str | None = None
+    inverted: bool = False
+
+
+def load_binance_markets(path: Path | None = DEFAULT_MARKETS_PATH, offline: bool = False):
+    """
+    (base, quote, trading) of every Binance market, from exchangeInfo or its saved copy.
+
+    The list is saved next to the rate cache, so offline runs can route too. Without a saved
+    copy offline, or when Binance cannot be reached, the list is empty.
+    """
+    if not offline:
+        try:
+            response = http_client.get(BINANCE_EXCHANGE_INFO_URL, revalidate=True)
+            response.raise_for_status()
+            markets = [
+                (market["baseAsset"], market["quoteAsset"], market["status"] == "TRADING")
+                for market in response.json()["symbols"]
+            ]
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to load Binance markets, using the saved list: {e}")
+        else:
+            if path is not None:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(json.dumps(markets))
+            return markets
+    if path is not None and path.exists():
+        return [tuple(market) for market in json.loads(path.read_text())]
+    return []
+
+
+def build_graph(markets) -> dict[str, list[tuple[float, Hop]]]:
+    """
+    Outgoing edges of every asset: (cost, hop) pairs.
+    """
+    graph = defaultdict(list)
+    for base, quote, trading in markets:
+        cost = BINANCE_HOP_COST if trading else INACTIVE_MARKET_COST
+        symbol = f"{base}{quote}"
+        graph[base].append((cost, Hop(base, quote, "binance", symbol)))
+        graph[quote].append((cost, Hop(quote, base, "binance", symbol, inverted=True)))
+    for stablecoin, currency in STABLECOIN_PEGS.items():
+        graph[stablecoin].append((PEG_HOP_COST, Hop(stablecoin, currency, "peg")))
+    for currency in NBP_CURRENCIES:
+        graph[currency].append((NBP_HOP_COST, Hop(currency, TARGET_CURRENCY, "nbp")))
+    return graph
+
+
+def cheapest_paths(graph: dict[str, list[tuple[float, Hop]]], target: str) -> dict[str, list]:
+    """
+    Cheapest path of hops from every asset that can reach `target`, by Dijkstra's algorithm
+    run backwards from the target.
+    """
+    incoming = defaultdict(list)
+    for edges in graph.values():
+        for cost, hop in edges:
+            incoming[hop.target].append((cost, hop))
+
+    costs = {target: 0.0}
+    next_hop: dict[str, Hop] = {}
+    queue = [(0.0, target)]
+    while queue:
+        cost, asset = heapq.heappop(queue)
+        if cost > costs[asset]:
+            continue
+        for hop_cost, hop in incoming[asset]:
+            source_cost = cost + hop_cost
+            if source_cost < costs.get(hop.source, float("inf")):
+                costs[hop.source] = source_cost
+                next_hop[hop.source] = hop
+                heapq.heappush(queue, (source_cost, hop.source))
+
+    paths = {target: []}
+    for asset in sorted(costs, key=costs.get):
+        if asset != target:
+            paths[asset] = [next_hop[asset], *paths[next_hop[asset].target]]
+    return paths
+
+
+class RateRouter:
+    def __init__(self, rate_provider: RateProvider, markets: list | None = None):
+        """
+        PLN prices of any asset reachable through Binance markets and NBP rates.
+
+        Args:
+            rate_provider: Source of Binance prices and of the cache for NBP rates
+            markets: (base, quote, trading) market list, loaded from Binance by default
+        """
+        self.rate_provider = rate_provider
+        if markets is None:
+            # The market list is saved next to the rate cache it belongs to
+            cache_path = rate_provider.cache.path
+            markets = load_binance_markets(
+                cache_path.parent / MARKETS_FILE if cache_path is not None else None,
+                offline=rate_provider.cache.offline,
+            )
+        self.markets = markets
+        self.paths = cheapest_paths(build_graph(markets), TARGET_CURRENCY)
+        self.nbp_table = NbpRateTable(rate_provider.cache)
+
+    def path(self, asset: str) -> list[Hop]:
+        """
+        Cheapest chain of hops from an asset to PLN.
+
+        Without a market list (offline, never loaded) the direct ASSETPLN market is assumed.
+
+        Raises:
+            LookupError: If the asset cannot be converted to PLN
+        """
+        asset = asset.upper()
+        if asset in self.paths:
+            return self.paths[asset]
+        if not self.markets:
+            return [Hop(asset, TARGET_CURRENCY, "binance", f"{asset}{TARGET_CURRENCY}")]
+        raise LookupError(f"No Binance or NBP conversion path from {asset} to PLN")
+
+    def _hop_rates(self, hop: Hop, days: np.ndarray, timestamps, interval: str) -> np.ndarray:
+        if hop.kind == "peg":
+            return np.ones(len(days))
+        if hop.kind == "nbp":
+            if not self.rate_provider.cache.offline:
+                first_day = days.min().astype(object) - timedelta(days=NBP_LOOKBACK_DAYS)
+                self.nbp_table.load_range(hop.source, first_day, days.max().astype(object))
+            return self.nbp_table.rates_before(hop.source, days)
+
+        base, quote = (hop.target, hop.source) if hop.inverted else (hop.source, hop.target)
+        if interval == "1d":
+            prices = self.rate_provider.crypto_rates(
+                (base, quote, str(day)) for day in days.astype("datetime64[D]")
+            )
+        else:
+            prices = self.rate_provider.crypto_rates_at(
+                ((base, quote, timestamp) for timestamp in timestamps), interval
+            )
+        return 1.0 / prices if hop.inverted else prices
+
+    def rates(
+        self, assets, days, timestamps: np.ndarray | None = None, interval: str = "1d"
+    ) -> np.ndarray:
+        """
+        PLN price of every asset on a day or, with an intraday interval, at a timestamp.
+
+        Rows are grouped by hop, so every hop used by several assets is looked up once for
+        all of them and the prices are multiplied in place along the paths.
+
+        Args:
+            assets: Asset symbols, e.g. ['BTC', 'SOL']
+            days: UTC days of the rows (datetime64[D]), used for daily closes and NBP rates
+            timestamps: UTC millisecond timestamps of the rows, needed by intraday intervals
+            interval: '1d' for daily closes, '1h' or '1m' for the candles before the timestamps
+
+        Returns:
+            np.ndarray: PLN prices aligned with the rows
+        """
+        assets = np.asarray([asset.upper() for asset in assets], dtype=str)
+        days = np.asarray(days, dtype="datetime64[D]")
+        prices = np.ones(len(assets))
+
+        hop_rows = defaultdict(list)
+        unique_assets, asset_index = np.unique(assets, return_inverse=True)
+        for i, asset in enumerate(unique_assets):
+            rows = np.flatnonzero(asset_index == i)
+            for hop in self.path(str(asset)):
+                hop_rows[hop].append(rows)
+
+        for hop, row_groups in hop_rows.items():
+            rows = np.concatenate(row_groups)
+            hop_timestamps = timestamps[rows] if timestamps is not None else None
+            prices[rows] *= self._hop_rates(hop, days[rows], hop_timestamps, interval)
+        return prices
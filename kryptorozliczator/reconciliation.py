@@ -0,0 +1,323 @@
+"""
+Reconciliation of wallet transfers with exchange deposits and withdrawals.
+
+Coins moved between the taxpayer's own wallets and exchange accounts were not spent, so such
+transfers must not be valued as purchases. All movements are brought to one schema
+(MOVEMENT_COLUMNS) and every outgoing movement (a wallet transfer or an exchange withdrawal) is
+paired with at most one incoming movement (an exchange deposit or a transfer to an own wallet)
+of the same asset and from another source:
+
+1. by transaction hash, with a hash join of both sides;
+2. otherwise by amount and time: the incoming amount lies between the outgoing amount minus its
+   fee and the outgoing amount, and it arrived within MATCH_WINDOW_MS after it. Movements that
+   both have a (different) transaction hash are never paired this way. Incoming movements of
+   an asset are sorted by amount once and the candidates of all outgoing movements are found
+   with binary search, so no pairs of movements are compared in a loop; the candidates closest
+   in time are taken first.
+
+Amount matches can pair unrelated transfers of equal amounts (there is no network to compare in
+the wallet exports), so they are flagged with MATCH_BY_AMOUNT in the output for manual review.
+"""
+
+import numpy as np
+import pandas as pd
+
+from kryptorozliczator.wallet_interfaces.importers import (
+    FEES_COLUMN,
+    SYMBOL_COLUMN,
+    TIME_COLUMN,
+    TRANSACTION_ID_COLUMN,
+    VALUE_COLUMN,
+    WALLET_COLUMN,
+)
+from kryptorozliczator.wallet_interfaces.transfers import Transfer, TransferType
+
+HOUR_MS = 60 * 60 * 1000
+# Longest time between a transfer leaving one account and being credited to another
+MATCH_WINDOW_MS = 48 * HOUR_MS
+# Exchanges time withdrawals by their request, which can precede the on-chain transfer
+MAX_CLOCK_SKEW_MS = HOUR_MS
+# Relative and absolute slack of amount comparisons (float rounding, 1 satoshi)
+AMOUNT_TOLERANCE = 1e-9
+MIN_AMOUNT_DIFFERENCE = 1e-8
+
+OUTGOING = "out"
+INCOMING = "in"
+MATCH_BY_HASH = "tx_hash"
+MATCH_BY_AMOUNT = "amount"
+# Movement schema: UTC milliseconds, asset symbol, positive amount, fee in the asset,
+# normalized transaction hash ('' if unknown), OUTGOING or INCOMING, wallet or exchange name
+MOVEMENT_COLUMNS = ("time", "asset", "amount", "fee", "tx_hash", "direction", "source")
+# Exchange transactions in other states (pending, failed, canceled) moved no coins
+COMPLETED_STATUSES = frozenset({"ok"})
+
+
+def normalize_tx_hashes(hashes) -> np.ndarray:
+    """
+    Transaction hashes in one spelling: lower case without a 0x prefix, '' if missing.
+    """
+    normalized = pd.Series(hashes, dtype=object).fillna("").astype(str).str.strip().str.lower()
+    return normalized.str.removeprefix("0x").to_numpy(dtype=object)
+
+
+def movement_frame(columns: dict) -> pd.DataFrame:
+    """
+    Movements in the MOVEMENT_COLUMNS schema from aligned columns; the direction and the
+    source may be given as one value for all rows.
+    """
+    frame = pd.DataFrame(
+        {
+            "time": np.asarray(columns["time"], dtype=np.int64),
+            "asset": pd.Series(columns["asset"], dtype=str).str.upper().to_numpy(dtype=object),
+            "amount": np.abs(np.asarray(columns["amount"], dtype=float)),
+            "fee": np.nan_to_num(np.abs(np.asarray(columns["fee"], dtype=float))),
+            "tx_hash": normalize_tx_hashes(columns["tx_hash"]),
+        }
+    )
+    frame["direction"] = columns["direction"]
+    frame["source"] = columns["source"]
+    return frame
+
+
+def empty_movements() -> pd.DataFrame:
+    return movement_frame(dict.fromkeys(MOVEMENT_COLUMNS, []))
+
+
+def spending_movements(spending: pd.DataFrame) -> pd.DataFrame:
+    """
+    Movements of wallet transfers in the normalized schema of the CSV importers.
+    """
+    times = pd.to_datetime(spending[TIME_COLUMN], utc=True, format="ISO8601")
+    values = spending[VALUE_COLUMN].to_numpy(dtype=float)
+    return movement_frame(
+        {
+            "time": times.dt.tz_localize(None).to_numpy(dtype="datetime64[ms]").astype(np.int64),
+            "asset": spending[SYMBOL_COLUMN].to_numpy(dtype=str),
+            "amount": values,
+            "fee": spending[FEES_COLUMN].to_numpy(dtype=float),
+            "tx_hash": spending[TRANSACTION_ID_COLUMN].to_numpy(dtype=object),
+            "direction": np.where(values < 0, OUTGOING, INCOMING),
+            "source": spending[WALLET_COLUMN].to_numpy(dtype=str),
+        }
+    )
+
+
+def wallet_movements(transfers: dict[str, list[Transfer]], wallet: str) -> pd.DataFrame:
+    """
+    Movements of the on-chain transfers of a wallet, as returned by TransfersInterface.
+    """
+    records = [
+        transfer for currency_transfers in transfers.values() for transfer in currency_transfers
+    ]
+    return movement_frame(
+        {
+            "time": [int(transfer.timestamp.timestamp() * 1000) for transfer in records],
+            "asset": [transfer.currency for transfer in records],
+            "amount": [float(transfer.amount) for transfer in records],
+            "fee": [float(transfer.fee or 0) for transfer in records],
+            "tx_hash": [transfer.tx_hash for transfer in records],
+            "direction": [
+                OUTGOING if transfer.transfer_type == TransferType.SENT else INCOMING
+                for transfer in records
+            ],
+            "source": wallet,
+        }
+    )
+
+
+def exchange_movements(transactions: list[dict], exchange: str) -> pd.DataFrame:
+    """
+    Movements of completed ccxt deposits and withdrawals of an exchange account.
+
+    A fee charged in another currency than the moved one is ignored.
+    """
+    records = [
+        transaction
+        for transaction in transactions
+        if transaction.get("type") in ("deposit", "withdrawal")
+        and transaction.get("status") in COMPLETED_STATUSES
+    ]
+
+    def fee(transaction: dict) -> float:
+        fee = transaction.get("fee") or {}
+        if fee.get("currency") not in (None, transaction["currency"]):
+            return 0.0
+        return float(fee.get("cost") or 0.0)
+
+    return movement_frame(
+        {
+            "time": [transaction["timestamp"] for transaction in records],
+            "asset": [transaction["currency"] for transaction in records],
+            "amount": [transaction["amount"] for transaction in records],
+            "fee": [fee(transaction) for transaction in records],
+            "tx_hash": [transaction.get("txid") for transaction in records],
+            "direction": [
+                OUTGOING if transaction["type"] == "withdrawal" else INCOMING
+                for transaction in records
+            ],
+            "source": exchange,
+        }
+    )
+
+
+def _match_by_hash(movements: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    rows = movements[["tx_hash", "asset", "source", "direction"]]
+    rows = rows[rows["tx_hash"] != ""].reset_index(names="row")
+    pairs = rows[rows["direction"] == OUTGOING].merge(
+        rows[rows["direction"] == INCOMING], on=["tx_hash", "asset"], suffixes=("_out", "_in")
+    )
+    pairs = pairs[pairs["source_out"] != pairs["source_in"]]
+    # A transaction paying several own accounts (or listed twice) is matched once
+    pairs = pairs.drop_duplicates("row_out").drop_duplicates("row_in")
+    return pairs["row_out"].to_numpy(), pairs["row_in"].to_numpy()
+
+
+def _amount_candidates(
+    movements: pd.DataFrame, outgoing: np.ndarray, incoming: np.ndarray, window_ms: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (outgoing, incoming) row pairs of one asset whose amounts and times fit.
+    """
+    amounts = movements["amount"].to_numpy()
+    times = movements["time"].to_numpy()
+    incoming = incoming[np.argsort(amounts[incoming], kind="stable")]
+    sorted_amounts = amounts[incoming]
+
+    low = amounts[outgoing] - movements["fee"].to_numpy()[outgoing]
+    high = amounts[outgoing]
+    low = low - np.maximum(np.abs(low) * AMOUNT_TOLERANCE, MIN_AMOUNT_DIFFERENCE)
+    high = high + np.maximum(high * AMOUNT_TOLERANCE, MIN_AMOUNT_DIFFERENCE)
+    first = np.searchsorted(sorted_amounts, low, side="left")
+    counts = np.searchsorted(sorted_amounts, high, side="right") - first
+
+    # All incoming rows in every outgoing row's amount range, without a Python loop
+    pair_out = np.repeat(outgoing, counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    pair_in = incoming[np.repeat(first, counts) + offsets]
+
+    delay = times[pair_in] - times[pair_out]
+    sources = movements["source"].to_numpy()
+    hashes = movements["tx_hash"].to_numpy()
+    # Both sides were not matched by hash, so two known hashes belong to different transfers
+    unknown_hash = (hashes[pair_in] == "") | (hashes[pair_out] == "")
+    fits = (
+        (delay >= -MAX_CLOCK_SKEW_MS)
+        & (delay <= window_ms)
+        & (sources[pair_in] != sources[pair_out])
+        & unknown_hash
+    )
+    return pair_out[fits], pair_in[fits]
+
+
+def _match_by_amount(
+    movements: pd.DataFrame, unmatched: np.ndarray, window_ms: int
+) -> tuple[np.ndarray, np.ndarray]:
+    candidates = []
+    directions = movements["direction"].to_numpy()
+    assets = movements["asset"].to_numpy()
+    for asset in np.unique(assets[unmatched]):
+        rows = unmatched[assets[unmatched] == asset]
+        outgoing = rows[directions[rows] == OUTGOING]
+        incoming = rows[directions[rows] == INCOMING]
+        if len(outgoing) and len(incoming):
+            candidates.append(_amount_candidates(movements, outgoing, incoming, window_ms))
+    if not candidates:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    pair_out = np.concatenate([pairs[0] for pairs in candidates])
+    pair_in = np.concatenate([pairs[1] for pairs in candidates])
+    times = movements["time"].to_numpy()
+    amounts = movements["amount"].to_numpy()
+    # Closest in time first, then closest in amount; every row is used at most once
+    order = np.lexsort(
+        (
+            np.abs(amounts[pair_out] - amounts[pair_in]),
+            np.abs(times[pair_in] - times[pair_out]),
+        )
+    )
+    used = np.zeros(len(movements), dtype=bool)
+    matched_out, matched_in = [], []
+    for out_row, in_row in zip(pair_out[order].tolist(), pair_in[order].tolist(), strict=True):
+        if not used[out_row] and not used[in_row]:
+            used[out_row] = used[in_row] = True
+            matched_out.append(out_row)
+            matched_in.append(in_row)
+    return np.array(matched_out, dtype=np.int64), np.array(matched_in, dtype=np.int64)
+
+
+def reconcile(movements: pd.DataFrame, window_ms: int = MATCH_WINDOW_MS) -> pd.DataFrame:
+    """
+    Pair outgoing and incoming movements that are the two sides of one transfer.
+
+    Args:
+        movements: Movements of all wallets and exchange accounts, in the MOVEMENT_COLUMNS
+            schema with a default index
+        window_ms: Longest time between the outgoing and the incoming side of a transfer
+
+    Returns:
+        DataFrame with the `out_row` and `in_row` positions of every pair in `movements` and
+        how it was matched (MATCH_BY_HASH or MATCH_BY_AMOUNT)
+    """
+    movements = movements.reset_index(drop=True)
+    hash_out, hash_in = _match_by_hash(movements)
+    unmatched = np.ones(len(movements), dtype=bool)
+    unmatched[hash_out] = unmatched[hash_in] = False
+    amount_out, amount_in = _match_by_amount(movements, np.flatnonzero(unmatched), window_ms)
+    return pd.DataFrame(
+        {
+            "out_row": np.concatenate([hash_out, amount_out]).astype(np.int64),
+            "in_row": np.concatenate([hash_in, amount_in]).astype(np.int64),
+            "match": [MATCH_BY_HASH] * len(hash_out) + [MATCH_BY_AMOUNT] * len(amount_out),
+        }
+    )
+
+
+def internal_transfers(
+    spending: pd.DataFrame, movements: pd.DataFrame, window_ms: int = MATCH_WINDOW_MS
+) -> pd.DataFrame:
+    """
+    Outgoing wallet transfers that arrived at an exchange account or an own wallet.
+
+    Args:
+        spending: Outgoing transfers of a wallet CSV export (see settlement.read_spending)
+        movements: Exchange deposits and withdrawals and own wallet transfers
+        window_ms: Longest time between the outgoing and the incoming side of a transfer
+
+    Returns:
+        DataFrame with the matched transfers, their counterpart and their position in
+        `spending` (column 'Spending Row')
+    """
+    spending_rows = spending_movements(spending)
+    combined = pd.concat([spending_rows, movements], ignore_index=True)
+    pairs = reconcile(combined, window_ms)
+    pairs = pairs[pairs["out_row"] < len(spending_rows)].sort_values("out_row")
+
+    out_rows = pairs["out_row"].to_numpy()
+    counterparts = combined.iloc[pairs["in_row"].to_numpy()]
+    counterpart_times = np.datetime_as_string(
+        counterparts["time"].to_numpy().astype("datetime64[ms]"), unit="s"
+    )
+    return pd.DataFrame(
+        {
+            TIME_COLUMN: spending[TIME_COLUMN].to_numpy()[out_rows],
+            SYMBOL_COLUMN: spending[SYMBOL_COLUMN].to_numpy()[out_rows],
+            VALUE_COLUMN: spending[VALUE_COLUMN].to_numpy()[out_rows],
+            TRANSACTION_ID_COLUMN: spending[TRANSACTION_ID_COLUMN].to_numpy()[out_rows],
+            "Counterparty": counterparts["source"].to_numpy(),
+            "Counterparty Time(ISO8601-UTC)": np.char.add(counterpart_times.astype(str), "Z"),
+            "Counterparty Value": counterparts["amount"].to_numpy(),
+            "Match": pairs["match"].to_numpy(),
+            "Spending Row": out_rows,
+        }
+    )
+
+
+def exclude_internal(spending: pd.DataFrame, internal: pd.DataFrame | None) -> pd.DataFrame:
+    """
+    Spending without the transfers found by `internal_transfers`.
+    """
+    if internal is None or not len(internal):
+        return spending
+    keep = np.ones(len(spending), dtype=bool)
+    keep[internal["Spending Row"].to_numpy()] = False
+    return spending[keep].reset_index(drop=True)
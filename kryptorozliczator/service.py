@@ -0,0 +1,515 @@
+"""
+Local service answering settlement and rate queries from warm in-memory tables.
+
+The service keeps the parsed trade and movement journals, the spending CSV exports, the NBP
+rate arrays and the rate cache resident between requests. Journals are append-only, so after a
+sync (by the service itself or by another `kryptorozliczator run`) only the lines appended
+since the last request are parsed; a replaced CSV export is read again. Valued trades, internal
+transfers and valued spending are cached per tax year and recomputed only when a table they
+depend on changed, so a PIT-38 variant (e.g. without one wallet) is answered in milliseconds.
+
+The JSON API is served over HTTP on localhost or on a Unix socket:
+
+    GET  /health
+    GET  /trades?year=2024
+    GET  /pit38?year=2024&exclude_wallet=coinomi&exclude_exchange=zonda&prior_costs=0
+    GET  /rates/nbp?currency=USD&date=2024-03-01
+    GET  /rates/pln?asset=SOL&time=2024-03-01T12:00:00Z&interval=1m
+    POST /sync?year=2024
+"""
+
+import json
+import os
+import socketserver
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from kryptorozliczator.exchange_interfaces.trade_journal import MOVEMENTS_ACCOUNT, TradeJournal
+from kryptorozliczator.exchange_interfaces.trade_record import TradeBatch
+from kryptorozliczator.ledger import tax_years
+from kryptorozliczator.rates.nbp_tables import NbpRateTable
+from kryptorozliczator.rates.rate_provider import RateProvider
+from kryptorozliczator.rates.rate_routing import RateRouter
+from kryptorozliczator.reconciliation import (
+    empty_movements,
+    exchange_movements,
+    exclude_internal,
+    internal_transfers,
+)
+from kryptorozliczator.settlement import (
+    fetch_exchange_movements,
+    fetch_exchange_trades,
+    read_spending,
+    spending_in_year,
+    value_spending,
+)
+from kryptorozliczator.tax.pit38 import (
+    FIAT_CURRENCY_SYMBOLS,
+    compute_pit38,
+    summarize_conversions,
+    value_trades,
+)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8787
+HTTP_OK = 200
+HTTP_BAD_REQUEST = 400
+HTTP_NOT_FOUND = 404
+HTTP_INTERNAL_ERROR = 500
+# NBP publications before a queried day needed by "rate from the day before"
+NBP_LOOKBACK_DAYS = 15
+
+
+class JournalTable:
+    def __init__(self, path: Path, parse: Callable[[list[dict]], Any], concat: Callable):
+        """
+        In-memory table of an append-only JSONL journal, refreshed incrementally.
+
+        Args:
+            path: Journal file
+            parse: Converts a list of journal records to a table part
+            concat: Joins table parts into one table
+        """
+        self.path = path
+        self.parse = parse
+        self.concat = concat
+        self.table = concat([])
+        self.version = 0
+        self._offset = 0
+
+    def refresh(self) -> bool:
+        """
+        Parse the lines appended since the last refresh; a shorter file is read again.
+
+        Returns:
+            Whether the table changed
+        """
+        size = self.path.stat().st_size if self.path.exists() else 0
+        if size < self._offset:
+            self.table, self._offset = self.concat([]), 0
+        if size == self._offset:
+            return False
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read(size - self._offset)
+        # A line still being written is left for the next refresh
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return False
+        records = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+        self.table = self.concat([self.table, self.parse(records)])
+        self._offset += end
+        self.version += 1
+        return True
+
+
+class SpendingTable:
+    def __init__(self, csv_path: Path):
+        """
+        Outgoing transfers of a wallet CSV export of all years, read again when the file
+        changes. The wallet is named after the file.
+        """
+        self.csv_path = Path(csv_path).expanduser()
+        self.wallet = self.csv_path.stem
+        self.table: pd.DataFrame | None = None
+        self.version = 0
+        self._stat: tuple[int, int] | None = None
+
+    def refresh(self) -> bool:
+        stat = self.csv_path.stat()
+        file_stat = (stat.st_size, stat.st_mtime_ns)
+        if file_stat == self._stat:
+            return False
+        self.table = read_spending(self.csv_path, wallet=self.wallet)
+        self._stat = file_stat
+        self.version += 1
+        return True
+
+
+@dataclass
+class Pit38Query:
+    """
+    A PIT-38 variant asked of the service.
+
+    Attributes:
+        year: Tax year
+        exclude_exchanges: Exchanges whose trades are left out
+        exclude_wallets: Spending wallets (CSV file names without the extension) left out
+        prior_costs: Unsettled costs from previous years in PLN (field 36)
+        valuation_interval: Candle interval of the spending valuation, '1d', '1h' or '1m'
+    """
+
+    year: int
+    exclude_exchanges: list[str] = field(default_factory=list)
+    exclude_wallets: list[str] = field(default_factory=list)
+    prior_costs: float = 0.0
+    valuation_interval: str = "1d"
+
+
+class SettlementService:
+    def __init__(
+        self,
+        exchanges: list[str],
+        spending_csvs: list[Path] | None = None,
+        offline: bool = False,
+        fiat_currencies=FIAT_CURRENCY_SYMBOLS,
+    ):
+        """
+        Warm trades, spending and rates answering settlement queries.
+
+        Args:
+            exchanges: CCXT exchange IDs whose trade and movement journals are served
+            spending_csvs: Wallet CSV exports with purchases paid in crypto
+            offline: Use the journals and cached rates only, never the network
+            fiat_currencies: Currencies whose pairs affect the tax
+        """
+        self.exchanges = sorted(exchanges)
+        self.offline = offline
+        self.fiat_currencies = fiat_currencies
+        self.rate_provider = RateProvider(offline=offline)
+        self.nbp_table = NbpRateTable(self.rate_provider.cache)
+        self._router: RateRouter | None = None
+        self._loaded_years: set[int] = set()
+        self.trades = {
+            name: JournalTable(
+                TradeJournal(name).trades_path,
+                lambda records, name=name: TradeBatch.from_ccxt(records, name),
+                TradeBatch.concat,
+            )
+            for name in self.exchanges
+        }
+        self.movements = {
+            name: JournalTable(
+                TradeJournal(name, MOVEMENTS_ACCOUNT).trades_path,
+                lambda records, name=name: exchange_movements(records, name),
+                lambda parts: pd.concat([empty_movements(), *parts], ignore_index=True),
+            )
+            for name in self.exchanges
+        }
+        self.spending = {table.wallet: table for table in map(SpendingTable, spending_csvs or [])}
+        if len(self.spending) != len(spending_csvs or []):
+            raise ValueError("Spending CSV exports must have different file names")
+        # Derived tables with the versions of the tables they were computed from
+        self._derived: dict[tuple, tuple[tuple, Any]] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def router(self) -> RateRouter:
+        if self._router is None:
+            self._router = RateRouter(self.rate_provider)
+        return self._router
+
+    def refresh(self) -> bool:
+        """
+        Pick up new journal lines and changed CSV exports.
+
+        Returns:
+            Whether any table changed
+        """
+        with self._lock:
+            tables = [*self.trades.values(), *self.movements.values(), *self.spending.values()]
+            changed = [table.refresh() for table in tables]
+            return any(changed)
+
+    def _cached(self, key: tuple, versions: tuple, compute: Callable[[], Any]) -> Any:
+        """
+        Derived table stored under `key`, recomputed when the source `versions` changed.
+        """
+        cached = self._derived.get(key)
+        if cached is None or cached[0] != versions:
+            self._derived[key] = (versions, compute())
+        return self._derived[key][1]
+
+    def _load_year(self, year: int):
+        if year not in self._loaded_years:
+            self.nbp_table.load_year(year, self.fiat_currencies)
+            self._loaded_years.add(year)
+
+    def _valued_trades(self, exchange: str, year: int) -> pd.DataFrame:
+        table = self.trades[exchange]
+
+        def compute() -> pd.DataFrame:
+            self._load_year(year)
+            trades = table.table.select(tax_years(table.table["timestamp"]) == year)
+            return value_trades(trades.to_frame(), self.nbp_table, self.fiat_currencies)
+
+        return self._cached(("valued_trades", exchange, year), (table.version,), compute)
+
+    def _valued_spending(
+        self, wallet: str, year: int, valuation_interval: str
+    ) -> tuple[pd.DataFrame, pd.DataFrame]:
+        spending = self.spending[wallet]
+        versions = (
+            spending.version,
+            *(self.movements[name].version for name in self.exchanges),
+        )
+
+        def internal() -> pd.DataFrame:
+            # Transfers to any served exchange are internal, even if its trades are excluded
+            movements = pd.concat(
+                [empty_movements(), *(journal.table for journal in self.movements.values())],
+                ignore_index=True,
+            )
+            return internal_transfers(spending_in_year(spending.table, year), movements)
+
+        internal_spending = self._cached(("internal_transfers", wallet, year), versions, internal)
+
+        def valued() -> pd.DataFrame:
+            in_year = spending_in_year(spending.table, year).reset_index(drop=True)
+            in_year = exclude_internal(in_year, internal_spending)
+            return value_spending(in_year, self.rate_provider, valuation_interval)
+
+        valued_key = ("valued_spending", wallet, year, valuation_interval)
+        return self._cached(valued_key, versions, valued), internal_spending
+
+    def trades_summary(self, year: int | None = None) -> dict:
+        """
+        Number of journaled trades and movements per exchange, of one tax year or of all.
+        """
+        self.refresh()
+        with self._lock:
+            summary = {}
+            for name in self.exchanges:
+                trades = self.trades[name].table
+                movements = self.movements[name].table
+                if year is not None:
+                    trades = trades.select(tax_years(trades["timestamp"]) == year)
+                    movements = movements[tax_years(movements["time"].to_numpy()) == year]
+                summary[name] = {"trades": len(trades), "movements": len(movements)}
+            return summary
+
+    def pit38(self, query: Pit38Query) -> dict:
+        """
+        PIT-38 fields of a tax year from the resident tables.
+
+        Raises:
+            ValueError: If an excluded exchange or wallet is not served
+        """
+        unknown = (set(query.exclude_exchanges) - set(self.exchanges)) | (
+            set(query.exclude_wallets) - set(self.spending)
+        )
+        if unknown:
+            raise ValueError(f"Unknown exchanges or wallets: {', '.join(sorted(unknown))}")
+
+        self.refresh()
+        with self._lock:
+            exchanges = [name for name in self.exchanges if name not in query.exclude_exchanges]
+            valued_trades = [self._valued_trades(name, query.year) for name in exchanges]
+            if valued_trades:
+                totals = summarize_conversions(pd.concat(valued_trades), self.fiat_currencies)
+            else:
+                totals = pd.DataFrame(
+                    {"total_buy_cost_pln": [], "total_sell_revenue_pln": [], "total_fee_pln": []}
+                )
+            wallets = [name for name in self.spending if name not in query.exclude_wallets]
+            spending = {
+                name: self._valued_spending(name, query.year, query.valuation_interval)
+                for name in wallets
+            }
+
+        spending_revenue = sum(float(valued["PLN Value"].sum()) for valued, _ in spending.values())
+        pit38 = compute_pit38(
+            float(totals["total_sell_revenue_pln"].sum()) + spending_revenue,
+            float(totals["total_buy_cost_pln"].sum()),
+            float(totals["total_fee_pln"].sum()),
+            query.prior_costs,
+        )
+        return {
+            "year": query.year,
+            "exchanges": exchanges,
+            "wallets": wallets,
+            "trades": sum(len(frame) for frame in valued_trades),
+            "spending_transfers": {name: len(valued) for name, (valued, _) in spending.items()},
+            "internal_transfers": {name: len(internal) for name, (_, internal) in spending.items()},
+            "spending_revenue_pln": spending_revenue,
+            "pit38": asdict(pit38),
+        }
+
+    def nbp_rate(self, currency_code: str, day: date) -> float:
+        """
+        NBP mid rate of a currency from the last publication day before `day`.
+        """
+        with self._lock:
+            if not self.offline:
+                self.nbp_table.load_range(
+                    currency_code, day - timedelta(days=NBP_LOOKBACK_DAYS), day
+                )
+            return self.nbp_table.rate_before(currency_code, day)
+
+    def pln_rate(self, asset: str, timestamp: np.datetime64, interval: str = "1d") -> float:
+        """
+        PLN price of an asset at a UTC time, like the spending valuation.
+        """
+        timestamp = np.datetime64(timestamp, "ms")
+        with self._lock:
+            rates = self.router.rates(
+                [asset],
+                np.array([timestamp], dtype="datetime64[D]"),
+                np.array([timestamp.astype(np.int64)]),
+                interval,
+            )
+        return float(rates[0])
+
+    def sync(self, year: int) -> dict:
+        """
+        Fetch new trades, deposits and withdrawals of a tax year into the journals.
+
+        Raises:
+            ValueError: If the service is offline
+        """
+        if self.offline:
+            raise ValueError("The service is offline and cannot sync")
+        with self._lock:
+            fetch_exchange_trades(self.exchanges, year)
+            fetch_exchange_movements(self.exchanges, year)
+            self._load_year(year)
+        self.refresh()
+        return self.trades_summary(year)
+
+
+def _query_values(query: dict[str, list[str]], name: str) -> list[str]:
+    return [value for values in query.get(name, []) for value in values.split(",") if value]
+
+
+def _query_value(query: dict[str, list[str]], name: str, default: str | None = None) -> str:
+    values = query.get(name)
+    if values:
+        return values[-1]
+    if default is None:
+        raise ValueError(f"Missing query parameter '{name}'")
+    return default
+
+
+class ServiceApi:
+    def __init__(self, service: SettlementService):
+        """
+        Routes of the JSON API of a settlement service.
+        """
+        self.service = service
+        self.routes: dict[tuple[str, str], Callable[[dict], dict]] = {
+            ("GET", "/health"): self.health,
+            ("GET", "/trades"): self.trades,
+            ("GET", "/pit38"): self.pit38,
+            ("GET", "/rates/nbp"): self.nbp_rate,
+            ("GET", "/rates/pln"): self.pln_rate,
+            ("POST", "/sync"): self.sync,
+        }
+
+    def health(self, query: dict) -> dict:
+        return {
+            "status": "ok",
+            "offline": self.service.offline,
+            "exchanges": self.service.exchanges,
+            "wallets": sorted(self.service.spending),
+            "rate_cache": self.service.rate_provider.stats.as_dict(),
+        }
+
+    def trades(self, query: dict) -> dict:
+        year = query.get("year")
+        return self.service.trades_summary(int(year[-1]) if year else None)
+
+    def pit38(self, query: dict) -> dict:
+        return self.service.pit38(
+            Pit38Query(
+                year=int(_query_value(query, "year")),
+                exclude_exchanges=_query_values(query, "exclude_exchange"),
+                exclude_wallets=_query_values(query, "exclude_wallet"),
+                prior_costs=float(_query_value(query, "prior_costs", "0")),
+                valuation_interval=_query_value(query, "valuation_interval", "1d"),
+            )
+        )
+
+    def nbp_rate(self, query: dict) -> dict:
+        currency_code = _query_value(query, "currency").upper()
+        day = date.fromisoformat(_query_value(query, "date"))
+        rate = self.service.nbp_rate(currency_code, day)
+        return {"currency": currency_code, "date": str(day), "rate": rate}
+
+    def pln_rate(self, query: dict) -> dict:
+        asset = _query_value(query, "asset").upper()
+        time_text = _query_value(query, "time")
+        interval = _query_value(query, "interval", "1d")
+        timestamp = pd.Timestamp(time_text)
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.tz_convert("UTC").tz_localize(None)
+        rate = self.service.pln_rate(asset, timestamp.to_datetime64(), interval)
+        return {"asset": asset, "time": time_text, "interval": interval, "rate": rate}
+
+    def sync(self, query: dict) -> dict:
+        return self.service.sync(int(_query_value(query, "year")))
+
+    def handle(self, method: str, path: str) -> tuple[int, dict]:
+        """
+        Answer one request.
+
+        Returns:
+            HTTP status and JSON body; bad parameters and unknown data are answered with 400
+        """
+        url = urlparse(path)
+        route = self.routes.get((method, url.path.rstrip("/") or "/"))
+        if route is None:
+            return HTTP_NOT_FOUND, {"error": f"No route {method} {url.path}"}
+        try:
+            return HTTP_OK, route(parse_qs(url.query))
+        except (LookupError, ValueError) as e:
+            return HTTP_BAD_REQUEST, {"error": str(e)}
+        except Exception as e:
+            return HTTP_INTERNAL_ERROR, {"error": f"{type(e).__name__}: {e}"}
+
+
+def _handler_class(api: ServiceApi):
+    class Handler(BaseHTTPRequestHandler):
+        def _respond(self, method: str):
+            started = time.perf_counter()
+            status, body = api.handle(method, self.path)
+            payload = json.dumps(body, default=str).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            print(f"{method} {self.path} {status} {elapsed_ms:.1f} ms")
+
+        def do_GET(self):  # noqa: N802 - name required by BaseHTTPRequestHandler
+            self._respond("GET")
+
+        def do_POST(self):  # noqa: N802 - name required by BaseHTTPRequestHandler
+            self._respond("POST")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(
+    service: SettlementService,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    socket_path: Path | None = None,
+) -> socketserver.BaseServer:
+    """
+    HTTP server of the JSON API on a local port, or on a Unix socket if `socket_path` is set.
+    """
+    handler = _handler_class(ServiceApi(service))
+    if socket_path is None:
+        return ThreadingHTTPServer((host, port), handler)
+    socket_path = Path(socket_path).expanduser()
+    if socket_path.exists():
+        os.unlink(socket_path)
+    return ThreadingUnixHTTPServer(str(socket_path), handler)
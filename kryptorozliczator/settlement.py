@@ -0,0 +1,538 @@
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from kryptorozliczator.exchange_interfaces.trade_journal import MOVEMENTS_ACCOUNT, TradeJournal
+from kryptorozliczator.exchange_interfaces.trade_record import TradeBatch
+from kryptorozliczator.money import (
+    AMOUNT_DECIMALS,
+    PLN_DECIMALS,
+    RATE_DECIMALS,
+    from_units_array,
+    mul_rate,
+    to_units_array,
+)
+from kryptorozliczator.pipeline import Pipeline, Stage, frame_digest
+from kryptorozliczator.rates.nbp_tables import NbpRateTable
+from kryptorozliczator.rates.rate_provider import RateProvider
+from kryptorozliczator.rates.rate_routing import RateRouter
+from kryptorozliczator.reconciliation import (
+    MATCH_BY_AMOUNT,
+    empty_movements,
+    exchange_movements,
+    exclude_internal,
+    internal_transfers,
+    wallet_movements,
+)
+from kryptorozliczator.tax.periods import year_bounds_ms
+from kryptorozliczator.tax.pit38 import (
+    FIAT_CURRENCY_SYMBOLS,
+    Pit38,
+    compute_pit38,
+    conversions_summary_frame,
+    currency_summary_frame,
+    pit38_frame,
+    summarize_conversions,
+    totals_frame,
+    value_trades,
+)
+from kryptorozliczator.wallet_interfaces.importers import (
+    SYMBOL_COLUMN,
+    TIME_COLUMN,
+    VALUE_COLUMN,
+    read_transfers,
+    transfer_timestamps,
+)
+
+DEFAULT_DATA_DIR = Path.home() / "kryptorozliczator"
+
+# Columns of the normalized wallet transfers
+SPENDING_TIME_COLUMN = TIME_COLUMN
+SPENDING_SYMBOL_COLUMN = SYMBOL_COLUMN
+SPENDING_VALUE_COLUMN = VALUE_COLUMN
+
+
+def output_dir_for(year: int) -> Path:
+    return DEFAULT_DATA_DIR / str(year) / "output"
+
+
+def read_spending(
+    csv_path: str | Path,
+    wallet: str | None = None,
+    first_year: int | None = None,
+    last_year: int | None = None,
+) -> pd.DataFrame:
+    """
+    Read outgoing transfers from a wallet CSV export (Coinomi or Ledger Live).
+
+    All outgoing transfers are read; those that went to an own exchange account or wallet are
+    found later by `reconciliation.internal_transfers`. The export is streamed and only
+    transfers from `first_year` to `last_year` are kept.
+
+    Args:
+        csv_path: Path of the exported CSV file
+        wallet: Wallet name stored in the `wallet` column, by default '<format>_spending'
+        first_year: First year to read, all years by default
+        last_year: Last year to read, all years by default
+
+    Returns:
+        DataFrame with the outgoing transfers
+    """
+    transfers = read_transfers(csv_path, first_year, last_year, wallet=wallet)
+    return transfers[transfers[SPENDING_VALUE_COLUMN] < 0].reset_index(drop=True)
+
+
+def spending_in_year(spending: pd.DataFrame, year: int) -> pd.DataFrame:
+    """
+    Outgoing transfers of a tax year, in Polish time like the exchange trades.
+    """
+    since, until = year_bounds_ms(year)
+    timestamps = transfer_timestamps(spending[SPENDING_TIME_COLUMN])
+    return spending[(timestamps >= since) & (timestamps < until)].copy()
+
+
+def load_spending(csv_path: str | Path, year: int, wallet: str | None = None):
+    """
+    Read outgoing transfers of a tax year from a wallet CSV export.
+
+    Args:
+        csv_path: Path of the exported CSV file
+        year: Tax year
+        wallet: Wallet name stored in the `wallet` column, by default '<format>_spending'
+
+    Returns:
+        DataFrame with the outgoing transfers of the year
+    """
+    return read_spending(csv_path, wallet, year, year)
+
+
+def value_spending(
+    spending: pd.DataFrame, rate_provider: RateProvider, valuation_interval: str = "1d"
+) -> pd.DataFrame:
+    """
+    Add the PLN rate and value of outgoing transfers.
+
+    With the default '1d' interval transfers are valued at the daily close of their UTC day.
+    With '1h' or '1m' every transfer is valued at its exact UTC time, at the close of the last
+    candle of that interval finished before it. Assets without a PLN market are converted along
+    the cheapest path of Binance markets and NBP rates (see RateRouter). The PLN value is
+    computed in fixed-point and rounded to grosze per transfer.
+
+    Args:
+        spending: Outgoing transfers
+        rate_provider: Source of the Binance prices
+        valuation_interval: Candle interval of the valuation, '1d', '1h' or '1m'
+    """
+    spending = spending.copy()
+    times = pd.to_datetime(spending[SPENDING_TIME_COLUMN], utc=True).dt.tz_localize(None)
+    timestamps = times.to_numpy(dtype="datetime64[ms]")
+    spending["Rate [PLN]"] = RateRouter(rate_provider).rates(
+        spending[SPENDING_SYMBOL_COLUMN].to_numpy(dtype=str),
+        timestamps.astype("datetime64[D]"),
+        timestamps.astype(np.int64),
+        valuation_interval,
+    )
+    value_grosze = mul_rate(
+        to_units_array(spending[SPENDING_VALUE_COLUMN].astype(float).abs(), AMOUNT_DECIMALS),
+        to_units_array(spending["Rate [PLN]"].astype(float), RATE_DECIMALS),
+        AMOUNT_DECIMALS,
+        PLN_DECIMALS,
+    )
+    spending["PLN Value"] = from_units_array(value_grosze, PLN_DECIMALS)
+    return spending
+
+
+def load_journal_trades(
+    exchanges: list[str], year: int, last_year: int | None = None
+) -> TradeBatch:
+    """
+    Read the trades of a tax year (or of the years up to `last_year`) from local trade journals,
+    without touching the network.
+    """
+    since, until = year_bounds_ms(year)
+    if last_year is not None:
+        until = year_bounds_ms(last_year)[1]
+    return TradeBatch.concat(
+        TradeBatch.from_ccxt(page, exchange_name)
+        for exchange_name in exchanges
+        for page in TradeJournal(exchange_name).iter_pages(since, until)
+    )
+
+
+def fetch_exchange_trades(exchanges: list[str], year: int) -> TradeBatch:
+    """
+    Sync the trade journals of the given exchanges and return the trades of a tax year.
+    """
+    # ccxt takes a while to import, so it is only loaded when exchanges are actually queried
+    from kryptorozliczator.exchange_interfaces.concurrent_fetch import fetch_transaction_histories
+    from kryptorozliczator.exchange_interfaces.exchange_interface import ExchangeInterface
+
+    interfaces = [ExchangeInterface(name, TradeJournal(name)) for name in exchanges]
+    histories = fetch_transaction_histories(interfaces, year)
+    return TradeBatch.concat(
+        TradeBatch.from_ccxt(transactions, exchange_name)
+        for exchange_name, transactions in histories.items()
+    )
+
+
+def load_journal_movements(
+    exchanges: list[str], year: int, last_year: int | None = None
+) -> pd.DataFrame:
+    """
+    Read the deposits and withdrawals of a tax year (or of the years up to `last_year`) from
+    local movement journals, without touching the network.
+    """
+    since, until = year_bounds_ms(year)
+    if last_year is not None:
+        until = year_bounds_ms(last_year)[1]
+    return pd.concat(
+        [empty_movements()]
+        + [
+            exchange_movements(page, exchange_name)
+            for exchange_name in exchanges
+            for page in TradeJournal(exchange_name, MOVEMENTS_ACCOUNT).iter_pages(since, until)
+        ],
+        ignore_index=True,
+    )
+
+
+def fetch_exchange_movements(exchanges: list[str], year: int):
+    """
+    Fetch the deposits and withdrawals of the given exchanges in a tax year into their
+    movement journals.
+    """
+    from kryptorozliczator.exchange_interfaces.concurrent_fetch import fetch_movement_histories
+    from kryptorozliczator.exchange_interfaces.exchange_interface import ExchangeInterface
+
+    interfaces = [ExchangeInterface(name) for name in exchanges]
+    for exchange_name, movements in fetch_movement_histories(interfaces, year).items():
+        TradeJournal(exchange_name, MOVEMENTS_ACCOUNT).append(movements)
+
+
+def scan_wallet_movements(wallet_names: list[str], year: int) -> pd.DataFrame:
+    """
+    Scan the on-chain transfers of wallets from the wallet configuration in a tax year.
+    """
+    from kryptorozliczator.wallet_interfaces.transfers import TransfersInterface
+
+    wallets = TransfersInterface().scan_wallets(wallet_names, year)
+    return pd.concat(
+        [empty_movements()]
+        + [wallet_movements(transfers, name) for name, transfers in wallets.items()],
+        ignore_index=True,
+    )
+
+
+@dataclass
+class SettlementResult:
+    conversions: pd.DataFrame
+    conversions_totals: pd.DataFrame
+    spending: pd.DataFrame
+    total_buy_cost_pln: float
+    total_sell_revenue_pln: float
+    total_fee_pln: float
+    pit38: Pit38
+    internal_transfers: pd.DataFrame | None = None
+
+
+def finish_settlement(
+    trades: TradeBatch,
+    conversions_totals: pd.DataFrame,
+    spending: pd.DataFrame | None,
+    prior_years_costs: float = 0.0,
+    internal: pd.DataFrame | None = None,
+) -> SettlementResult:
+    """
+    Combine per-currency conversion totals and valued spending into the PIT-38 values.
+
+    Args:
+        trades: Exchange trades of the tax year
+        conversions_totals: Output of summarize_conversions for these trades
+        spending: Output of value_spending, or None if there was no spending
+        prior_years_costs: Unsettled costs carried over from previous years
+        internal: Output of internal_transfers, kept in the result for the report
+
+    Returns:
+        SettlementResult with the intermediate frames, the totals and the PIT-38 values
+    """
+    if spending is None:
+        spending = pd.DataFrame({"PLN Value": pd.Series(dtype=float)})
+
+    total_buy_cost_pln = float(conversions_totals["total_buy_cost_pln"].sum())
+    total_sell_revenue_pln = float(conversions_totals["total_sell_revenue_pln"].sum())
+    total_fee_pln = float(conversions_totals["total_fee_pln"].sum())
+    spending_revenue_pln = float(spending["PLN Value"].sum())
+
+    return SettlementResult(
+        conversions=trades.to_frame(),
+        conversions_totals=conversions_totals,
+        spending=spending,
+        total_buy_cost_pln=total_buy_cost_pln,
+        total_sell_revenue_pln=total_sell_revenue_pln + spending_revenue_pln,
+        total_fee_pln=total_fee_pln,
+        pit38=compute_pit38(
+            total_sell_revenue_pln + spending_revenue_pln,
+            total_buy_cost_pln,
+            total_fee_pln,
+            prior_years_costs,
+        ),
+        internal_transfers=internal,
+    )
+
+
+def settle_year(
+    trades: TradeBatch,
+    spending: pd.DataFrame | None,
+    nbp_table: NbpRateTable,
+    prior_years_costs: float = 0.0,
+    fiat_currencies=FIAT_CURRENCY_SYMBOLS,
+) -> SettlementResult:
+    """
+    Compute the yearly settlement from exchange trades and valued spending transfers.
+
+    Args:
+        trades: Exchange trades of the tax year
+        spending: Output of value_spending, or None if there was no spending
+        nbp_table: NBP rate table loaded for the tax year
+        prior_years_costs: Unsettled costs carried over from previous years
+        fiat_currencies: Currencies whose pairs affect the tax
+
+    Returns:
+        SettlementResult with the intermediate frames, the totals and the PIT-38 values
+    """
+    valued = value_trades(trades.to_frame(), nbp_table, fiat_currencies)
+    conversions_totals = summarize_conversions(valued, fiat_currencies)
+    return finish_settlement(trades, conversions_totals, spending, prior_years_costs)
+
+
+def _load_spending_stage(spending_csv: Path | None, year: int) -> pd.DataFrame | None:
+    return load_spending(spending_csv, year) if spending_csv is not None else None
+
+
+def _movements_stage(
+    exchanges: tuple[str, ...], own_wallets: tuple[str, ...], year: int, offline: bool
+) -> pd.DataFrame:
+    if not offline:
+        fetch_exchange_movements(list(exchanges), year)
+    movements = load_journal_movements(list(exchanges), year)
+    if not own_wallets:
+        return movements
+    if offline:
+        print("Own wallets are not scanned offline, only exchange movements are reconciled")
+        return movements
+    wallets = scan_wallet_movements(list(own_wallets), year)
+    return pd.concat([movements, wallets], ignore_index=True)
+
+
+def _internal_transfers_stage(
+    spending: pd.DataFrame | None, movements: pd.DataFrame
+) -> pd.DataFrame | None:
+    if spending is None:
+        return None
+    internal = internal_transfers(spending, movements)
+    print(f"{len(internal)} of {len(spending)} outgoing transfers are internal")
+    by_amount = int((internal["Match"] == MATCH_BY_AMOUNT).sum())
+    if by_amount:
+        print(
+            f"{by_amount} of them matched by amount and time only, "
+            "see 'Match' in intermediate/internal_transfers.csv"
+        )
+    return internal
+
+
+def _value_spending_stage(
+    spending: pd.DataFrame | None,
+    internal_transfers: pd.DataFrame | None,
+    valuation_interval: str,
+    offline: bool,
+) -> pd.DataFrame | None:
+    if spending is None:
+        return None
+    spending = exclude_internal(spending, internal_transfers)
+    return value_spending(spending, RateProvider(offline=offline), valuation_interval)
+
+
+def _trades_stage(exchanges: tuple[str, ...], year: int, offline: bool) -> TradeBatch:
+    if offline:
+        return load_journal_trades(list(exchanges), year)
+    return fetch_exchange_trades(list(exchanges), year)
+
+
+def _trades_digest(trades: TradeBatch) -> str:
+    # The pickle of a batch carries the name codes of this process, which depend on the order
+    # in which exchanges answered, so the digest is taken from the values
+    return frame_digest(trades.to_frame())
+
+
+def _value_trades_stage(
+    trades: TradeBatch, year: int, fiat_currencies, offline: bool
+) -> pd.DataFrame:
+    nbp_table = NbpRateTable(RateProvider(offline=offline).cache)
+    nbp_table.load_year(year, fiat_currencies)
+    return value_trades(trades.to_frame(), nbp_table, fiat_currencies)
+
+
+def _settlement_stage(
+    trades: TradeBatch,
+    conversions_totals: pd.DataFrame,
+    valued_spending: pd.DataFrame | None,
+    internal_transfers: pd.DataFrame | None,
+    prior_years_costs: float,
+) -> SettlementResult:
+    return finish_settlement(
+        trades, conversions_totals, valued_spending, prior_years_costs, internal_transfers
+    )
+
+
+# The notebook flow as checkpointed stages: changing only the prior years costs reruns just
+# the last stage, a new spending CSV reruns the spending stages and so on. Exchange trades and
+# movements are synced (or read from the journals offline) on every run, and the stages after
+# them rerun only when new ones arrived.
+SETTLEMENT_STAGES = [
+    Stage("spending", _load_spending_stage, inputs=("spending_csv", "year"), version=2),
+    Stage(
+        "movements",
+        _movements_stage,
+        inputs=("exchanges", "own_wallets", "year"),
+        options=("offline",),
+        volatile=True,
+        digest=frame_digest,
+    ),
+    Stage("internal_transfers", _internal_transfers_stage, inputs=("spending", "movements")),
+    Stage(
+        "valued_spending",
+        _value_spending_stage,
+        inputs=("spending", "internal_transfers", "valuation_interval"),
+        options=("offline",),
+        version=3,
+    ),
+    Stage(
+        "trades",
+        _trades_stage,
+        inputs=("exchanges", "year"),
+        options=("offline",),
+        version=2,
+        volatile=True,
+        digest=_trades_digest,
+    ),
+    Stage(
+        "valued_trades",
+        _value_trades_stage,
+        inputs=("trades", "year", "fiat_currencies"),
+        options=("offline",),
+        version=2,
+    ),
+    Stage(
+        "conversions_totals",
+        summarize_conversions,
+        inputs=("valued_trades", "fiat_currencies"),
+        version=2,
+    ),
+    Stage(
+        "settlement",
+        _settlement_stage,
+        inputs=(
+            "trades",
+            "conversions_totals",
+            "valued_spending",
+            "internal_transfers",
+            "prior_years_costs",
+        ),
+    ),
+]
+
+
+def checkpoint_dir_for(year: int) -> Path:
+    return DEFAULT_DATA_DIR / str(year) / "checkpoints"
+
+
+@dataclass
+class SettlementParams:
+    """
+    Parameters of a yearly settlement.
+
+    Attributes:
+        year: Tax year
+        exchanges: CCXT exchange IDs
+        spending_csv: Wallet CSV export (Coinomi or Ledger Live) with purchases paid in crypto
+        prior_years_costs: Unsettled costs carried over from previous years
+        offline: Use trade journals and cached rates only
+        fiat_currencies: Currencies whose pairs affect the tax
+        valuation_interval: Candle interval of the spending valuation, '1d', '1h' or '1m'
+        own_wallets: Wallets from the wallet configuration whose incoming transfers make
+            spending transfers internal, like deposits to the exchanges
+    """
+
+    year: int
+    exchanges: list[str]
+    spending_csv: Path | None = None
+    prior_years_costs: float = 0.0
+    offline: bool = False
+    fiat_currencies: frozenset[str] = FIAT_CURRENCY_SYMBOLS
+    valuation_interval: str = "1d"
+    own_wallets: list[str] | None = None
+
+    def pipeline_params(self) -> dict:
+        return {
+            "year": self.year,
+            "exchanges": tuple(sorted(self.exchanges)),
+            "spending_csv": Path(self.spending_csv) if self.spending_csv is not None else None,
+            "prior_years_costs": self.prior_years_costs,
+            "offline": self.offline,
+            "fiat_currencies": frozenset(self.fiat_currencies),
+            "valuation_interval": self.valuation_interval,
+            "own_wallets": tuple(sorted(self.own_wallets or ())),
+        }
+
+
+def run_settlement(
+    params: SettlementParams,
+    checkpoint_dir: Path | None = None,
+    from_stage: str | None = None,
+) -> SettlementResult:
+    """
+    Run the yearly settlement as a checkpointed pipeline.
+
+    Stages whose inputs did not change since the last run are loaded from their checkpoints.
+    Exchange trades and movements are synced on every run, so new trades are always picked up.
+
+    Args:
+        params: Settlement parameters
+        checkpoint_dir: Checkpoint directory, by default ~/kryptorozliczator/YEAR/checkpoints
+        from_stage: Name of the first stage to recompute regardless of checkpoints
+
+    Returns:
+        SettlementResult of the year
+    """
+    pipeline = Pipeline(SETTLEMENT_STAGES, checkpoint_dir or checkpoint_dir_for(params.year))
+    return pipeline.run(params.pipeline_params(), from_stage=from_stage)["settlement"]
+
+
+def write_outputs(result: SettlementResult, output_dir: Path):
+    """
+    Write the settlement tables as CSV files, with the same layout as the notebook.
+    """
+    intermediate_output_dir = output_dir / "intermediate"
+    intermediate_output_dir.mkdir(parents=True, exist_ok=True)
+
+    result.spending.to_csv(intermediate_output_dir / "outgoing_transfers.csv", index=False)
+    if result.internal_transfers is not None:
+        result.internal_transfers.to_csv(
+            intermediate_output_dir / "internal_transfers.csv", index=False
+        )
+    result.conversions.to_csv(intermediate_output_dir / "conversions.csv", index=False)
+    for currency_symbol, totals in result.conversions_totals.iterrows():
+        currency_summary_frame(currency_symbol, totals).to_csv(
+            intermediate_output_dir / f"conversions_summary_{currency_symbol}.csv", index=False
+        )
+    conversions_summary_frame(
+        float(result.conversions_totals["total_buy_cost_pln"].sum()),
+        float(result.conversions_totals["total_sell_revenue_pln"].sum()),
+        result.total_fee_pln,
+    ).to_csv(intermediate_output_dir / "conversions_summary.csv", index=False)
+    totals_frame(
+        result.total_buy_cost_pln, result.total_sell_revenue_pln, result.total_fee_pln
+    ).to_csv(output_dir / "TOTALS.csv", index=False)
+    pit38_frame(result.pit38).to_csv(output_dir / "PIT38.csv", index=False)
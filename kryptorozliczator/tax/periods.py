@@ -0,0 +1,18 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+# Trade dates (and so tax years and the "NBP rate from the day before") are taken in Polish time
+TAX_TIMEZONE = "Europe/Warsaw"
+
+
+def year_bounds_ms(year: int) -> tuple[int, int]:
+    """
+    Millisecond UTC timestamps of the start of a tax year and of the next one.
+
+    Returns:
+        (start, end) so that a trade belongs to the year if start <= timestamp < end
+    """
+    timezone = ZoneInfo(TAX_TIMEZONE)
+    start = datetime(year, 1, 1, tzinfo=timezone)
+    end = datetime(year + 1, 1, 1, tzinfo=timezone)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
@@ -0,0 +1,392 @@
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from kryptorozliczator.money import (
+    AMOUNT_DECIMALS,
+    PLN_DECIMALS,
+    RATE_DECIMALS,
+    from_units_array,
+    mul_rate,
+    round_units,
+    to_units_array,
+)
+from kryptorozliczator.tax.periods import TAX_TIMEZONE
+
+FIAT_CURRENCY_SYMBOLS = frozenset({"PLN", "USD", "EUR", "CHF", "GBP"})
+
+# Valued trade columns and the exact integer columns they are summed from
+SUM_COLUMNS = {
+    "transaction_value_pln": "transaction_value_pln_units",
+    "transaction_value_fiat": "transaction_value_fiat_units",
+    "fee_value_fiat": "fee_value_fiat_units",
+    "fee_value_pln": "fee_value_pln_units",
+}
+
+TOTAL_COLUMNS = [
+    "total_buy_cost_pln",
+    "total_buy_cost_original_currency",
+    "total_sell_revenue_pln",
+    "total_sell_revenue_original_currency",
+    "total_fee_fiat",
+    "total_fee_pln",
+]
+
+
+def normalize_trades(trades: pd.DataFrame) -> pd.DataFrame:
+    """
+    Flatten ccxt-shaped trades into the columns used by the tax engine.
+
+    The symbol is split into base and quote once for the whole column and the nested ccxt
+    `fee` dict is unpacked into `fee_cost` and `fee_currency`. Frames that already have the
+    flat columns are returned as they are.
+
+    Args:
+        trades: Trades with at least timestamp, symbol, side, cost, price and fee columns
+
+    Returns:
+        DataFrame with timestamp, base, quote, side, cost, price, fee_cost, fee_currency
+    """
+    if {"base", "quote", "fee_cost", "fee_currency"}.issubset(trades.columns):
+        return trades
+
+    # Split each distinct symbol once and broadcast the parts back to the rows
+    codes, symbols = pd.factorize(trades["symbol"])
+    parts = [symbol.split("/", 1) for symbol in symbols]
+    bases = np.array([part[0] for part in parts] + [None], dtype=object)[codes]
+    quotes = np.array([part[-1] for part in parts] + [None], dtype=object)[codes]
+    fees = trades["fee"].tolist() if "fee" in trades else [None] * len(trades)
+    return pd.DataFrame(
+        {
+            "timestamp": trades["timestamp"].to_numpy(dtype=np.int64),
+            "base": bases,
+            "quote": quotes,
+            "side": trades["side"].to_numpy(),
+            "cost": trades["cost"].to_numpy(dtype=np.float64),
+            "price": trades["price"].to_numpy(dtype=np.float64),
+            "fee_cost": [float(fee["cost"]) if fee else 0.0 for fee in fees],
+            "fee_currency": [fee["currency"] if fee else None for fee in fees],
+        },
+        index=trades.index,
+    )
+
+
+def trade_days(timestamps) -> np.ndarray:
+    """
+    Convert millisecond UTC timestamps into calendar days in the tax timezone.
+    """
+    local = pd.to_datetime(np.asarray(timestamps, dtype=np.int64), unit="ms", utc=True)
+    return local.tz_convert(TAX_TIMEZONE).tz_localize(None).to_numpy().astype("datetime64[D]")
+
+
+def _rates_for(rate_table, currencies: np.ndarray, days: np.ndarray) -> np.ndarray:
+    rates = np.full(len(currencies), np.nan)
+    for currency in pd.unique(currencies):
+        if currency is None:
+            continue
+        mask = currencies == currency
+        rates[mask] = rate_table.rates_before(currency, days[mask])
+    return rates
+
+
+def value_trades(
+    trades: pd.DataFrame, rate_table, fiat_currencies=FIAT_CURRENCY_SYMBOLS
+) -> pd.DataFrame:
+    """
+    Compute fiat and PLN values and fees of every trade that involves a fiat currency.
+
+    PLN values use the NBP mid rate from the last publication day before the trade date.
+    A fee paid in crypto is converted with the trade price into the quote currency first.
+    Values are computed as fixed-point integers with AMOUNT_DECIMALS decimals, so their sums
+    are exact and are only rounded to grosze in the totals.
+
+    Args:
+        trades: Trades in ccxt shape or as returned by normalize_trades
+        rate_table: Object with a rates_before(currency, days) method, e.g. NbpRateTable
+        fiat_currencies: Currencies whose pairs affect the tax
+
+    Returns:
+        The normalized fiat trades with transaction_value_fiat, transaction_value_pln,
+        fee_value_fiat and fee_value_pln columns, and the same values as exact integers in
+        the *_units columns the summaries are computed from
+
+    Raises:
+        ValueError: If a pair has a fiat base but a non-fiat quote currency
+    """
+    trades = normalize_trades(trades)
+    fiat = list(fiat_currencies)
+    base_is_fiat = trades["base"].isin(fiat).to_numpy()
+    quote_is_fiat = trades["quote"].isin(fiat).to_numpy()
+    trades = trades[base_is_fiat | quote_is_fiat]
+
+    unsupported = ~trades["quote"].isin(fiat)
+    if unsupported.any():
+        row = trades[unsupported].iloc[0]
+        raise ValueError(f"Unsupported currency symbol: {row['base']}/{row['quote']}")
+
+    days = trade_days(trades["timestamp"])
+    quotes = trades["quote"].to_numpy(dtype=object)
+    fee_currencies = trades["fee_currency"].to_numpy(dtype=object)
+    fee_is_fiat = pd.Series(fee_currencies).isin(fiat).to_numpy()
+
+    cost = to_units_array(trades["cost"].to_numpy(dtype=np.float64), AMOUNT_DECIMALS)
+    fee_cost = to_units_array(trades["fee_cost"].to_numpy(dtype=np.float64), AMOUNT_DECIMALS)
+    price = to_units_array(np.nan_to_num(trades["price"].to_numpy(dtype=np.float64)), RATE_DECIMALS)
+    quote_rate = to_units_array(_rates_for(rate_table, quotes, days), RATE_DECIMALS)
+    fee_rate = to_units_array(
+        np.nan_to_num(_rates_for(rate_table, np.where(fee_is_fiat, fee_currencies, None), days)),
+        RATE_DECIMALS,
+    )
+
+    fee_value_fiat = np.where(
+        fee_is_fiat, fee_cost, mul_rate(fee_cost, price, AMOUNT_DECIMALS, AMOUNT_DECIMALS)
+    )
+    value_pln = mul_rate(cost, quote_rate, AMOUNT_DECIMALS, AMOUNT_DECIMALS)
+    fee_value_pln = mul_rate(
+        fee_value_fiat,
+        np.where(fee_is_fiat, fee_rate, quote_rate),
+        AMOUNT_DECIMALS,
+        AMOUNT_DECIMALS,
+    )
+
+    return trades.assign(
+        transaction_value_fiat=from_units_array(cost, AMOUNT_DECIMALS),
+        transaction_value_pln=from_units_array(value_pln, AMOUNT_DECIMALS),
+        fee_value_fiat=from_units_array(fee_value_fiat, AMOUNT_DECIMALS),
+        fee_value_pln=from_units_array(fee_value_pln, AMOUNT_DECIMALS),
+        transaction_value_fiat_units=cost,
+        transaction_value_pln_units=value_pln,
+        fee_value_fiat_units=fee_value_fiat,
+        fee_value_pln_units=fee_value_pln,
+    )
+
+
+def _conversion_sums(valued_trades: pd.DataFrame, fiat_currencies) -> pd.DataFrame:
+    """
+    Sum trade values and fees per (currency, side); a trade counts for each fiat of its pair.
+
+    The sums are exact integers with AMOUNT_DECIMALS decimals.
+    """
+    fiat = list(fiat_currencies)
+    trades = valued_trades[valued_trades["side"].isin(["buy", "sell"])]
+    by_base = trades[trades["base"].isin(fiat)]
+    by_quote = trades[trades["quote"].isin(fiat) & (trades["quote"] != trades["base"])]
+    # Plain string currencies, so categorical name columns do not leak into the result index
+    long = pd.concat(
+        [
+            by_base.assign(currency=by_base["base"].to_numpy(dtype=object)),
+            by_quote.assign(currency=by_quote["quote"].to_numpy(dtype=object)),
+        ]
+    )
+
+    return long.groupby(["currency", "side"], observed=True)[list(SUM_COLUMNS.values())].sum()
+
+
+def _add_sums(sums: pd.DataFrame, other: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add two results of _conversion_sums; `DataFrame.add` with a fill value would turn the
+    integer sums into floats whenever the indexes differ.
+    """
+    index = sums.index.union(other.index)
+    return sums.reindex(index, fill_value=0) + other.reindex(index, fill_value=0)
+
+
+def _totals_from_sums(sums: pd.DataFrame) -> pd.DataFrame:
+    sides = sums.unstack("side", fill_value=0)
+
+    def column(name, side):
+        if (SUM_COLUMNS[name], side) not in sides.columns:
+            return 0.0
+        units = sides[(SUM_COLUMNS[name], side)].to_numpy(dtype=np.int64)
+        if name.endswith("_pln"):
+            # Totals in PLN are rounded to grosze once, after exact summation
+            return from_units_array(round_units(units, AMOUNT_DECIMALS, PLN_DECIMALS), PLN_DECIMALS)
+        return from_units_array(units, AMOUNT_DECIMALS)
+
+    totals = pd.DataFrame(
+        {
+            "total_buy_cost_pln": column("transaction_value_pln", "buy"),
+            "total_buy_cost_original_currency": column("transaction_value_fiat", "buy"),
+            "total_sell_revenue_pln": column("transaction_value_pln", "sell"),
+            "total_sell_revenue_original_currency": column("transaction_value_fiat", "sell"),
+            "total_fee_fiat": column("fee_value_fiat", "buy") + column("fee_value_fiat", "sell"),
+            "total_fee_pln": column("fee_value_pln", "buy") + column("fee_value_pln", "sell"),
+        },
+        index=sides.index,
+        columns=TOTAL_COLUMNS,
+    )
+    totals.index.name = "currency"
+    empty = (
+        (totals["total_buy_cost_pln"] == 0)
+        & (totals["total_sell_revenue_pln"] == 0)
+        & (totals["total_fee_pln"] == 0)
+    )
+    return totals[~empty]
+
+
+def summarize_conversions(
+    valued_trades: pd.DataFrame, fiat_currencies=FIAT_CURRENCY_SYMBOLS
+) -> pd.DataFrame:
+    """
+    Aggregate valued trades into per-currency totals in a single grouped pass.
+
+    A trade counts towards every fiat currency of its pair, like the per-currency summaries
+    of the notebook. Currencies without any PLN cost, revenue or fee are left out.
+
+    Args:
+        valued_trades: Output of value_trades
+        fiat_currencies: Currencies to report
+
+    Returns:
+        DataFrame indexed by currency with the TOTAL_COLUMNS totals
+    """
+    return _totals_from_sums(_conversion_sums(valued_trades, fiat_currencies))
+
+
+def summarize_conversion_pages(
+    pages: Iterable, rate_table, fiat_currencies=FIAT_CURRENCY_SYMBOLS
+) -> pd.DataFrame:
+    """
+    Value and aggregate a stream of trade pages in constant memory.
+
+    Every page is valued and reduced to per-(currency, side) sums on its own, so only one
+    page and the running sums are held at a time.
+
+    Args:
+        pages: Iterable of TradeBatch pages (e.g. ExchangeInterface.iter_trade_pages) or
+            lists of trade dicts
+        rate_table: Object with a rates_before(currency, days) method, e.g. NbpRateTable
+        fiat_currencies: Currencies to report
+
+    Returns:
+        Same as summarize_conversions
+    """
+    sums = None
+    for page in pages:
+        if not len(page):
+            continue
+        frame = page.to_frame() if hasattr(page, "to_frame") else pd.DataFrame.from_records(page)
+        valued = value_trades(frame, rate_table, fiat_currencies)
+        page_sums = _conversion_sums(valued, fiat_currencies)
+        sums = page_sums if sums is None else _add_sums(sums, page_sums)
+
+    if sums is None:
+        return pd.DataFrame(columns=TOTAL_COLUMNS, index=pd.Index([], name="currency"))
+    return _totals_from_sums(sums)
+
+
+@dataclass
+class Pit38:
+    revenue: float
+    costs: float
+    prior_years_costs: float
+    income: float
+    unsettled_costs: float
+
+
+def compute_pit38(
+    total_sell_revenue_pln: float,
+    total_buy_cost_pln: float,
+    total_fee_pln: float,
+    prior_years_costs: float,
+) -> Pit38:
+    """
+    Compute PIT-38 crypto fields 34-38.
+
+    Args:
+        total_sell_revenue_pln: Revenue from sales and crypto spending in PLN
+        total_buy_cost_pln: Purchase costs in PLN
+        total_fee_pln: Fees in PLN
+        prior_years_costs: Costs not deducted in previous years (field 38 of last year)
+
+    Returns:
+        Pit38 with revenue (34), costs (35), prior years costs (36), income (37) and costs
+        carried to the next year (38)
+    """
+    costs = total_buy_cost_pln + total_fee_pln
+    return Pit38(
+        revenue=total_sell_revenue_pln,
+        costs=costs,
+        prior_years_costs=prior_years_costs,
+        income=total_sell_revenue_pln - total_buy_cost_pln - total_fee_pln - prior_years_costs,
+        unsettled_costs=max(0, costs + prior_years_costs - total_sell_revenue_pln),
+    )
+
+
+def currency_summary_frame(currency_symbol: str, totals) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "Kategoria": [
+                "Koszt zakupu (PLN)",
+                "Przychód ze sprzedaży (PLN)",
+                "Opłaty (PLN)",
+                f"Koszt w {currency_symbol}",
+                f"Przychód w {currency_symbol}",
+            ],
+            "Wartość (PLN)": [
+                totals["total_buy_cost_pln"],
+                totals["total_sell_revenue_pln"],
+                totals["total_fee_pln"],
+                totals["total_buy_cost_original_currency"],
+                totals["total_sell_revenue_original_currency"],
+            ],
+        }
+    )
+
+
+def conversions_summary_frame(
+    total_buy_cost_pln: float, total_sell_revenue_pln: float, total_fee_pln: float
+) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "Kategoria": ["Koszt zakupu (PLN)", "Przychód ze sprzedaży (PLN)", "Opłaty (PLN)"],
+            "Wartość (PLN)": [total_buy_cost_pln, total_sell_revenue_pln, total_fee_pln],
+        }
+    )
+
+
+def totals_frame(
+    total_buy_cost_pln: float, total_sell_revenue_pln: float, total_fee_pln: float
+) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "Category": [
+                "Koszt zakupu",
+                "Przychód ze sprzedaży",
+                "Opłaty",
+                "Koszt całkowity",
+                "Zysk całkowity",
+            ],
+            "Value (PLN)": [
+                total_buy_cost_pln,
+                total_sell_revenue_pln,
+                total_fee_pln,
+                total_buy_cost_pln + total_fee_pln,
+                total_sell_revenue_pln - total_buy_cost_pln - total_fee_pln,
+            ],
+        }
+    )
+
+
+def pit38_frame(pit38: Pit38) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "Kategoria": [
+                "Przychód z kryptowalut w PLN (34)",
+                "Koszty uzyskania przychodu poniesione w roku podatkowym (35)",
+                "Koszty uzyskania przychodu poniesione w latach ubiegłych i niepotrącone "
+                "w poprzednim roku podatkowym (36)",
+                "Dochód (37)",
+                "Koszty uzyskania przychodu, które nie zostały potrącone w roku podatkowym (38)",
+            ],
+            "Value (PLN)": [
+                pit38.revenue,
+                pit38.costs,
+                pit38.prior_years_costs,
+                pit38.income,
+                pit38.unsettled_costs,
+            ],
+        }
+    )
@@ -0,0 +1,99 @@
+import random
+import threading
+import time
+from collections.abc import Callable
+
+from kryptorozliczator.instrumentation import instrumentation
+
+# Upper bound of a single backoff delay in seconds
+MAX_BACKOFF_SECONDS = 60.0
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1.0, name: str | None = None):
+        """
+        Thread-safe token bucket limiting how often an API is called.
+
+        Args:
+            rate: Tokens added per second (sustained requests per second)
+            capacity: Maximum number of tokens, i.e. the allowed burst
+            name: Name under which waits are reported to the run instrumentation
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.name = name
+        self.waited_seconds = 0.0
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_interval(
+        cls, interval_ms: float, capacity: float = 1.0, name: str | None = None
+    ) -> "TokenBucket":
+        """
+        Build a bucket from a minimal interval between requests, like ccxt's `rateLimit`.
+        """
+        return cls(1000.0 / interval_ms if interval_ms else float("inf"), capacity, name)
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens from the bucket, sleeping until they are available.
+
+        Returns:
+            Number of seconds spent waiting
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve the tokens now, so concurrent callers queue up behind each other
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited_seconds += wait
+
+        if wait > 0:
+            if self.name is not None:
+                instrumentation.record_wait(self.name, wait)
+            time.sleep(wait)
+        return wait
+
+
+def call_with_backoff(
+    func: Callable,
+    *args,
+    retry_on: tuple[type[BaseException], ...],
+    max_retries: int = 5,
+    base_delay: float = 1.0,
+    on_retry: Callable[[BaseException, float], None] | None = None,
+    **kwargs,
+):
+    """
+    Call a function, retrying with jittered exponential backoff on the given exceptions.
+
+    An exception with a `retry_after` attribute (seconds, e.g. from a Retry-After header)
+    waits at least that long, up to MAX_BACKOFF_SECONDS.
+
+    Args:
+        func: Function to call with *args and **kwargs
+        retry_on: Exception types that mean "slow down and try again"
+        max_retries: Number of retries before the exception is re-raised
+        base_delay: Delay before the first retry in seconds
+        on_retry: Optional callback called with the exception and the delay before sleeping
+
+    Returns:
+        Whatever `func` returns
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return func(*args, **kwargs)
+        except retry_on as e:
+            if attempt == max_retries:
+                raise
+            delay = min(MAX_BACKOFF_SECONDS, base_delay * 2**attempt) * random.uniform(0.5, 1.0)
+            retry_after = getattr(e, "retry_after", None)
+            if retry_after is not None:
+                delay = min(MAX_BACKOFF_SECONDS, max(delay, retry_after))
+            if on_retry is not None:
+                on_retry(e, delay)
+            time.sleep(delay)
@@ -0,0 +1,196 @@
+import hashlib
+import json
+from collections.abc import Callable
+from pathlib import Path
+
+BIP44_GAP_LIMIT = 20
+RECEIVE_CHAIN = 0
+CHANGE_CHAIN = 1
+HARDENED = 0x80000000
+# BIP84 account path m/84'/0'/0' used when a root key is given
+BIP84_ACCOUNT_PATH = (84 + HARDENED, 0 + HARDENED, 0 + HARDENED)
+ACCOUNT_DEPTH = 3
+
+DEFAULT_DERIVATION_CACHE_DIR = Path.home() / "kryptorozliczator" / "cache" / "xpub"
+
+XPUB_VERSION = bytes.fromhex("0488b21e")
+# SLIP-132 prefixes of extended public keys and the address type they imply
+EXTENDED_KEY_VERSIONS = {
+    "xpub": (XPUB_VERSION, "p2wpkh"),
+    "ypub": (bytes.fromhex("049d7cb2"), "p2sh-p2wpkh"),
+    "zpub": (bytes.fromhex("04b24746"), "p2wpkh"),
+}
+ADDRESS_TYPES = ("p2wpkh", "p2sh-p2wpkh", "p2pkh")
+
+BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+BECH32_GENERATOR = (0x3B6A57B2, 0x26508E6D, 0x1EA119FA, 0x3D4233DD, 0x2A1462B3)
+
+
+def _bech32_polymod(values: list[int]) -> int:
+    checksum = 1
+    for value in values:
+        top = checksum >> 25
+        checksum = (checksum & 0x1FFFFFF) << 5 ^ value
+        for i, generator in enumerate(BECH32_GENERATOR):
+            if (top >> i) & 1:
+                checksum ^= generator
+    return checksum
+
+
+def _convert_bits(data: bytes, from_bits: int, to_bits: int) -> list[int]:
+    accumulator, bits, result = 0, 0, []
+    max_value = (1 << to_bits) - 1
+    for value in data:
+        accumulator = (accumulator << from_bits) | value
+        bits += from_bits
+        while bits >= to_bits:
+            bits -= to_bits
+            result.append((accumulator >> bits) & max_value)
+    if bits:
+        result.append((accumulator << (to_bits - bits)) & max_value)
+    return result
+
+
+def p2wpkh_address(pubkey_hash: bytes, hrp: str = "bc") -> str:
+    """
+    Native segwit (bech32, BIP173) address of a HASH160 of a compressed public key.
+    """
+    data = [0, *_convert_bits(pubkey_hash, 8, 5)]
+    expanded_hrp = [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+    polymod = _bech32_polymod(expanded_hrp + data + [0] * 6) ^ 1
+    checksum = [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+    return hrp + "1" + "".join(BECH32_CHARSET[d] for d in data + checksum)
+
+
+def parse_extended_key(extended_key: str):
+    """
+    Parse an xpub, ypub or zpub into a bip32utils key.
+
+    Returns:
+        Tuple of the BIP32Key and the address type implied by the key prefix
+    """
+    # bip32utils is only needed for xpub wallets, so it is imported on demand
+    from bip32utils import Base58, BIP32Key
+
+    prefix = extended_key[:4]
+    if prefix not in EXTENDED_KEY_VERSIONS:
+        raise ValueError(f"Unsupported extended key prefix '{prefix}'")
+    raw = Base58.check_decode(extended_key)
+    # bip32utils only knows the xpub version bytes, the key material is the same
+    key = BIP32Key.fromExtendedKey(Base58.check_encode(XPUB_VERSION + raw[4:]))
+    return key, EXTENDED_KEY_VERSIONS[prefix][1]
+
+
+class HdWalletScanner:
+    def __init__(
+        self,
+        extended_key: str,
+        address_type: str | None = None,
+        gap_limit: int = BIP44_GAP_LIMIT,
+        cache_dir: str | Path | None = DEFAULT_DERIVATION_CACHE_DIR,
+    ):
+        """
+        Finds the used addresses of an HD wallet from its extended public key.
+
+        The account node is resolved once (an account-level key, depth 3, is used directly)
+        and both chain nodes are derived once, so every address costs a single child key
+        derivation. Derived addresses are persisted per key fingerprint and reused by later
+        runs. Scanning stops after `gap_limit` consecutive unused addresses on each chain.
+
+        Args:
+            extended_key: Account xpub/ypub/zpub, or a root key that can derive m/84'/0'/0'
+            address_type: 'p2wpkh', 'p2sh-p2wpkh' or 'p2pkh' (default: implied by the prefix)
+            gap_limit: Number of consecutive unused addresses that ends a chain
+            cache_dir: Directory for derived addresses, or None to keep them in memory only
+        """
+        key, implied_type = parse_extended_key(extended_key)
+        self.address_type = address_type or implied_type
+        if self.address_type not in ADDRESS_TYPES:
+            raise ValueError(f"Unsupported address type '{self.address_type}'")
+        self.gap_limit = gap_limit
+        self.fingerprint = hashlib.sha256(extended_key.encode()).hexdigest()[:16]
+        self.derivations = 0
+
+        self._extended_key = key
+        self._account = None
+        self._chains = {}
+        self._addresses: dict[int, list[str]] = {RECEIVE_CHAIN: [], CHANGE_CHAIN: []}
+        self._cache_path = None
+        if cache_dir is not None:
+            directory = Path(cache_dir).expanduser()
+            directory.mkdir(parents=True, exist_ok=True)
+            self._cache_path = directory / f"{self.fingerprint}-{self.address_type}.json"
+            if self._cache_path.exists():
+                cached = json.loads(self._cache_path.read_text())
+                for chain, addresses in cached["chains"].items():
+                    self._addresses[int(chain)] = addresses
+
+    def _chain_node(self, chain: int):
+        if chain not in self._chains:
+            if self._account is None:
+                account = self._extended_key
+                if account.depth < ACCOUNT_DEPTH:
+                    # Hardened steps need a private key, bip32utils raises for public ones
+                    for index in BIP84_ACCOUNT_PATH[account.depth :]:
+                        account = account.ChildKey(index)
+                self._account = account
+            self._chains[chain] = self._account.ChildKey(chain)
+        return self._chains[chain]
+
+    def _address(self, node) -> str:
+        if self.address_type == "p2wpkh":
+            return p2wpkh_address(node.Identifier())
+        if self.address_type == "p2sh-p2wpkh":
+            return node.P2WPKHoP2SHAddress()
+        return node.Address()
+
+    def _save(self):
+        if self._cache_path is None:
+            return
+        temporary_path = self._cache_path.with_suffix(".tmp")
+        temporary_path.write_text(
+            json.dumps({"address_type": self.address_type, "chains": self._addresses})
+        )
+        temporary_path.replace(self._cache_path)
+
+    def addresses(self, chain: int, count: int) -> list[str]:
+        """
+        First `count` addresses of a chain, deriving only those not derived before.
+        """
+        addresses = self._addresses[chain]
+        if len(addresses) < count:
+            node = self._chain_node(chain)
+            for index in range(len(addresses), count):
+                addresses.append(self._address(node.ChildKey(index)))
+                self.derivations += 1
+            self._save()
+        return addresses[:count]
+
+    def scan(
+        self, find_used: Callable[[list[str]], set[str]], batch_size: int = BIP44_GAP_LIMIT
+    ) -> list[str]:
+        """
+        Find the used addresses on the receive and change chains.
+
+        Args:
+            find_used: Function returning which of the given addresses have transactions,
+                called with up to `batch_size` addresses at a time
+            batch_size: Number of addresses checked per call
+
+        Returns:
+            Used addresses, receive chain first, in derivation order
+        """
+        used_addresses = []
+        for chain in (RECEIVE_CHAIN, CHANGE_CHAIN):
+            last_used = -1
+            start = 0
+            while start < last_used + 1 + self.gap_limit:
+                end = max(start + batch_size, last_used + 1 + self.gap_limit)
+                batch = self.addresses(chain, end)[start:end]
+                used = find_used(batch)
+                for index, address in enumerate(batch, start):
+                    if address in used:
+                        used_addresses.append(address)
+                        last_used = index
+                start = end
+        return used_addresses
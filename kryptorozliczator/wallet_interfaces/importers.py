@@ -0,0 +1,245 @@
+"""
+Importers of wallet CSV exports.
+
+Every supported export format has a parser that reads the file in chunks with pinned column
+types and converts it to one normalized transfer schema (TRANSFER_COLUMNS, the column names of
+the Coinomi export). The date filter is applied to every chunk as soon as it is read, so rows
+outside the requested years are dropped before anything else is done with them and large
+multi-year exports are read in bounded memory.
+"""
+
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from pathlib import Path
+from typing import ClassVar
+
+import numpy as np
+import pandas as pd
+
+from kryptorozliczator.tax.periods import year_bounds_ms
+
+# Normalized transfer schema; the time is an ISO 8601 UTC string, the value is signed
+# (negative for outgoing transfers) and the fees are in the transferred currency
+TIME_COLUMN = "Time(ISO8601-UTC)"
+SYMBOL_COLUMN = "Symbol"
+VALUE_COLUMN = "Value"
+FEES_COLUMN = "Fees"
+TRANSACTION_ID_COLUMN = "Transaction ID"
+WALLET_COLUMN = "wallet"
+TRANSFER_COLUMNS = (
+    TIME_COLUMN,
+    SYMBOL_COLUMN,
+    VALUE_COLUMN,
+    FEES_COLUMN,
+    TRANSACTION_ID_COLUMN,
+    WALLET_COLUMN,
+)
+
+DEFAULT_CHUNK_ROWS = 100_000
+
+
+def transfer_timestamps(times) -> np.ndarray:
+    """
+    Millisecond UTC timestamps of ISO 8601 UTC transfer times, with or without fractions.
+    """
+    parsed = pd.to_datetime(pd.Series(times, dtype=object), utc=True, format="ISO8601")
+    return parsed.dt.tz_localize(None).to_numpy().astype("datetime64[ms]").astype(np.int64)
+
+
+class CsvImporter(ABC):
+    """
+    Parser of one CSV export format.
+
+    Subclasses set the format name, the source columns with their types and the time column,
+    and convert a chunk of source rows to the normalized schema in `normalize`.
+    """
+
+    name: str
+    dtypes: ClassVar[dict[str, str]]
+    time_column: str
+
+    def matches(self, header: list[str]) -> bool:
+        """
+        Whether a CSV header belongs to this format.
+        """
+        return set(self.dtypes) <= set(header)
+
+    @abstractmethod
+    def normalize(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """
+        Convert a chunk of source rows to the normalized schema, without the wallet column.
+        """
+
+    def iter_chunks(
+        self,
+        csv_path: str | Path,
+        since: int | None = None,
+        until: int | None = None,
+        chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Read an export chunk by chunk, keeping only transfers in [since, until).
+
+        Args:
+            csv_path: Path of the exported CSV file
+            since: First millisecond UTC timestamp to keep (see tax.periods.year_bounds_ms)
+            until: Millisecond UTC timestamp before which transfers are kept
+            chunk_rows: Rows read at once
+
+        Yields:
+            Non-empty DataFrames of transfers in the normalized schema, without the wallet
+        """
+        reader = pd.read_csv(
+            Path(csv_path).expanduser(),
+            usecols=list(self.dtypes),
+            dtype=self.dtypes,
+            chunksize=chunk_rows,
+        )
+        with reader:
+            for chunk in reader:
+                keep = np.ones(len(chunk), dtype=bool)
+                if since is not None or until is not None:
+                    times = transfer_timestamps(chunk[self.time_column])
+                    if since is not None:
+                        keep &= times >= since
+                    if until is not None:
+                        keep &= times < until
+                if keep.any():
+                    yield self.normalize(chunk[keep])
+
+
+class CoinomiImporter(CsvImporter):
+    name = "coinomi"
+    time_column = TIME_COLUMN
+    dtypes: ClassVar[dict[str, str]] = {
+        TIME_COLUMN: "str",
+        SYMBOL_COLUMN: "str",
+        VALUE_COLUMN: "float64",
+        FEES_COLUMN: "float64",
+        TRANSACTION_ID_COLUMN: "str",
+    }
+
+    def normalize(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        return chunk.reset_index(drop=True)
+
+
+class LedgerLiveImporter(CsvImporter):
+    """
+    Operation history exported from Ledger Live (Accounts > Export operations).
+
+    Amounts are unsigned; the operation type tells the direction. Fee-only operations
+    (e.g. token approvals) become outgoing transfers of their fee.
+    """
+
+    name = "ledger_live"
+    time_column = "Operation Date"
+    dtypes: ClassVar[dict[str, str]] = {
+        "Operation Date": "str",
+        "Currency Ticker": "str",
+        "Operation Type": "str",
+        "Operation Amount": "float64",
+        "Operation Fees": "float64",
+        "Operation Hash": "str",
+    }
+    OUTGOING_TYPES = frozenset({"OUT", "FEES"})
+
+    def normalize(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        types = chunk["Operation Type"].str.upper()
+        outgoing = types.isin(self.OUTGOING_TYPES).to_numpy()
+        amounts = chunk["Operation Amount"].fillna(0.0).to_numpy()
+        fees = chunk["Operation Fees"].fillna(0.0).to_numpy()
+        amounts = np.where((types == "FEES").to_numpy() & (amounts == 0), fees, amounts)
+        # Ledger Live writes milliseconds ('2024-03-01T12:00:00.000Z'); Coinomi does not
+        times = chunk["Operation Date"].str.replace(r"\.\d+Z$", "Z", regex=True)
+        return pd.DataFrame(
+            {
+                TIME_COLUMN: times.to_numpy(),
+                SYMBOL_COLUMN: chunk["Currency Ticker"].to_numpy(),
+                VALUE_COLUMN: np.where(outgoing, -amounts, amounts),
+                FEES_COLUMN: fees,
+                TRANSACTION_ID_COLUMN: chunk["Operation Hash"].to_numpy(),
+            }
+        )
+
+
+IMPORTERS: dict[str, CsvImporter] = {
+    importer.name: importer for importer in (CoinomiImporter(), LedgerLiveImporter())
+}
+
+
+def detect_format(csv_path: str | Path) -> str:
+    """
+    Name of the importer whose columns match the header of a CSV export.
+
+    Raises:
+        ValueError: If no importer matches
+    """
+    header = pd.read_csv(Path(csv_path).expanduser(), nrows=0).columns.tolist()
+    for name, importer in IMPORTERS.items():
+        if importer.matches(header):
+            return name
+    raise ValueError(
+        f"Unknown CSV export format of {csv_path}, supported formats: {', '.join(IMPORTERS)}"
+    )
+
+
+def _year_bounds(first_year: int | None, last_year: int | None) -> tuple[int | None, int | None]:
+    since = year_bounds_ms(first_year)[0] if first_year is not None else None
+    until = year_bounds_ms(last_year)[1] if last_year is not None else None
+    return since, until
+
+
+def iter_transfers(
+    csv_path: str | Path,
+    first_year: int | None = None,
+    last_year: int | None = None,
+    file_format: str | None = None,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream the transfers of a wallet CSV export in the normalized schema, chunk by chunk.
+
+    Args:
+        csv_path: Path of the exported CSV file
+        first_year: First year to keep, all earlier transfers are skipped
+        last_year: Last year to keep, all later transfers are skipped
+        file_format: Importer name from IMPORTERS, detected from the header by default
+        chunk_rows: Rows read at once
+
+    Yields:
+        Non-empty DataFrames of transfers, without the wallet column
+    """
+    importer = IMPORTERS[file_format or detect_format(csv_path)]
+    yield from importer.iter_chunks(csv_path, *_year_bounds(first_year, last_year), chunk_rows)
+
+
+def read_transfers(
+    csv_path: str | Path,
+    first_year: int | None = None,
+    last_year: int | None = None,
+    file_format: str | None = None,
+    wallet: str | None = None,
+) -> pd.DataFrame:
+    """
+    Read the transfers of a wallet CSV export in the normalized schema.
+
+    Args:
+        csv_path: Path of the exported CSV file
+        first_year: First year to keep, all earlier transfers are skipped
+        last_year: Last year to keep, all later transfers are skipped
+        file_format: Importer name from IMPORTERS, detected from the header by default
+        wallet: Wallet name stored in the `wallet` column, by default '<format>_spending'
+
+    Returns:
+        DataFrame with TRANSFER_COLUMNS
+    """
+    file_format = file_format or detect_format(csv_path)
+    chunks = list(iter_transfers(csv_path, first_year, last_year, file_format))
+    if chunks:
+        transfers = pd.concat(chunks, ignore_index=True)
+    else:
+        transfers = pd.DataFrame({column: [] for column in TRANSFER_COLUMNS[:-1]})
+        transfers[VALUE_COLUMN] = transfers[VALUE_COLUMN].astype("float64")
+        transfers[FEES_COLUMN] = transfers[FEES_COLUMN].astype("float64")
+    transfers[WALLET_COLUMN] = wallet or f"{file_format}_spending"
+    return transfers
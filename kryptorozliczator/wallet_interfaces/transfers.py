@@ -1,36 +1,83 @@
 import json
 import os
+import threading
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
+from decimal import Decimal
 from enum import Enum
+from functools import cache
+from pathlib import Path
 
 import requests
-from bip32utils import BIP32Key
 from dotenv import load_dotenv
-from web3 import Web3
 
-# Load environment variables
-load_dotenv()
+from kryptorozliczator.http_client import HttpClient
+from kryptorozliczator.instrumentation import instrumentation
+from kryptorozliczator.money import asset_decimals, from_units
+from kryptorozliczator.tax.periods import year_bounds_ms
+from kryptorozliczator.throttling import TokenBucket, call_with_backoff
+from kryptorozliczator.wallet_interfaces.hd_scanner import BIP44_GAP_LIMIT, HdWalletScanner
+
+# Relative to the working directory, like the notebook; can be overridden by the environment
+WALLET_CONFIG_PATH = Path("config/wallet_config.json")
+
+# API locations, can be pointed at local stand-in servers, e.g. for benchmarks
+BLOCKCHAIN_INFO_API_URL = os.getenv(
+    "KRYPTOROZLICZATOR_BLOCKCHAIN_INFO_API_URL", "https://blockchain.info"
+)
+ETHERSCAN_API_URL = os.getenv("KRYPTOROZLICZATOR_ETHERSCAN_API_URL", "https://api.etherscan.io/api")
+# Etherscan allows 5 calls per second with a free API key
+ETHERSCAN_REQUESTS_PER_SECOND = 5.0
+# blockchain.info asks for gentle use of its free API and answers 429 when overloaded
+BLOCKCHAIN_INFO_REQUESTS_PER_SECOND = 1.0
+DEFAULT_SCAN_WORKERS = 8
+# Addresses checked per blockchain.info multiaddr request
+MULTIADDR_BATCH_SIZE = 100
+# Transactions per blockchain.info rawaddr page (the maximum the API returns)
+RAWADDR_PAGE_SIZE = 50
+# Etherscan returns up to page * offset <= 10000 results for one block window
+ETHERSCAN_PAGE_SIZE = 1000
+ETHERSCAN_MAX_RESULTS = 10_000
+
+
+class RateLimitedError(Exception):
+    pass
+
+
+class EtherscanError(Exception):
+    pass
+
+
+@cache
+def load_wallet_config(path: str | Path | None = None) -> dict:
+    """
+    Load the wallet configuration on first use.
+
+    Args:
+        path: Configuration file, by default $KRYPTOROZLICZATOR_WALLET_CONFIG or
+            config/wallet_config.json
 
-# Load wallet configuration
-with open("config/wallet_config.json") as f:
-    wallet_config = json.load(f)
+    Returns:
+        The parsed configuration
+    """
+    if path is None:
+        path = os.getenv("KRYPTOROZLICZATOR_WALLET_CONFIG", WALLET_CONFIG_PATH)
+    with open(Path(path).expanduser()) as f:
+        return json.load(f)
 
 
 def get_wallet_addresses(wallet_name: str) -> dict[str, list[str]]:
     """
     Get addresses for a specific wallet by name
     """
-    for wallet in wallet_config["wallets"]:
+    for wallet in load_wallet_config()["wallets"]:
         if wallet["name"].lower() == wallet_name.lower():
             return wallet["addresses"]
     return {}
 
 
-# Get API key from environment variable
-ETHERSCAN_API_KEY = os.getenv("ETHERSCAN_API_KEY", "your_api_key_here")
-
-
 class TransferType(Enum):
     SENT = "sent"
     RECEIVED = "received"
@@ -38,97 +85,166 @@ class TransferType(Enum):
 
 @dataclass
 class Transfer:
+    """
+    On-chain transfer with exact amounts in the base unit of the currency (satoshi, wei).
+    """
+
     timestamp: datetime
     transfer_type: TransferType
-    amount: float
+    amount_units: int
     currency: str
     tx_hash: str
     from_address: str
     to_address: str
-    fee: float | None = None
+    fee_units: int | None = None
+
+    @property
+    def amount(self) -> Decimal:
+        return from_units(self.amount_units, asset_decimals(self.currency))
+
+    @property
+    def fee(self) -> Decimal | None:
+        if self.fee_units is None:
+            return None
+        return from_units(self.fee_units, asset_decimals(self.currency))
 
 
 class TransfersInterface:
-    def __init__(self):
-        self.bitcoin_api_url = "https://blockchain.info"
-        self.ethereum_api_url = "https://api.etherscan.io/api"
-        self.etherscan_api_key = ETHERSCAN_API_KEY
+    def __init__(self, max_workers: int = DEFAULT_SCAN_WORKERS):
+        """
+        Access to on-chain transfers of the configured wallets.
+
+        All requests go through pooled keep-alive sessions and are throttled per API, so
+        addresses can be scanned in parallel without exceeding the public rate limits.
+
+        Args:
+            max_workers: Maximum number of addresses scanned at once
+        """
+        self.bitcoin_api_url = BLOCKCHAIN_INFO_API_URL
+        self.ethereum_api_url = ETHERSCAN_API_URL
+        load_dotenv(os.getenv("KRYPTOROZLICZATOR_ENV_FILE"))
+        self.etherscan_api_key = os.getenv("ETHERSCAN_API_KEY", "your_api_key_here")
+        self.max_workers = max_workers
+        self._ethereum_block_ranges: dict[int, tuple[int, int]] = {}
+        self._block_range_lock = threading.Lock()
+
+        self.http = HttpClient(pool_size=max_workers)
+        self.bitcoin_rate_limiter = TokenBucket(
+            BLOCKCHAIN_INFO_REQUESTS_PER_SECOND, name="blockchain.info"
+        )
+        self.ethereum_rate_limiter = TokenBucket(ETHERSCAN_REQUESTS_PER_SECOND, name="etherscan")
+
+    def _get_json(self, url: str, rate_limiter: TokenBucket, params: dict | None = None):
+        """
+        GET a JSON document, retrying when the API throttles us.
+
+        HTTP 429 and 5xx answers are retried by the HTTP client; this adds Etherscan's way of
+        reporting its rate limit.
+        """
+
+        def request():
+            data = self.http.get_json(url, params, rate_limiter)
+            # Etherscan reports its rate limit with HTTP 200 and an error message
+            if isinstance(data, dict) and "rate limit" in str(data.get("result", "")).lower():
+                raise RateLimitedError(f"Rate limited by {url}: {data['result']}")
+            return data
+
+        def on_retry(error, delay):
+            instrumentation.record_retry(rate_limiter.name or url, delay)
+
+        return call_with_backoff(request, retry_on=(RateLimitedError,), on_retry=on_retry)
+
+    def _address_jobs(self, addresses: dict[str, list[str]]) -> list[tuple[str, str]]:
+        """
+        Expand a wallet configuration into (currency, address) pairs to scan.
+        """
+        jobs = [("BTC", address) for address in addresses.get("bitcoin", [])]
+        for xpub in addresses.get("bitcoint_xpub", []):
+            jobs.extend(("BTC", address) for address in self.get_addresses_from_xpub(xpub))
+        jobs.extend(("ETH", address) for address in addresses.get("ethereum", []))
+        for pub_key in addresses.get("ethereum_pub", []):
+            address = self.get_address_from_pubkey(pub_key)
+            if address:
+                jobs.append(("ETH", address))
+        return jobs
+
+    def scan_wallets(
+        self, wallet_names: list[str], year: int
+    ) -> dict[str, dict[str, list[Transfer]]]:
+        """
+        Get the transfers of several wallets, scanning all their addresses in parallel.
+
+        Args:
+            wallet_names: Names of wallets from the wallet configuration
+            year: The year for which to get transfers
+
+        Returns:
+            Dictionary mapping wallet names to dictionaries with currency as key and list of
+            transfers as value, in the order of the addresses in the configuration
+        """
+        results: dict[str, dict[str, list[Transfer]]] = {}
+        jobs = []
+        for wallet_name in wallet_names:
+            addresses = get_wallet_addresses(wallet_name)
+            if not addresses:
+                print(f"Wallet '{wallet_name}' not found in configuration")
+                results[wallet_name] = {}
+                continue
+            wallet_jobs = self._address_jobs(addresses)
+            results[wallet_name] = {currency: [] for currency, _ in wallet_jobs}
+            jobs.extend((wallet_name, currency, address) for currency, address in wallet_jobs)
+
+        if not jobs:
+            return results
+
+        with (
+            instrumentation.stage("wallets.scan"),
+            ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as executor,
+        ):
+            futures = [
+                executor.submit(self.get_transfers, address, year, currency)
+                for _, currency, address in jobs
+            ]
+            for (wallet_name, currency, _), future in zip(jobs, futures, strict=True):
+                results[wallet_name][currency].extend(future.result())
+        return results
 
     def get_wallet_transfers(self, wallet_name: str, year: int) -> dict[str, list[Transfer]]:
         """
         Get all transfers for a wallet by name
         Returns a dictionary with currency as key and list of transfers as value
         """
-        addresses = get_wallet_addresses(wallet_name)
-        if not addresses:
-            print(f"Wallet '{wallet_name}' not found in configuration")
-            return {}
-
-        transfers = {}
-
-        # Get Bitcoin transfers from regular addresses
-        if "bitcoin" in addresses:
-            btc_transfers = []
-            for address in addresses["bitcoin"]:
-                btc_transfers.extend(self.get_bitcoin_transfers(address, year))
-            transfers["BTC"] = btc_transfers
-
-        # Get Bitcoin transfers from xpub addresses
-        if "bitcoint_xpub" in addresses:
-            btc_transfers = transfers.get("BTC", [])
-            for xpub in addresses["bitcoint_xpub"]:
-                # Get derived addresses from xpub (first 20 addresses)
-                derived_addresses = self.get_addresses_from_xpub(xpub)
-                for address in derived_addresses:
-                    btc_transfers.extend(self.get_bitcoin_transfers(address, year))
-            transfers["BTC"] = btc_transfers
-
-        # Get Ethereum transfers from regular addresses
-        if "ethereum" in addresses:
-            eth_transfers = []
-            for address in addresses["ethereum"]:
-                eth_transfers.extend(self.get_ethereum_transfers(address, year))
-            transfers["ETH"] = eth_transfers
-
-        # Get Ethereum transfers from public keys
-        if "ethereum_pub" in addresses:
-            eth_transfers = transfers.get("ETH", [])
-            for pub_key in addresses["ethereum_pub"]:
-                # Convert public key to address
-                print(pub_key)
-                address = self.get_address_from_pubkey(pub_key)
-                print(address)
-                if address:
-                    eth_transfers.extend(self.get_ethereum_transfers(address, year))
-            transfers["ETH"] = eth_transfers
+        return self.scan_wallets([wallet_name], year)[wallet_name]
 
-        return transfers
+    def find_used_bitcoin_addresses(self, addresses: list[str]) -> set[str]:
+        """
+        Check many Bitcoin addresses at once with the blockchain.info multiaddr endpoint.
 
-    def get_addresses_from_xpub(self, xpub: str, limit: int = 20) -> list[str]:
+        Returns:
+            The addresses that have at least one transaction
         """
-        Get derived addresses from an xpub key using BIP32 derivation with path M/84H/0H/0H
-        Returns a list of derived addresses up to the specified limit
+        used = set()
+        for start in range(0, len(addresses), MULTIADDR_BATCH_SIZE):
+            batch = addresses[start : start + MULTIADDR_BATCH_SIZE]
+            data = self._get_json(
+                f"{self.bitcoin_api_url}/multiaddr",
+                self.bitcoin_rate_limiter,
+                {"active": "|".join(batch), "n": 0},
+            )
+            used.update(entry["address"] for entry in data["addresses"] if entry["n_tx"] > 0)
+        return used
+
+    def get_addresses_from_xpub(self, xpub: str, gap_limit: int = BIP44_GAP_LIMIT) -> list[str]:
+        """
+        Get the used addresses of an HD wallet from its xpub/ypub/zpub.
+
+        Both the receive and the change chain (M/84H/0H/0H/0/i and M/84H/0H/0H/1/i for an
+        account key) are scanned until `gap_limit` consecutive unused addresses, checking
+        addresses in batches with the multiaddr endpoint. Derived addresses are cached on disk.
         """
         try:
-            # Create BIP32Key from xpub
-            key = BIP32Key.fromExtendedKey(xpub)
-
-            # Derive addresses using path: M/84H/0H/0H/0/i
-            # where i is the address index
-            addresses = []
-            for i in range(limit):
-                # Derive child key for this index
-                # M/84H/0H/0H/0/i
-                child_key = key.ChildKey(84 + 0x80000000)  # 84H
-                child_key = child_key.ChildKey(0 + 0x80000000)  # 0H
-                child_key = child_key.ChildKey(0 + 0x80000000)  # 0H
-                child_key = child_key.ChildKey(0)  # 0
-                child_key = child_key.ChildKey(i)  # i
-                # Get the address (native segwit)
-                address = child_key.Address()
-                addresses.append(address)
-
-            return addresses
+            scanner = HdWalletScanner(xpub, gap_limit=gap_limit)
+            return scanner.scan(self.find_used_bitcoin_addresses, MULTIADDR_BATCH_SIZE)
         except Exception as e:
             print(f"Error deriving addresses from xpub: {e}")
             return []
@@ -137,6 +253,9 @@ class TransfersInterface:
         """
         Convert an Ethereum public key to an address using BIP32 derivation with path M/44H/60H/0H
         """
+        # web3 takes a long time to import and is only needed for public key wallets
+        from web3 import Web3
+
         try:
             # Remove the '0x' prefix if present
             if pub_key.startswith("0x"):
@@ -151,46 +270,145 @@ class TransfersInterface:
             print(f"Error converting public key to address: {e}")
             return None
 
+    def _iter_bitcoin_transactions(self, address: str, year: int) -> Iterator[dict]:
+        """
+        Yield the transactions of an address within a tax year, newest first.
+
+        blockchain.info returns transactions newest first in pages of RAWADDR_PAGE_SIZE, so
+        paging stops at the first transaction older than the year.
+        """
+        start, end = (bound // 1000 for bound in year_bounds_ms(year))
+        offset = 0
+        while True:
+            data = self._get_json(
+                f"{self.bitcoin_api_url}/rawaddr/{address}",
+                self.bitcoin_rate_limiter,
+                {"limit": RAWADDR_PAGE_SIZE, "offset": offset},
+            )
+            txs = data.get("txs", [])
+            for tx in txs:
+                if tx["time"] >= end:
+                    continue
+                if tx["time"] < start:
+                    return
+                yield tx
+            offset += len(txs)
+            if len(txs) < RAWADDR_PAGE_SIZE or offset >= data.get("n_tx", offset):
+                return
+
+    def _ethereum_block_range(self, year: int) -> tuple[int, int]:
+        """
+        First and last Ethereum block of a tax year, resolved once per year.
+        """
+        with self._block_range_lock:
+            if year not in self._ethereum_block_ranges:
+                start, end = (bound // 1000 for bound in year_bounds_ms(year))
+                blocks = []
+                for timestamp, closest in ((start, "after"), (end - 1, "before")):
+                    data = self._get_json(
+                        self.ethereum_api_url,
+                        self.ethereum_rate_limiter,
+                        {
+                            "module": "block",
+                            "action": "getblocknobytime",
+                            "timestamp": timestamp,
+                            "closest": closest,
+                            "apikey": self.etherscan_api_key,
+                        },
+                    )
+                    if data["status"] != "1":
+                        raise EtherscanError(f"Error from Etherscan API: {data['result']}")
+                    blocks.append(int(data["result"]))
+                self._ethereum_block_ranges[year] = (blocks[0], blocks[1])
+            return self._ethereum_block_ranges[year]
+
+    def _iter_ethereum_transactions(self, address: str, year: int) -> Iterator[dict]:
+        """
+        Yield the normal transactions of an address within the blocks of a tax year.
+
+        Etherscan returns at most 10000 results per query window, so after that many the
+        window is moved to the block of the last transaction seen.
+
+        Raises:
+            EtherscanError: If a single block holds more transactions of the address than one
+                window, since the rest of that block cannot be listed
+        """
+        start_block, end_block = self._ethereum_block_range(year)
+        seen: set[str] = set()
+        page = 1
+        while True:
+            data = self._get_json(
+                self.ethereum_api_url,
+                self.ethereum_rate_limiter,
+                {
+                    "module": "account",
+                    "action": "txlist",
+                    "address": address,
+                    "startblock": start_block,
+                    "endblock": end_block,
+                    "page": page,
+                    "offset": ETHERSCAN_PAGE_SIZE,
+                    "sort": "asc",
+                    "apikey": self.etherscan_api_key,
+                },
+            )
+            if data["status"] != "1":
+                # An empty page is reported as an error with this message
+                if data["message"].startswith("No transactions found"):
+                    return
+                raise EtherscanError(f"Error from Etherscan API: {data['message']}")
+
+            txs = data["result"]
+            for tx in txs:
+                if tx["hash"] not in seen:
+                    seen.add(tx["hash"])
+                    yield tx
+            if len(txs) < ETHERSCAN_PAGE_SIZE:
+                return
+            page += 1
+            if page * ETHERSCAN_PAGE_SIZE > ETHERSCAN_MAX_RESULTS:
+                last_block = int(txs[-1]["blockNumber"])
+                if last_block == start_block:
+                    # The next window would start at the same block and return the same results
+                    raise EtherscanError(
+                        f"More than {ETHERSCAN_MAX_RESULTS} transactions of {address} "
+                        f"in block {start_block}"
+                    )
+                start_block, page = last_block, 1
+
     def get_bitcoin_transfers(self, address: str, year: int) -> list[Transfer]:
         """
         Get Bitcoin transfers for a given address and year using blockchain.info API
         """
         transfers = []
         try:
-            # Get all transfers for the address
-            response = requests.get(f"{self.bitcoin_api_url}/rawaddr/{address}")
-            response.raise_for_status()
-            data = response.json()
-
-            for tx in data.get("txs", []):
+            for tx in self._iter_bitcoin_transactions(address, year):
                 tx_time = datetime.fromtimestamp(tx["time"])
-                if tx_time.year != year:
-                    continue
 
                 # Determine if this is a sent or received transfer
                 is_sent = any(addr["addr"] == address for addr in tx["inputs"])
                 transfer_type = TransferType.SENT if is_sent else TransferType.RECEIVED
 
-                # Calculate the amount
+                # Calculate the amount in satoshis
                 amount = 0
                 for output in tx["out"]:
                     if output["addr"] == address:
-                        amount += output["value"] / 100000000  # Convert satoshis to BTC
+                        amount += int(output["value"])
 
                 transfers.append(
                     Transfer(
                         timestamp=tx_time,
                         transfer_type=transfer_type,
-                        amount=amount,
+                        amount_units=amount,
                         currency="BTC",
                         tx_hash=tx["hash"],
                         from_address=tx["inputs"][0]["prev_out"]["addr"] if is_sent else address,
                         to_address=address if is_sent else tx["out"][0]["addr"],
-                        fee=tx.get("fee", 0) / 100000000,  # Convert satoshis to BTC
+                        fee_units=int(tx.get("fee", 0)),
                     )
                 )
 
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, RateLimitedError) as e:
             print(f"Error fetching Bitcoin transfers: {e}")
             return []
 
@@ -202,52 +420,31 @@ class TransfersInterface:
         """
         transfers = []
         try:
-            # Get normal transfers
-            params = {
-                "module": "account",
-                "action": "txlist",
-                "address": address,
-                "startblock": 0,
-                "endblock": 99999999,
-                "sort": "desc",
-                "apikey": self.etherscan_api_key,
-            }
-
-            response = requests.get(self.ethereum_api_url, params=params)
-            response.raise_for_status()
-            data = response.json()
-
-            if data["status"] != "1":
-                print(f"Error from Etherscan API: {data['message']}")
-                return []
-
-            for tx in data["result"]:
+            for tx in self._iter_ethereum_transactions(address, year):
                 tx_time = datetime.fromtimestamp(int(tx["timeStamp"]))
-                if tx_time.year != year:
-                    continue
 
                 # Determine transfer type
                 is_sent = tx["from"].lower() == address.lower()
                 transfer_type = TransferType.SENT if is_sent else TransferType.RECEIVED
 
-                # Convert wei to ETH
-                amount = float(tx["value"]) / 1e18
-                fee = (float(tx["gasPrice"]) * float(tx["gasUsed"])) / 1e18
+                # Amounts in wei, which exceed float precision
+                amount = int(tx["value"])
+                fee = int(tx["gasPrice"]) * int(tx["gasUsed"])
 
                 transfers.append(
                     Transfer(
                         timestamp=tx_time,
                         transfer_type=transfer_type,
-                        amount=amount,
+                        amount_units=amount,
                         currency="ETH",
                         tx_hash=tx["hash"],
                         from_address=tx["from"],
                         to_address=tx["to"],
-                        fee=fee,
+                        fee_units=fee,
                     )
                 )
 
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, RateLimitedError, EtherscanError) as e:
             print(f"Error fetching Ethereum transfers: {e}")
             return []
 
@@ -0,0 +1,62 @@
+import os
+import time
+
+from kryptorozliczator.batch import (
+    MAX_ATTEMPTS,
+    STATUS_FAILED,
+    STATUS_OK,
+    BatchClient,
+    _settle_clients,
+)
+
+
+def _runs(client: BatchClient) -> int:
+    path = client.data_dir / "runs"
+    return len(path.read_text()) if path.exists() else 0
+
+
+def _settle(client: BatchClient) -> dict:
+    """
+    Worker stand-in: 'crash' always kills its process, 'flaky' only on its first run.
+    """
+    first_run = _runs(client) == 0
+    with open(client.data_dir / "runs", "a") as runs:
+        runs.write("x")
+    if client.name == "crash" or (client.name == "flaky" and first_run):
+        time.sleep(0.2)
+        os._exit(1)
+    time.sleep(0.5)
+    return {"name": client.name, "status": STATUS_OK}
+
+
+def _clients(tmp_path, *names) -> list[BatchClient]:
+    clients = [BatchClient(name, tmp_path / name) for name in names]
+    for client in clients:
+        client.data_dir.mkdir()
+    return clients
+
+
+def test_crashing_client_does_not_fail_the_others(tmp_path):
+    clients = _clients(tmp_path, "a", "crash", "b", "c")
+
+    results = _settle_clients(clients, _settle, 2024, max_workers=2)
+
+    assert {name: result["status"] for name, result in results.items()} == {
+        "a": STATUS_OK,
+        "crash": STATUS_FAILED,
+        "b": STATUS_OK,
+        "c": STATUS_OK,
+    }
+    assert results["crash"]["error"].startswith("Worker process died")
+    # Once in the shared pool, then alone until it used up its attempts
+    assert _runs(clients[1]) == 1 + MAX_ATTEMPTS
+
+
+def test_client_whose_process_died_once_is_retried(tmp_path):
+    clients = _clients(tmp_path, "flaky", "a")
+
+    results = _settle_clients(clients, _settle, 2024, max_workers=2)
+
+    assert results["flaky"]["status"] == STATUS_OK
+    assert results["a"]["status"] == STATUS_OK
+    assert _runs(clients[0]) == 2
@@ -0,0 +1,69 @@
+import multiprocessing
+import time
+
+import numpy as np
+import pytest
+
+from kryptorozliczator.rates import candle_cache
+from kryptorozliczator.rates.candle_cache import CandleCache
+from kryptorozliczator.rates.crypto_rates import CANDLE_INTERVALS_MS, DAY_MS
+from kryptorozliczator.rates.rate_cache import RateCache
+from kryptorozliczator.rates.rate_provider import RateProvider
+
+HOUR_MS = CANDLE_INTERVALS_MS["1h"]
+FIRST_DAY = 19_700
+
+
+def fake_candles(symbol, interval, start_time, end_time):
+    # Slow enough for the writes of concurrent processes to interleave without a lock
+    time.sleep(0.01)
+    step = CANDLE_INTERVALS_MS[interval]
+    return [(open_time, open_time / step) for open_time in range(start_time, end_time + 1, step)]
+
+
+def day_timestamps(first_day, days):
+    return [(FIRST_DAY + day) * DAY_MS + 2 * HOUR_MS for day in range(first_day, first_day + days)]
+
+
+def price_days(directory, first_day):
+    cache = CandleCache(directory)
+    for day in range(first_day, first_day + 20):
+        cache.prices("BTCPLN", "1h", day_timestamps(day, 1))
+
+
+def test_prices_use_the_last_closed_candle(tmp_path, monkeypatch):
+    monkeypatch.setattr(candle_cache, "get_candles", fake_candles)
+    timestamp = FIRST_DAY * DAY_MS + 2 * HOUR_MS + 5
+
+    prices = CandleCache(tmp_path).prices("BTCPLN", "1h", [timestamp])
+
+    np.testing.assert_array_equal(prices, [(FIRST_DAY * DAY_MS + HOUR_MS) / HOUR_MS])
+    offline = CandleCache(tmp_path, offline=True)
+    np.testing.assert_array_equal(offline.prices("BTCPLN", "1h", [timestamp]), prices)
+    with pytest.raises(LookupError):
+        offline.prices("BTCPLN", "1h", [timestamp + DAY_MS])
+
+
+def test_processes_sharing_the_directory_keep_it_consistent(tmp_path, monkeypatch):
+    monkeypatch.setattr(candle_cache, "get_candles", fake_candles)
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=price_days, args=(tmp_path, first_day)) for first_day in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(worker.exitcode == 0 for worker in workers)
+
+    prices = CandleCache(tmp_path, offline=True).prices("BTCPLN", "1h", day_timestamps(0, 23))
+
+    assert len(prices) == 23
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_provider_keeps_candles_next_to_its_rate_cache(tmp_path):
+    provider = RateProvider(RateCache(tmp_path / "rates.sqlite"))
+
+    assert provider.candles.directory == tmp_path / "candles"
+    assert RateProvider(RateCache(None)).candles.directory is None
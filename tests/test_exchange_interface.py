@@ -0,0 +1,68 @@
+import time
+
+import ccxt
+import pytest
+
+from kryptorozliczator.exchange_interfaces.exchange_interface import (
+    MAX_FETCH_WORKERS,
+    ExchangeInterface,
+)
+from kryptorozliczator.exchange_interfaces.zonda_interface import ZondaInterface
+from kryptorozliczator.instrumentation import instrumentation
+
+
+@pytest.fixture
+def credentials(monkeypatch, tmp_path):
+    # Recent ccxt releases dropped Zonda, any ccxt exchange class shows the wiring
+    monkeypatch.setattr(ccxt, "zonda", ccxt.kraken, raising=False)
+    monkeypatch.setenv("KRYPTOROZLICZATOR_ENV_FILE", str(tmp_path / ".env"))
+    for exchange in ("ZONDA", "KRAKEN"):
+        monkeypatch.setenv(f"{exchange}_API_KEY", "key")
+        monkeypatch.setenv(f"{exchange}_API_SECRET", "secret")
+
+
+@pytest.mark.parametrize("make", [ZondaInterface, lambda: ExchangeInterface("kraken")])
+def test_interfaces_are_instrumented(credentials, make):
+    interface = make()
+
+    assert interface.rate_limiter.name == interface.exchange_name
+    assert instrumentation.response_hook in interface.exchange.session.hooks["response"]
+    assert not interface.exchange.enableRateLimit
+
+
+def test_missing_credentials_are_reported(monkeypatch, tmp_path):
+    monkeypatch.setenv("KRYPTOROZLICZATOR_ENV_FILE", str(tmp_path / ".env"))
+    monkeypatch.delenv("ZONDA_API_KEY", raising=False)
+
+    with pytest.raises(ValueError, match="ZONDA_API_KEY"):
+        ZondaInterface()
+
+
+def test_unknown_exchange_is_rejected(monkeypatch, tmp_path):
+    monkeypatch.setenv("KRYPTOROZLICZATOR_ENV_FILE", str(tmp_path / ".env"))
+    monkeypatch.setenv("NOSUCHEXCHANGE_API_KEY", "key")
+    monkeypatch.setenv("NOSUCHEXCHANGE_API_SECRET", "secret")
+
+    with pytest.raises(ValueError, match="not supported"):
+        ExchangeInterface("nosuchexchange")
+
+
+def test_closing_the_stream_cancels_queued_markets(credentials, monkeypatch):
+    interface = ExchangeInterface("kraken")
+    fetched = []
+
+    def iter_market(since, until, symbol, submit):
+        fetched.append(symbol)
+        time.sleep(0.05)
+        yield [{"id": symbol, "symbol": symbol, "timestamp": since}]
+
+    monkeypatch.setattr(interface, "_iter_market", iter_market)
+    symbols = [f"COIN{index}/PLN" for index in range(10 * MAX_FETCH_WORKERS)]
+
+    stream = interface._stream_markets(0, 1, symbols)
+    next(stream)
+    stream.close()
+    time.sleep(0.2)
+
+    # Only markets whose workers were already running when the stream was closed
+    assert len(fetched) <= 2 * MAX_FETCH_WORKERS
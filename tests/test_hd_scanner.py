@@ -0,0 +1,48 @@
+from kryptorozliczator.wallet_interfaces.hd_scanner import (
+    CHANGE_CHAIN,
+    RECEIVE_CHAIN,
+    HdWalletScanner,
+)
+
+# BIP84 test vectors, mnemonic "abandon abandon ... about", account m/84'/0'/0'
+BIP84_ACCOUNT_ZPUB = (
+    "zpub6rFR7y4Q2AijBEqTUquhVz398htDFrtymD9xYYfG1m4wAcvPhXNfE3EfH1r1ADqtfSdVCToUG868RvUUkgDKf31"
+    "mGDtKsAYz2oz2AGutZYs"
+)
+BIP84_RECEIVE = [
+    "bc1qcr8te4kr609gcawutmrza0j4xv80jy8z306fyu",
+    "bc1qnjg0jd8228aq7egyzacy8cys3knf9xvrerkf9g",
+]
+BIP84_CHANGE = ["bc1q8c6fshw2dlwun7ekn9qwf37cu2rn755upcp6el"]
+
+
+def test_bip84_vectors():
+    scanner = HdWalletScanner(BIP84_ACCOUNT_ZPUB, cache_dir=None)
+
+    assert scanner.address_type == "p2wpkh"
+    assert scanner.addresses(RECEIVE_CHAIN, 2) == BIP84_RECEIVE
+    assert scanner.addresses(CHANGE_CHAIN, 1) == BIP84_CHANGE
+
+
+def test_derived_addresses_are_reused_from_the_cache(tmp_path):
+    first = HdWalletScanner(BIP84_ACCOUNT_ZPUB, cache_dir=tmp_path)
+    first.addresses(RECEIVE_CHAIN, 5)
+
+    second = HdWalletScanner(BIP84_ACCOUNT_ZPUB, cache_dir=tmp_path)
+
+    assert second.addresses(RECEIVE_CHAIN, 2) == BIP84_RECEIVE
+    assert second.derivations == 0
+
+
+def test_scan_stops_after_the_gap_limit():
+    scanner = HdWalletScanner(BIP84_ACCOUNT_ZPUB, gap_limit=3, cache_dir=None)
+    used = {BIP84_RECEIVE[1], BIP84_CHANGE[0]}
+    checked = []
+
+    def find_used(batch):
+        checked.extend(batch)
+        return used & set(batch)
+
+    assert scanner.scan(find_used, batch_size=2) == [BIP84_RECEIVE[1], BIP84_CHANGE[0]]
+    # Both chains end with three unused addresses, checked in whole batches: 0..2 and 3..4
+    assert len(checked) == 5 + 5
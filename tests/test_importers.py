@@ -0,0 +1,87 @@
+import pandas as pd
+import pytest
+
+from kryptorozliczator.wallet_interfaces.importers import (
+    TRANSFER_COLUMNS,
+    CsvImporter,
+    detect_format,
+    iter_transfers,
+    read_transfers,
+)
+
+COINOMI_CSV = """\
+Account,Time(ISO8601-UTC),Symbol,Value,Fees,Transaction ID,Address
+main,2023-12-31T22:59:59Z,BTC,-0.1,0.0001,aa,bc1q
+main,2023-12-31T23:30:00Z,BTC,-0.2,0.0001,bb,bc1q
+main,2024-06-01T12:00:00Z,ETH,1.5,0,cc,0xab
+main,2024-12-31T23:00:00Z,ETH,-1.0,0.01,dd,0xab
+"""
+
+LEDGER_LIVE_CSV = """\
+Operation Date,Currency Ticker,Operation Type,Operation Amount,Operation Fees,Operation Hash
+2024-03-01T12:00:00.000Z,BTC,OUT,0.5,0.0002,h1
+2024-03-02T12:00:00.000Z,BTC,IN,0.25,,h2
+2024-03-03T12:00:00.000Z,ETH,FEES,0,0.003,h3
+"""
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return path
+
+
+def test_coinomi_export_is_filtered_by_tax_year(tmp_path):
+    path = write(tmp_path, "coinomi.csv", COINOMI_CSV)
+
+    transfers = read_transfers(path, 2024, 2024, wallet="coinomi_spending")
+
+    assert tuple(transfers.columns) == TRANSFER_COLUMNS
+    # 23:30 UTC on 31 December 2023 is already 2024 in Poland, 23:00 UTC a year later is 2025
+    assert list(transfers["Transaction ID"]) == ["bb", "cc"]
+    assert set(transfers["wallet"]) == {"coinomi_spending"}
+
+
+def test_chunks_are_filtered_one_by_one(tmp_path):
+    path = write(tmp_path, "coinomi.csv", COINOMI_CSV)
+
+    chunks = list(iter_transfers(path, 2024, 2024, chunk_rows=1))
+
+    assert [list(chunk["Transaction ID"]) for chunk in chunks] == [["bb"], ["cc"]]
+
+
+def test_ledger_live_export_is_normalized(tmp_path):
+    path = write(tmp_path, "ledger.csv", LEDGER_LIVE_CSV)
+
+    transfers = read_transfers(path)
+
+    assert detect_format(path) == "ledger_live"
+    assert list(transfers["Value"]) == [-0.5, 0.25, -0.003]
+    assert list(transfers["Fees"]) == [0.0002, 0.0, 0.003]
+    assert transfers["Time(ISO8601-UTC)"][0] == "2024-03-01T12:00:00Z"
+    assert set(transfers["wallet"]) == {"ledger_live_spending"}
+
+
+def test_empty_year_keeps_the_schema(tmp_path):
+    path = write(tmp_path, "coinomi.csv", COINOMI_CSV)
+
+    transfers = read_transfers(path, 2030, 2030)
+
+    assert transfers.empty
+    assert tuple(transfers.columns) == TRANSFER_COLUMNS
+    assert pd.api.types.is_float_dtype(transfers["Value"])
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    path = write(tmp_path, "other.csv", "a,b\n1,2\n")
+
+    with pytest.raises(ValueError, match="Unknown CSV export format"):
+        detect_format(path)
+
+
+def test_importers_must_normalize():
+    class Incomplete(CsvImporter):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
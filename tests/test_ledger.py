@@ -0,0 +1,91 @@
+from datetime import UTC, datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from kryptorozliczator import ledger
+from kryptorozliczator.exchange_interfaces.trade_record import TradeBatch
+from kryptorozliczator.ledger import LedgerParams, run_ledger, tax_years
+
+
+class PlnRates:
+    def load_year(self, year, currency_codes):
+        pass
+
+    def rates_before(self, currency, days):
+        return np.ones(len(days))
+
+
+def trade(day: str, side: str, cost: float) -> dict:
+    time = datetime.fromisoformat(day).replace(hour=12, tzinfo=UTC)
+    return {
+        "id": f"{day}-{side}",
+        "symbol": "BTC/PLN",
+        "timestamp": int(time.timestamp() * 1000),
+        "side": side,
+        "amount": 0.01,
+        "price": cost * 100,
+        "cost": cost,
+        "fee": {"cost": 1.0, "currency": "PLN"},
+    }
+
+
+@pytest.fixture
+def journal(monkeypatch):
+    trades = []
+    monkeypatch.setattr(
+        ledger,
+        "load_journal_trades",
+        lambda exchanges, first_year, last_year: TradeBatch.from_ccxt(trades, "zonda"),
+    )
+    monkeypatch.setattr(ledger, "RateProvider", lambda offline: SimpleNamespace(cache=None))
+    monkeypatch.setattr(ledger, "NbpRateTable", lambda cache: PlnRates())
+    return trades
+
+
+def run(tmp_path, opening_costs=0.0):
+    params = LedgerParams(2022, 2024, ["zonda"], opening_costs=opening_costs)
+    return run_ledger(params, tmp_path / "ledger.json", write_year_outputs=False)
+
+
+def test_unsettled_costs_are_carried_forward(tmp_path, journal):
+    journal += [trade("2022-03-01", "buy", 1000.0), trade("2023-05-01", "sell", 300.0)]
+
+    years = run(tmp_path, opening_costs=50.0)
+
+    assert [entry.pit38.prior_years_costs for entry in years] == [50.0, 1051.0, 752.0]
+    assert [entry.pit38.unsettled_costs for entry in years] == [1051.0, 752.0, 752.0]
+
+
+def test_only_changed_years_and_later_ones_are_recomputed(tmp_path, journal):
+    journal += [trade("2022-03-01", "buy", 1000.0), trade("2023-05-01", "sell", 300.0)]
+    run(tmp_path)
+
+    assert not any(entry.recomputed for entry in run(tmp_path))
+
+    journal.append(trade("2023-06-01", "sell", 200.0))
+    years = run(tmp_path)
+
+    assert [entry.recomputed for entry in years] == [False, True, True]
+    # 1001 carried into 2023, plus two sale fees, minus 500 of revenue
+    assert years[2].pit38.prior_years_costs == 503.0
+
+
+def test_changed_parameters_discard_the_ledger(tmp_path, journal):
+    journal.append(trade("2022-03-01", "buy", 1000.0))
+    run(tmp_path)
+
+    years = run(tmp_path, opening_costs=10.0)
+
+    assert all(entry.recomputed for entry in years)
+
+
+def test_tax_years_are_taken_in_polish_time():
+    # 23:30 UTC on 31 December is already New Year in Poland
+    timestamps = [
+        int(datetime(2023, 12, 31, 22, 30, tzinfo=UTC).timestamp() * 1000),
+        int(datetime(2023, 12, 31, 23, 30, tzinfo=UTC).timestamp() * 1000),
+    ]
+
+    assert tax_years(timestamps).tolist() == [2023, 2024]
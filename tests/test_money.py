@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from kryptorozliczator.money import from_units, mul_rate, round_units, to_units, to_units_array
+
+
+def test_to_units_rounds_half_away_from_zero():
+    assert to_units("1.005", 2) == 101
+    assert to_units(0.1, 8) == 10_000_000
+    assert to_units("-2.5", 0) == -3
+    assert from_units(101, 2) == from_units(1010, 3)
+
+
+def test_to_units_array_snaps_binary_noise():
+    units = to_units_array([1.005, -1.005, 0.125, 2.675], 2)
+
+    assert units.dtype == np.int64
+    assert units.tolist() == [101, -101, 13, 268]
+
+
+@pytest.mark.parametrize("value", [np.nan, np.inf, 1e11])
+def test_to_units_array_rejects_values_outside_int64(value):
+    with pytest.raises(ValueError):
+        to_units_array([1.0, value], 8)
+
+
+def test_round_units():
+    assert round_units([149, 150, -150, 151], 2, 0).tolist() == [1, 2, -2, 2]
+    assert round_units([7], 2, 8).tolist() == [7_000_000]
+    with pytest.raises(ValueError):
+        round_units([10**13], 2, 8)
+
+
+def test_mul_rate_rounds_the_exact_product():
+    # 0.12345678 BTC at 3.99999999 PLN is 0.493827118765... PLN
+    assert mul_rate([12_345_678], [399_999_999], 8).tolist() == [49]
+    assert mul_rate([-150], [50_000_000], 2).tolist() == [-75]
+    assert mul_rate([-1], [50_000_000], 2).tolist() == [-1]
+    assert mul_rate([], [], 8).shape == (0,)
+
+
+def test_mul_rate_falls_back_to_exact_integers():
+    amounts = [9_000_000_000_000_000_000, 123_456_789_012_345_678]
+    rates = [412_345_678, 99_999_999]
+
+    products = mul_rate(amounts, rates, 8)
+
+    expected = []
+    for amount, rate in zip(amounts, rates, strict=True):
+        quotient, remainder = divmod(amount * rate, 10**14)
+        expected.append(quotient + (2 * remainder >= 10**14))
+    assert products.tolist() == expected
+
+
+def test_mul_rate_matches_decimal_arithmetic():
+    generator = np.random.default_rng(0)
+    amounts = generator.integers(-(10**15), 10**15, 1000)
+    rates = generator.integers(1, 10**10, 1000)
+
+    products = mul_rate(amounts, rates, 8)
+
+    expected = [
+        to_units(from_units(int(amount), 8) * from_units(int(rate), 8), 2)
+        for amount, rate in zip(amounts, rates, strict=True)
+    ]
+    assert products.tolist() == expected
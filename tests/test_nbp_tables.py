@@ -0,0 +1,64 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from kryptorozliczator.rates.nbp_tables import NBP_TABLE_PROVIDER, NbpRateTable
+from kryptorozliczator.rates.rate_cache import RateCache
+
+
+class FakeNbpTable(NbpRateTable):
+    def __init__(self, cache, publications: dict[date, float]):
+        super().__init__(cache)
+        self.publications_by_day = publications
+        self.requests = []
+
+    def _fetch_range(self, currency_code, start, end):
+        self.requests.append((start, end))
+        return [
+            (day.isoformat(), mid)
+            for day, mid in sorted(self.publications_by_day.items())
+            if start <= day <= end
+        ]
+
+
+def test_rates_before_use_the_previous_publication():
+    table = NbpRateTable()
+    table.add_rates(
+        "USD",
+        ["2024-01-02", "2024-01-03", "2024-01-05"],
+        [4.0, 4.1, 4.2],
+        covered=(date(2024, 1, 1), date(2024, 1, 10)),
+    )
+
+    rates = table.rates_before("usd", ["2024-01-03", "2024-01-04", "2024-01-06", "2024-01-08"])
+
+    np.testing.assert_array_equal(rates, [4.0, 4.1, 4.2, 4.2])
+    assert table.rate_before("PLN", date(2024, 1, 3)) == 1.0
+
+
+def test_rates_before_outside_the_coverage_raise():
+    table = NbpRateTable()
+    table.add_rates("USD", ["2024-01-02"], [4.0], covered=(date(2024, 1, 2), date(2024, 1, 5)))
+
+    with pytest.raises(LookupError):
+        table.rates_before("USD", ["2024-01-07"])
+
+
+def test_unpublished_today_is_not_persisted_as_covered(tmp_path):
+    today = date.today()
+    start = today - timedelta(days=10)
+    publications = {start + timedelta(days=offset): 4.0 + offset for offset in range(10)}
+    cache = RateCache(tmp_path / "rates.sqlite")
+
+    FakeNbpTable(cache, publications).load_range("USD", start, today)
+
+    assert cache.get_coverage(NBP_TABLE_PROVIDER, "USD") == [
+        (start.isoformat(), (today - timedelta(days=1)).isoformat())
+    ]
+    publications[today] = 5.0
+    table = FakeNbpTable(cache, publications)
+    table.load_range("USD", start, today)
+
+    assert table.requests == [(today, today)]
+    assert table.rate_before("USD", today + timedelta(days=1)) == 5.0
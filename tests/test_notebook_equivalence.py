@@ -0,0 +1,168 @@
+"""
+The tax engine against the per-row algorithm of the original rozlicz.ipynb notebook.
+"""
+
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+import pytest
+
+from kryptorozliczator.exchange_interfaces.trade_record import TradeBatch
+from kryptorozliczator.rates.nbp_tables import NbpRateTable
+from kryptorozliczator.tax.pit38 import (
+    FIAT_CURRENCY_SYMBOLS,
+    compute_pit38,
+    summarize_conversions,
+    value_trades,
+)
+
+TAX_TIMEZONE = ZoneInfo("Europe/Warsaw")
+
+# NBP publications of June 2024; none on the weekend of the 8th and 9th
+PUBLICATIONS = {
+    "USD": {"2024-06-06": 3.9512, "2024-06-07": 3.9744, "2024-06-10": 4.0123, "2024-06-11": 4.0311},
+    "EUR": {"2024-06-06": 4.2901, "2024-06-07": 4.3042, "2024-06-10": 4.3188, "2024-06-11": 4.3276},
+}
+
+
+def _timestamp(text: str) -> int:
+    return int(datetime.fromisoformat(text).timestamp() * 1000)
+
+
+def _trade(number: int, row: tuple) -> dict:
+    symbol, side, time, amount, price, fee = row
+    return {
+        "id": str(number),
+        "symbol": symbol,
+        "timestamp": _timestamp(time),
+        "side": side,
+        "amount": amount,
+        "price": price,
+        "cost": round(amount * price, 8),
+        "fee": {"cost": fee[0], "currency": fee[1]},
+    }
+
+
+# Symbol, side, UTC time, amount, price and fee; 22:30 UTC on the 10th is already the 11th in
+# Warsaw and the trade of Saturday the 8th takes the rate of Friday the 7th
+TRADE_ROWS = [
+    ("BTC/PLN", "buy", "2024-06-07T10:00:00+00:00", 0.01234567, 270_123.45, (1.5, "PLN")),
+    ("BTC/USD", "buy", "2024-06-08T12:00:00+00:00", 0.5, 69_000.1, (0.0005, "BTC")),
+    ("BTC/USD", "sell", "2024-06-10T08:30:00+00:00", 0.25, 69_500.0, (17.37, "USD")),
+    ("ETH/EUR", "sell", "2024-06-10T22:30:00+00:00", 1.75, 3_401.99, (2.04, "EUR")),
+    ("ETH/EUR", "buy", "2024-06-11T23:59:00+00:00", 0.333, 3_333.33, (0.001, "ETH")),
+    ("SOL/PLN", "sell", "2024-06-11T11:11:11+00:00", 12.0, 655.55, (0.02, "SOL")),
+]
+TRADES = [_trade(number, row) for number, row in enumerate(TRADE_ROWS)]
+
+
+def _notebook_rate(currency_code: str, day: date) -> float:
+    # get_nbp_exchange_rate walked back day by day to the last publication
+    while day.isoformat() not in PUBLICATIONS[currency_code]:
+        day -= timedelta(days=1)
+    return PUBLICATIONS[currency_code][day.isoformat()]
+
+
+def _notebook_value_and_fee(row):
+    """
+    calculate_transaction_value_and_fee of the notebook, with days in the tax time zone.
+    """
+    _, quote = row["symbol"].split("/")
+    nbp_rate_date = datetime.fromtimestamp(row["timestamp"] / 1000, TAX_TIMEZONE).date()
+    nbp_rate_date -= timedelta(days=1)
+
+    quote_rate = 1.0 if quote == "PLN" else _notebook_rate(quote, nbp_rate_date)
+    fee_cost, fee_currency = float(row["fee"]["cost"]), row["fee"]["currency"]
+    if fee_currency == "PLN":
+        fee_fiat = fee_pln = fee_cost
+    elif fee_currency in FIAT_CURRENCY_SYMBOLS:
+        fee_fiat, fee_pln = fee_cost, fee_cost * _notebook_rate(fee_currency, nbp_rate_date)
+    else:
+        fee_fiat = fee_cost * row["price"]
+        fee_pln = fee_fiat * quote_rate
+    return row["cost"], row["cost"] * quote_rate, fee_fiat, fee_pln
+
+
+def _notebook_totals(trades: pd.DataFrame) -> dict[str, dict[str, float]]:
+    """
+    calculate_transaction_totals_for_single_currency of the notebook for every fiat currency.
+    """
+    summary = {}
+    for currency in sorted(FIAT_CURRENCY_SYMBOLS):
+        in_currency = trades[trades["symbol"].apply(lambda s, c=currency: c in s.split("/"))]
+        totals = dict.fromkeys(
+            (
+                "total_buy_cost_pln",
+                "total_buy_cost_original_currency",
+                "total_sell_revenue_pln",
+                "total_sell_revenue_original_currency",
+                "total_fee_fiat",
+                "total_fee_pln",
+            ),
+            0.0,
+        )
+        for _, row in in_currency.iterrows():
+            value_fiat, value_pln, fee_fiat, fee_pln = _notebook_value_and_fee(row)
+            if row["side"] == "buy":
+                totals["total_buy_cost_pln"] += value_pln
+                totals["total_buy_cost_original_currency"] += value_fiat
+            else:
+                totals["total_sell_revenue_pln"] += value_pln
+                totals["total_sell_revenue_original_currency"] += value_fiat
+            totals["total_fee_fiat"] += fee_fiat
+            totals["total_fee_pln"] += fee_pln
+        if any(
+            totals[name]
+            for name in ("total_buy_cost_pln", "total_sell_revenue_pln", "total_fee_pln")
+        ):
+            summary[currency] = totals
+    return summary
+
+
+def _rate_table() -> NbpRateTable:
+    table = NbpRateTable()
+    for currency, rates in PUBLICATIONS.items():
+        table.add_rates(currency, list(rates), list(rates.values()), ("2024-06-01", "2024-06-30"))
+    return table
+
+
+def test_conversion_totals_match_the_notebook():
+    trades = TradeBatch.from_ccxt(TRADES, "kraken").to_frame()
+
+    summary = summarize_conversions(
+        value_trades(trades, _rate_table(), FIAT_CURRENCY_SYMBOLS), FIAT_CURRENCY_SYMBOLS
+    )
+    expected = _notebook_totals(pd.DataFrame(TRADES))
+
+    assert sorted(summary.index) == sorted(expected)
+    for currency, totals in expected.items():
+        for name, value in totals.items():
+            assert summary.loc[currency, name] == pytest.approx(value, abs=0.01), (currency, name)
+
+
+def test_pit38_matches_the_notebook():
+    trades = TradeBatch.from_ccxt(TRADES, "kraken").to_frame()
+    summary = summarize_conversions(
+        value_trades(trades, _rate_table(), FIAT_CURRENCY_SYMBOLS), FIAT_CURRENCY_SYMBOLS
+    )
+    expected = _notebook_totals(pd.DataFrame(TRADES)).values()
+    buy = sum(totals["total_buy_cost_pln"] for totals in expected)
+    sell = sum(totals["total_sell_revenue_pln"] for totals in expected)
+    fee = sum(totals["total_fee_pln"] for totals in expected)
+    spending, prior_costs = 1_234.56, 5_000.0
+
+    pit38 = compute_pit38(
+        summary["total_sell_revenue_pln"].sum() + spending,
+        summary["total_buy_cost_pln"].sum(),
+        summary["total_fee_pln"].sum(),
+        prior_costs,
+    )
+
+    notebook_revenue = sell + spending
+    assert pit38.revenue == pytest.approx(notebook_revenue, abs=0.01)
+    assert pit38.costs == pytest.approx(buy + fee, abs=0.01)
+    assert pit38.income == pytest.approx(notebook_revenue - buy - fee - prior_costs, abs=0.01)
+    assert pit38.unsettled_costs == pytest.approx(
+        max(0, buy + fee + prior_costs - notebook_revenue), abs=0.01
+    )
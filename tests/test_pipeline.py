@@ -0,0 +1,101 @@
+import pandas as pd
+
+from kryptorozliczator.exchange_interfaces.trade_record import TradeBatch, code_of
+from kryptorozliczator.pipeline import Pipeline, Stage, frame_digest
+from kryptorozliczator.settlement import _trades_digest
+
+
+def make_stages(source: dict, calls: list[str]) -> list[Stage]:
+    def fetch(year):
+        calls.append("fetch")
+        return list(source["trades"])
+
+    def total(fetch, year):
+        calls.append("total")
+        return sum(fetch)
+
+    def report(total, note):
+        calls.append("report")
+        return f"{total} {note}"
+
+    return [
+        Stage("fetch", fetch, inputs=("year",), volatile=True),
+        Stage("total", total, inputs=("fetch", "year")),
+        Stage("report", report, inputs=("total", "note")),
+    ]
+
+
+def test_unchanged_inputs_are_loaded_from_checkpoints(tmp_path):
+    source, calls = {"trades": [1, 2]}, []
+    stages = make_stages(source, calls)
+
+    Pipeline(stages, tmp_path).run({"year": 2024, "note": "a"})
+    calls.clear()
+    result = Pipeline(stages, tmp_path).run({"year": 2024, "note": "b"})
+
+    assert result["report"] == "3 b"
+    assert calls == ["fetch", "report"]
+
+
+def test_volatile_stage_change_reruns_later_stages(tmp_path):
+    source, calls = {"trades": [1, 2]}, []
+    stages = make_stages(source, calls)
+
+    Pipeline(stages, tmp_path).run({"year": 2024, "note": "a"})
+    source["trades"].append(3)
+    calls.clear()
+    result = Pipeline(stages, tmp_path).run({"year": 2024, "note": "a"})
+
+    assert result["report"] == "6 a"
+    assert calls == ["fetch", "total", "report"]
+
+
+def test_from_stage_forces_recomputation(tmp_path):
+    source, calls = {"trades": [1]}, []
+    stages = make_stages(source, calls)
+
+    Pipeline(stages, tmp_path).run({"year": 2024, "note": "a"})
+    calls.clear()
+    Pipeline(stages, tmp_path).run({"year": 2024, "note": "a"}, from_stage="total")
+
+    assert calls == ["fetch", "total", "report"]
+
+
+def test_frame_digest_ignores_row_order_and_category_codes():
+    frame = pd.DataFrame(
+        {
+            "symbol": pd.Categorical(["BTC/PLN", "ETH/EUR"], categories=["BTC/PLN", "ETH/EUR"]),
+            "cost": [1.5, 2.5],
+        }
+    )
+    reordered = pd.DataFrame(
+        {
+            "symbol": pd.Categorical(["ETH/EUR", "BTC/PLN"], categories=["ETH/EUR", "BTC/PLN"]),
+            "cost": [2.5, 1.5],
+        }
+    )
+
+    assert frame_digest(frame) == frame_digest(reordered)
+    assert frame_digest(frame) != frame_digest(frame.assign(cost=[1.5, 2.6]))
+
+
+def test_trades_digest_does_not_depend_on_interned_names(tmp_path):
+    trade = {"id": "1", "symbol": "BTC/PLN", "timestamp": 0, "side": "buy", "amount": 1.0}
+    calls = []
+    stages = [
+        Stage(
+            "trades",
+            lambda year: TradeBatch.from_ccxt([trade], "zonda"),
+            inputs=("year",),
+            volatile=True,
+            digest=_trades_digest,
+        ),
+        Stage("count", lambda trades: calls.append(len(trades)), inputs=("trades",)),
+    ]
+
+    Pipeline(stages, tmp_path).run({"year": 2024})
+    # Another exchange answering first interns its names before this batch is built
+    code_of("PEPE/USDT")
+    Pipeline(stages, tmp_path).run({"year": 2024})
+
+    assert calls == [1]
@@ -0,0 +1,72 @@
+import numpy as np
+
+from kryptorozliczator.exchange_interfaces.trade_record import TradeBatch
+from kryptorozliczator.tax.pit38 import (
+    compute_pit38,
+    summarize_conversion_pages,
+    summarize_conversions,
+    value_trades,
+)
+
+
+class FixedRates:
+    def __init__(self, rates: dict[str, float]):
+        self.rates = rates
+
+    def rates_before(self, currency, days):
+        return np.full(len(days), self.rates[currency])
+
+
+def make_trade(symbol, side, cost, fee=None):
+    return {
+        "id": f"{symbol}-{cost}",
+        "symbol": symbol,
+        "timestamp": 1_718_000_000_000,
+        "side": side,
+        "amount": 1.0,
+        "price": cost,
+        "cost": cost,
+        "fee": fee,
+    }
+
+
+def test_streamed_sums_stay_exact_integers():
+    pages = [
+        [make_trade("BTC/USD", "buy", 91_000_000.0)],
+        [make_trade("BTC/USD", "buy", 0.00499999), make_trade("ETH/EUR", "buy", 1.0)],
+    ]
+    batches = [TradeBatch.from_ccxt(page, "kraken") for page in pages]
+    rates = FixedRates({"USD": 1.0, "EUR": 4.0})
+
+    streamed = summarize_conversion_pages(batches, rates, {"USD", "EUR"})
+    whole = summarize_conversions(
+        value_trades(TradeBatch.concat(batches).to_frame(), rates, {"USD", "EUR"}), {"USD", "EUR"}
+    )
+
+    # 9100000000499999 units are 91 000 000.00 PLN; as a float sum they would round up a grosz
+    assert streamed.loc["USD", "total_buy_cost_pln"] == 91_000_000.0
+    assert streamed.equals(whole)
+
+
+def test_fees_in_crypto_are_valued_with_the_trade_price():
+    trades = TradeBatch.from_ccxt(
+        [
+            make_trade("BTC/PLN", "buy", 100.0, {"cost": 0.01, "currency": "BTC"}),
+            make_trade("BTC/EUR", "sell", 50.0, {"cost": 0.5, "currency": "EUR"}),
+        ],
+        "zonda",
+    ).to_frame()
+
+    valued = value_trades(trades, FixedRates({"PLN": 1.0, "EUR": 4.0}), {"PLN", "EUR"})
+
+    np.testing.assert_allclose(valued["fee_value_fiat"], [1.0, 0.5])
+    np.testing.assert_allclose(valued["fee_value_pln"], [1.0, 2.0])
+    np.testing.assert_allclose(valued["transaction_value_pln"], [100.0, 200.0])
+
+
+def test_compute_pit38_carries_unsettled_costs():
+    loss = compute_pit38(100.0, 150.0, 10.0, 20.0)
+    gain = compute_pit38(300.0, 150.0, 10.0, 20.0)
+
+    assert (loss.costs, loss.income, loss.unsettled_costs) == (160.0, -80.0, 80.0)
+    assert (gain.income, gain.unsettled_costs) == (120.0, 0)
@@ -0,0 +1,29 @@
+import json
+
+from kryptorozliczator.rates.rate_cache import RateCache
+from kryptorozliczator.rates.rate_provider import RateProvider
+from kryptorozliczator.rates.rate_routing import (
+    MARKETS_FILE,
+    RateRouter,
+    build_graph,
+    cheapest_paths,
+)
+
+
+def test_router_reads_the_market_list_next_to_its_cache(tmp_path):
+    markets = [["DOGE", "USDT", True], ["BTC", "PLN", True]]
+    (tmp_path / MARKETS_FILE).write_text(json.dumps(markets))
+    provider = RateProvider(RateCache(tmp_path / "rates.sqlite"), offline=True)
+
+    router = RateRouter(provider)
+
+    assert router.markets == [tuple(market) for market in markets]
+    assert router.path("DOGE")[-1].target == "PLN"
+
+
+def test_inactive_markets_are_a_last_resort():
+    markets = [("ABC", "PLN", False), ("ABC", "BTC", True), ("BTC", "PLN", True)]
+
+    paths = cheapest_paths(build_graph(markets), "PLN")
+
+    assert [hop.symbol for hop in paths["ABC"]] == ["ABCBTC", "BTCPLN"]
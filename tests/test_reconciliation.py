@@ -0,0 +1,93 @@
+import pandas as pd
+
+from kryptorozliczator.reconciliation import (
+    HOUR_MS,
+    MATCH_BY_AMOUNT,
+    MATCH_BY_HASH,
+    exchange_movements,
+    exclude_internal,
+    internal_transfers,
+)
+
+SENT_AT = "2024-05-01T10:00:00Z"
+SENT_AT_MS = 1_714_557_600_000
+
+
+def make_spending(rows):
+    return pd.DataFrame(
+        rows,
+        columns=["Time(ISO8601-UTC)", "Symbol", "Value", "Fees", "Transaction ID", "wallet"],
+    )
+
+
+def make_deposit(currency, amount, delay_ms, txid=None, status="ok"):
+    return {
+        "id": f"{currency}-{amount}-{delay_ms}",
+        "type": "deposit",
+        "currency": currency,
+        "amount": amount,
+        "timestamp": SENT_AT_MS + delay_ms,
+        "txid": txid,
+        "status": status,
+        "fee": None,
+    }
+
+
+def test_transfers_are_matched_by_hash_then_by_amount():
+    spending = make_spending(
+        [
+            (SENT_AT, "BTC", -0.5, 0.0001, "0xAB12", "coinomi"),
+            (SENT_AT, "ETH", -2.0, 0.01, "", "coinomi"),
+            (SENT_AT, "ETH", -3.0, 0.0, "", "coinomi"),
+        ]
+    )
+    movements = exchange_movements(
+        [
+            make_deposit("BTC", 0.4999, 10 * HOUR_MS, txid="ab12"),
+            make_deposit("ETH", 1.99, HOUR_MS),
+        ],
+        "kraken",
+    )
+
+    internal = internal_transfers(spending, movements)
+
+    assert list(internal["Spending Row"]) == [0, 1]
+    assert list(internal["Match"]) == [MATCH_BY_HASH, MATCH_BY_AMOUNT]
+    assert list(internal["Counterparty"]) == ["kraken", "kraken"]
+    assert list(exclude_internal(spending, internal)["Value"]) == [-3.0]
+
+
+def test_amount_matches_need_the_same_asset_window_and_no_other_hash():
+    spending = make_spending(
+        [
+            (SENT_AT, "BTC", -1.0, 0.0, "", "coinomi"),
+            (SENT_AT, "LTC", -1.0, 0.0, "", "coinomi"),
+            (SENT_AT, "SOL", -1.0, 0.0, "aaaa", "coinomi"),
+            (SENT_AT, "DOT", -1.0, 0.0, "", "coinomi"),
+        ]
+    )
+    movements = exchange_movements(
+        [
+            make_deposit("ETH", 1.0, HOUR_MS),
+            make_deposit("LTC", 1.0, 72 * HOUR_MS),
+            make_deposit("SOL", 1.0, HOUR_MS, txid="bbbb"),
+            make_deposit("DOT", 1.0, HOUR_MS, status="failed"),
+        ],
+        "binance",
+    )
+
+    assert internal_transfers(spending, movements).empty
+
+
+def test_each_deposit_matches_one_transfer_closest_in_time():
+    spending = make_spending(
+        [
+            (SENT_AT, "ETH", -1.0, 0.0, "", "coinomi"),
+            ("2024-05-01T12:00:00Z", "ETH", -1.0, 0.0, "", "coinomi"),
+        ]
+    )
+    movements = exchange_movements([make_deposit("ETH", 1.0, 3 * HOUR_MS)], "kraken")
+
+    internal = internal_transfers(spending, movements)
+
+    assert list(internal["Spending Row"]) == [1]
@@ -0,0 +1,80 @@
+import json
+from types import SimpleNamespace
+
+from kryptorozliczator import service
+from kryptorozliczator.service import JournalTable, SettlementService
+
+
+def journal_table(path) -> JournalTable:
+    return JournalTable(path, lambda records: [record["id"] for record in records], _concat)
+
+
+def _concat(parts: list[list[str]]) -> list[str]:
+    return [item for part in parts for item in part]
+
+
+def append(path, text: str):
+    with open(path, "a") as f:
+        f.write(text)
+
+
+def line(record_id: str) -> str:
+    return json.dumps({"id": record_id}) + "\n"
+
+
+def test_refresh_parses_only_appended_lines(tmp_path):
+    path = tmp_path / "trades.jsonl"
+    table = journal_table(path)
+
+    assert not table.refresh()
+    append(path, line("1") + line("2"))
+    assert table.refresh()
+    assert not table.refresh()
+    append(path, line("3"))
+    assert table.refresh()
+
+    assert table.table == ["1", "2", "3"]
+    assert table.version == 2
+
+
+def test_refresh_leaves_a_partial_line_for_later(tmp_path):
+    path = tmp_path / "trades.jsonl"
+    table = journal_table(path)
+
+    append(path, line("1") + '{"id": "2"')
+    assert table.refresh()
+    assert table.table == ["1"]
+    # The journal writer has not finished the line yet
+    assert not table.refresh()
+
+    append(path, "}\n")
+    assert table.refresh()
+    assert table.table == ["1", "2"]
+
+
+def test_refresh_reads_a_truncated_file_again(tmp_path):
+    path = tmp_path / "trades.jsonl"
+    table = journal_table(path)
+    append(path, line("1") + line("2"))
+    table.refresh()
+
+    path.write_text(line("3"))
+
+    assert table.refresh()
+    assert table.table == ["3"]
+
+
+def test_cached_tables_are_recomputed_when_versions_change(monkeypatch):
+    monkeypatch.setattr(service, "RateProvider", lambda offline: SimpleNamespace(cache=None))
+    settlement_service = SettlementService([], offline=True)
+    calls = []
+
+    def compute():
+        calls.append(len(calls))
+        return len(calls)
+
+    assert settlement_service._cached(("valued_trades", "zonda", 2024), (1,), compute) == 1
+    assert settlement_service._cached(("valued_trades", "zonda", 2024), (1,), compute) == 1
+    assert settlement_service._cached(("valued_trades", "zonda", 2024), (2,), compute) == 2
+    assert settlement_service._cached(("valued_trades", "kraken", 2024), (2,), compute) == 3
+    assert len(calls) == 3
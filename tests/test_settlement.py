@@ -0,0 +1,26 @@
+import pandas as pd
+
+from kryptorozliczator.settlement import spending_in_year
+from kryptorozliczator.tax.periods import year_bounds_ms
+
+
+def test_spending_is_split_into_tax_years_like_trades():
+    spending = pd.DataFrame(
+        {
+            "Time(ISO8601-UTC)": [
+                "2023-12-31T22:59:59Z",
+                "2023-12-31T23:00:00Z",
+                "2024-12-31T22:59:59.500Z",
+                "2024-12-31T23:00:00Z",
+            ],
+            "Value": [-1.0, -2.0, -3.0, -4.0],
+        }
+    )
+
+    in_2024 = spending_in_year(spending, 2024)
+
+    assert list(in_2024["Value"]) == [-2.0, -3.0]
+    # The same instants as trade timestamps fall into the same year
+    start, end = year_bounds_ms(2024)
+    assert start == pd.Timestamp("2023-12-31T23:00:00Z").value // 10**6
+    assert end == pd.Timestamp("2024-12-31T23:00:00Z").value // 10**6
@@ -0,0 +1,76 @@
+from kryptorozliczator.exchange_interfaces.exchange_interface import ExchangeInterface
+from kryptorozliczator.exchange_interfaces.trade_journal import (
+    MOVEMENTS_ACCOUNT,
+    TradeJournal,
+    movement_key,
+)
+
+
+def make_trade(trade_id, symbol, timestamp):
+    return {
+        "id": trade_id,
+        "symbol": symbol,
+        "timestamp": timestamp,
+        "side": "buy",
+        "amount": 1.0,
+        "price": 100.0,
+    }
+
+
+def make_movement(movement_id, kind, currency, timestamp):
+    return {
+        "id": movement_id,
+        "type": kind,
+        "currency": currency,
+        "timestamp": timestamp,
+        "amount": 1.0,
+        "status": "ok",
+    }
+
+
+def test_trades_of_different_markets_sharing_an_id_are_kept(tmp_path):
+    journal = TradeJournal("binance", base_dir=tmp_path)
+    trades = [make_trade(7, "BTC/USDT", 1000), make_trade(7, "ETH/USDT", 2000)]
+
+    assert journal.append(trades) == 2
+    assert journal.append(trades) == 0
+    assert [trade["symbol"] for trade in journal.trades()] == ["BTC/USDT", "ETH/USDT"]
+    assert len(ExchangeInterface._merge(trades + trades)) == 2
+
+
+def test_journal_is_reloaded_with_the_same_keys(tmp_path):
+    TradeJournal("binance", base_dir=tmp_path).append([make_trade(7, "BTC/USDT", 1000)])
+
+    journal = TradeJournal("binance", base_dir=tmp_path)
+    added = journal.append([make_trade(7, "BTC/USDT", 1000), make_trade(7, "ETH/USDT", 2000)])
+
+    assert added == 1
+
+
+def test_deposit_and_withdrawal_sharing_an_id_are_kept(tmp_path):
+    movements = [
+        make_movement(1, "deposit", "BTC", 1000),
+        make_movement(1, "withdrawal", "BTC", 2000),
+        make_movement(1, "deposit", "ETH", 3000),
+    ]
+    journal = TradeJournal("binance", MOVEMENTS_ACCOUNT, base_dir=tmp_path)
+
+    assert journal.append(movements) == 3
+    assert journal.append(movements) == 0
+    assert len(ExchangeInterface._merge(movements + movements, movement_key)) == 3
+
+
+def test_trades_without_an_id_are_keyed_by_contents(tmp_path):
+    journal = TradeJournal("zonda", base_dir=tmp_path)
+    trades = [make_trade(None, "BTC/PLN", 1000), make_trade(None, "BTC/PLN", 2000)]
+
+    assert journal.append(trades + trades) == 2
+
+
+def test_mark_synced_widens_the_range(tmp_path):
+    journal = TradeJournal("binance", base_dir=tmp_path)
+    journal.mark_synced(2000, 5000)
+    journal.mark_synced(1000, 4000)
+
+    reloaded = TradeJournal("binance", base_dir=tmp_path)
+    assert (reloaded.synced_from, reloaded.watermark) == (1000, 5000)
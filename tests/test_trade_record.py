@@ -0,0 +1,65 @@
+import numpy as np
+
+from kryptorozliczator.exchange_interfaces.trade_record import TradeBatch, TradeRecord
+
+
+def make_trade(trade_id, symbol, side, amount, price, **extra):
+    return {
+        "id": trade_id,
+        "symbol": symbol,
+        "timestamp": 1_704_067_200_000,
+        "side": side,
+        "amount": amount,
+        "price": price,
+        "cost": amount * price if price is not None else None,
+        "info": {"raw": True},
+        **extra,
+    }
+
+
+def test_meme_coin_amounts_are_kept():
+    trades = [
+        make_trade(1, "SHIB/USDT", "buy", 1e11, 2.5e-5, fee={"cost": 1e8, "currency": "SHIB"}),
+        make_trade(2, "PEPE/USDT", "sell", 3.5e13, 1e-6),
+    ]
+
+    batch = TradeBatch.from_ccxt(trades, "binance")
+    frame = batch.to_frame()
+
+    np.testing.assert_array_equal(frame["amount"], [1e11, 3.5e13])
+    np.testing.assert_array_equal(frame["fee_cost"], [1e8, 0.0])
+    assert frame["price"][1] == 1e-6
+    assert list(frame["base"]) == ["SHIB", "PEPE"]
+    assert list(frame["side"]) == ["buy", "sell"]
+
+
+def test_missing_values_become_zero():
+    batch = TradeBatch.from_ccxt([make_trade(1, "BTC/PLN", "buy", 0.5, None)], "zonda")
+
+    assert batch.to_frame()["price"][0] == 0.0
+    assert batch.records()[0].cost == 0.0
+
+
+def test_records_round_trip():
+    trades = [
+        make_trade(
+            "a", "BTC/PLN", "buy", 0.12345678, 250_000.0, fee={"cost": 5.0, "currency": "PLN"}
+        ),
+        make_trade("b", "ETH/EUR", "sell", 1.5, 3_000.0),
+    ]
+    records = [TradeRecord.from_ccxt(trade, "kraken") for trade in trades]
+
+    batch = TradeBatch.from_records(records)
+
+    assert batch.records() == records
+    assert batch.raw is None
+
+
+def test_concat_and_select():
+    first = TradeBatch.from_ccxt([make_trade(1, "BTC/PLN", "buy", 1.0, 10.0)], "zonda")
+    second = TradeBatch.from_ccxt([make_trade(2, "ETH/PLN", "sell", 2.0, 5.0)], "kraken")
+
+    batch = TradeBatch.concat([first, second, TradeBatch.concat([])])
+
+    assert len(batch) == 2
+    assert list(batch.select(batch["side"] < 0).to_frame()["exchange"]) == ["kraken"]
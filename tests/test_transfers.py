@@ -0,0 +1,55 @@
+import pytest
+
+from kryptorozliczator.wallet_interfaces import transfers
+from kryptorozliczator.wallet_interfaces.transfers import EtherscanError, TransfersInterface
+
+
+class FakeEtherscan(TransfersInterface):
+    """
+    Etherscan txlist stand-in with `per_block` transactions in every block of the range.
+    """
+
+    def __init__(self, per_block: int, last_block: int):
+        super().__init__(max_workers=1)
+        self.per_block = per_block
+        self.last_block = last_block
+        self.windows = []
+
+    def _ethereum_block_range(self, year):
+        return 0, self.last_block
+
+    def _get_json(self, url, rate_limiter, params=None):
+        if params["page"] == 1:
+            self.windows.append(params["startblock"])
+        txs = [
+            {"hash": f"{block}-{index}", "blockNumber": str(block)}
+            for block in range(params["startblock"], params["endblock"] + 1)
+            for index in range(self.per_block)
+        ]
+        size = params["offset"]
+        page = txs[(params["page"] - 1) * size : params["page"] * size]
+        if not page:
+            return {"status": "0", "message": "No transactions found", "result": []}
+        return {"status": "1", "message": "OK", "result": page}
+
+
+@pytest.fixture(autouse=True)
+def small_windows(monkeypatch):
+    monkeypatch.setattr(transfers, "ETHERSCAN_PAGE_SIZE", 2)
+    monkeypatch.setattr(transfers, "ETHERSCAN_MAX_RESULTS", 4)
+
+
+def test_full_windows_move_to_the_last_block():
+    etherscan = FakeEtherscan(per_block=3, last_block=3)
+
+    hashes = [tx["hash"] for tx in etherscan._iter_ethereum_transactions("0xab", 2024)]
+
+    assert hashes == [f"{block}-{index}" for block in range(4) for index in range(3)]
+    assert etherscan.windows == [0, 1, 2, 3]
+
+
+def test_block_larger_than_a_window_is_an_error():
+    etherscan = FakeEtherscan(per_block=5, last_block=3)
+
+    with pytest.raises(EtherscanError, match="in block 0"):
+        list(etherscan._iter_ethereum_transactions("0xab", 2024))